@@ -0,0 +1,345 @@
+import os
+import sys
+import json
+import time
+import heapq
+import threading
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+
+from mtconnect_parser import SampleStream, get_shdr_stream
+
+# --- CONFIG ---
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alert_rules.json")  # next to this file, whatever the working directory
+ALERT_LOG_PATH = "alerts.jsonl"
+TICK_INTERVAL = 0.1   # seconds between checks of debounce windows that no new observation closes
+RECENT_ALERTS = 200
+
+# state is "ACTIVE" when the rule starts matching (after its hold time) and "CLEARED" when it stops
+Alert = namedtuple("Alert", ["timestamp", "rule", "key", "value", "severity", "state", "message"])
+
+
+def observation_time(obs):
+    """Seconds since the epoch from the observation's agent/adapter timestamp; now if it has none."""
+    if obs.timestamp:
+        try:
+            return datetime.fromisoformat(obs.timestamp).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None  # UNAVAILABLE, text events
+
+
+# --- Rules ---
+# Each rule answers one question per observation of its key: does it match now?
+# The engine turns matches into ACTIVE/CLEARED alerts and applies hold times.
+class Rule(ABC):
+    def __init__(self, name, key, severity="WARNING", hold=0.0, message=None):
+        self.name = name
+        self.key = key
+        self.severity = severity
+        self.hold = hold          # seconds the rule must keep matching before the alert fires
+        self.message = message
+
+    @abstractmethod
+    def matches(self, obs, t):
+        """Does obs match at observation time t?"""
+
+    def describe(self, obs):
+        return self.message or f"{self.name}: {obs.key} = {obs.value}"
+
+    def severity_for(self, obs):
+        return self.severity
+
+
+class Threshold(Rule):
+    def __init__(self, name, key, above=None, below=None, **kwargs):
+        super().__init__(name, key, **kwargs)
+        self.above = above
+        self.below = below
+
+    def matches(self, obs, t):
+        value = _number(obs.value)
+        if value is None:
+            return False
+        return (self.above is not None and value > self.above) or (self.below is not None and value < self.below)
+
+
+class RateOfChange(Rule):
+    """Matches when the value moves faster than max_rate per second, measured over the last window seconds."""
+
+    def __init__(self, name, key, max_rate, window=1.0, **kwargs):
+        super().__init__(name, key, **kwargs)
+        self.max_rate = max_rate
+        self.window = window
+        self.history = {}  # key -> deque of (t, value)
+
+    def matches(self, obs, t):
+        value = _number(obs.value)
+        if value is None:
+            self.history.pop(obs.key, None)  # a gap in the data is not a rate
+            return False
+        points = self.history.setdefault(obs.key, deque())
+        points.append((t, value))
+        while len(points) > 1 and t - points[1][0] >= self.window:
+            points.popleft()
+        t0, v0 = points[0]
+        return t > t0 and abs(value - v0) / (t - t0) > self.max_rate
+
+
+class StateTransition(Rule):
+    """Matches while the value is `to`, optionally only when it got there from `from_state`."""
+
+    def __init__(self, name, key, to, from_state=None, **kwargs):
+        super().__init__(name, key, **kwargs)
+        self.to = to
+        self.from_state = from_state
+        self.current = {}     # key -> last value
+        self.came_from = {}   # key -> value before the last change
+
+    def matches(self, obs, t):
+        previous = self.current.get(obs.key)
+        if obs.value != previous:
+            self.came_from[obs.key] = previous
+            self.current[obs.key] = obs.value
+        return obs.value == self.to and (self.from_state is None or self.came_from.get(obs.key) == self.from_state)
+
+
+class ConditionLevel(Rule):
+    """Matches Condition observations at one of `levels`; key "*" watches every condition."""
+
+    def __init__(self, name, key="*", levels=("FAULT", "WARNING"), **kwargs):
+        super().__init__(name, key, **kwargs)
+        self.levels = tuple(levels)
+
+    def matches(self, obs, t):
+        return obs.category == "Condition" and obs.value.get("level") in self.levels
+
+    def severity_for(self, obs):
+        return obs.value.get("level") or self.severity
+
+    def describe(self, obs):
+        detail = obs.value.get("message") or obs.value.get("native_code") or obs.value.get("level")
+        return self.message or f"{self.name}: {obs.key} {detail}"
+
+
+RULE_TYPES = {
+    "threshold": Threshold,
+    "rate": RateOfChange,
+    "transition": StateTransition,
+    "condition": ConditionLevel,
+}
+
+
+def make_rule(spec):
+    """Rule from a JSON spec, e.g. {"type": "threshold", "name": "Overspeed", "key": "c1_speed", "above": 12000, "hold": 2}."""
+    spec = dict(spec)
+    rule_type = RULE_TYPES[spec.pop("type")]
+    if "from" in spec:
+        spec["from_state"] = spec.pop("from")
+    return rule_type(**spec)
+
+
+def load_rules(path=RULES_PATH):
+    with open(path, "r") as f:
+        return [make_rule(spec) for spec in json.load(f)]
+
+
+# --- Engine ---
+class RuleEngine:
+    """Evaluates rules incrementally, one observation at a time.
+
+    Rules are compiled into a dispatch table keyed by dataItemId (or SHDR key),
+    so an observation only runs the rules that watch its key, plus the
+    wildcard condition rules. Hold times are measured in observation time;
+    tick() fires windows that elapse with no new observation, reading that
+    clock as the latest observation's timestamp plus the host time since it
+    arrived, so a source whose clock runs behind or ahead of the host's does
+    not fire holds early or late.
+    """
+
+    def __init__(self, rules, sinks=None, recent=RECENT_ALERTS):
+        self.rules = list(rules)
+        self.dispatch = {}
+        self.any_condition = []
+        for rule in self.rules:
+            if rule.key == "*":
+                self.any_condition.append(rule)
+            else:
+                self.dispatch.setdefault(rule.key, []).append(rule)
+        self.sinks = list(sinks or [])
+        self.state = {}      # (rule, key) -> [active, pending since, observation that started the window]
+        self.timers = []     # heap of (deadline, counter, rule, key, pending since)
+        self.counter = 0
+        self.active = {}     # (rule name, key) -> ACTIVE alert
+        self.recent = deque(maxlen=recent)
+        self.observations = 0
+        self.clock = None    # (latest observation time, host time it was received)
+        self.lock = threading.Lock()
+        self.ticker = None
+        self.stop_event = threading.Event()
+
+    def observe(self, obs):
+        """Feed one Observation; usable directly as a ShdrStream or SampleStream listener."""
+        rules = self.dispatch.get(obs.key, ())
+        if obs.category == "Condition":
+            rules = list(rules) + self.any_condition
+        if not rules:
+            return
+        t = observation_time(obs)
+        with self.lock:
+            self.observations += 1
+            self.clock = (t, time.time())
+            for rule in rules:
+                self._update(rule, obs, t, rule.matches(obs, t))
+
+    def _update(self, rule, obs, t, hit):
+        state = self.state.setdefault((rule, obs.key), [False, None, None])
+        if not hit:
+            state[1] = None
+            if state[0]:
+                state[0] = False
+                self._emit(rule, obs, t, "CLEARED")
+            return
+        if state[0]:
+            return
+        if rule.hold <= 0:
+            state[0] = True
+            self._emit(rule, obs, t, "ACTIVE")
+        elif state[1] is None:
+            state[1], state[2] = t, obs
+            self.counter += 1
+            heapq.heappush(self.timers, (t + rule.hold, self.counter, rule, obs.key, t))
+        elif t - state[1] >= rule.hold:
+            state[0], state[1] = True, None
+            self._emit(rule, obs, t, "ACTIVE")
+
+    def observation_now(self):
+        """Current time on the observation clock, or None before the first observation."""
+        if self.clock is None:
+            return None
+        t, received = self.clock
+        return t + (time.time() - received)
+
+    def tick(self, now=None):
+        """Fire alerts whose hold time has elapsed without a new observation of their key.
+
+        now is in observation time; by default it is advanced from the latest observation.
+        """
+        with self.lock:
+            now = now or self.observation_now()
+            if now is None:
+                return
+            while self.timers and self.timers[0][0] <= now:
+                deadline, _, rule, key, since = heapq.heappop(self.timers)
+                state = self.state[(rule, key)]
+                if not state[0] and state[1] == since:  # still matching since the same start
+                    state[0], state[1] = True, None
+                    self._emit(rule, state[2], deadline, "ACTIVE")
+
+    def _emit(self, rule, obs, t, state):
+        value = obs.value.get("level") if isinstance(obs.value, dict) else obs.value
+        timestamp = datetime.fromtimestamp(t, timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        severity = rule.severity_for(obs)
+        if state == "CLEARED":
+            cleared = self.active.pop((rule.name, obs.key), None)
+            severity = cleared.severity if cleared else severity  # report the level that went away
+        alert = Alert(timestamp, rule.name, obs.key, value, severity, state, rule.describe(obs))
+        if state == "ACTIVE":
+            self.active[(rule.name, obs.key)] = alert
+        self.recent.append(alert)
+        for sink in self.sinks:
+            try:
+                sink(alert)
+            except Exception as e:
+                print(f"Alert sink error: {e}")
+
+    def snapshot(self):
+        """(active alerts, most recent alerts first)."""
+        with self.lock:
+            return list(self.active.values()), list(reversed(self.recent))
+
+    # -- lifecycle --
+    def start_ticker(self, interval=TICK_INTERVAL):
+        def run():
+            while not self.stop_event.wait(interval):
+                self.tick()
+        self.ticker = threading.Thread(target=run, daemon=True)
+        self.ticker.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class AlertLog:
+    """Log sink: one JSON line per alert, flushed immediately."""
+
+    def __init__(self, path=ALERT_LOG_PATH):
+        self.file = open(path, "a")
+        self.lock = threading.Lock()
+
+    def __call__(self, alert):
+        with self.lock:
+            self.file.write(json.dumps(alert._asdict()) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def print_alert(alert):
+    print(f"[ALERT] {alert.timestamp} {alert.state:<7} {alert.severity:<7} {alert.message}")
+
+
+def follow(url, engine):
+    """Feed the engine from the fastest source for url: the SHDR reader, or the agent's /sample buffer."""
+    engine.start_ticker()
+    if url.startswith("shdr://"):
+        stream = get_shdr_stream(url)
+        stream.add_listener(engine.observe)
+        return stream
+    return SampleStream(url, listeners=[engine.observe]).start()
+
+
+# --- MAIN ---
+if __name__ == "__main__":
+    # python alert_rules.py [agent url | shdr://host:port] [rules.json]
+    # python alert_rules.py demo   (the example rules against a replayed synthetic machine at 20x)
+    if len(sys.argv) > 1 and sys.argv[1] == "demo":
+        from replay_agent import ReplayAgent, synthetic_recording
+        speed = 20.0
+        rules = load_rules()
+        for rule in rules:
+            # Replay compresses time: scale rates and hold times with it
+            rule.hold /= speed
+            if isinstance(rule, RateOfChange):
+                rule.max_rate *= speed
+                rule.window /= speed
+        engine = RuleEngine(rules, sinks=[print_alert])
+        with ReplayAgent(synthetic_recording(), devices=1, speed=speed, port=0) as agent:
+            stream = follow(agent.url + "/current", engine)
+            time.sleep(6)  # two loops of the recording
+            stream.stop()
+        engine.stop()
+        active, _ = engine.snapshot()
+        print(f"{engine.observations} observations evaluated, {len(engine.recent)} alerts, {len(active)} active")
+        sys.exit(0)
+    url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:5000/current"
+    engine = RuleEngine(load_rules(sys.argv[2] if len(sys.argv) > 2 else RULES_PATH),
+                        sinks=[print_alert, AlertLog()])
+    print(f"Watching {url} with {len(engine.rules)} rules over {len(engine.dispatch)} data items")
+    stream = follow(url, engine)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stream.stop()
+        engine.stop()
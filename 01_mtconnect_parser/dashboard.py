@@ -4,6 +4,7 @@ from dash import Dash, dcc, html, callback_context
 from dash.dependencies import Input, Output, State
 import plotly.graph_objs as go
 import pandas as pd
+import os
 import time
 import threading
 import sys # For graceful shutdown
@@ -17,12 +18,20 @@ except ImportError:
     print("Error: Could not import mtconnect_parser.py. "
           "Make sure it's in the same directory and its functions are correctly defined.")
     sys.exit(1) # Exit if essential functions can't be imported
+from alert_rules import RuleEngine, AlertLog, load_rules, follow, print_alert, RULES_PATH
+from signal_buffers import SharedSignals
 
 
 # --- Configuration ---
-URL = "https://demo.mtconnect.org/current"
+URL = os.environ.get("MTCONNECT_URL", "https://demo.mtconnect.org/current")  # e.g. a replay_agent.py stand-in for load tests
 POLL_INTERVAL = 3  # seconds: How often the data polling thread fetches new data
 UPDATE_INTERVAL_DASH = 5000 # milliseconds: How often Dash callbacks refresh the UI
+ALERT_UPDATE_INTERVAL = 1000 # milliseconds: Alerts refresh faster than the plots
+ALERTS_SHOWN = 15 # recent alerts listed under the active ones
+SEVERITY_COLORS = {"FAULT": "#e74c3c", "WARNING": "#f39c12", "INFO": "#3498db"}
+CLOUD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "03_point_cloud_measure")
+CLOUD_TILES_DIR = os.environ.get("CLOUD_TILES_DIR")  # octree tiles from lod_tiles.py; the Point Cloud section is shown when set
+SIGNAL_BUFFER = os.environ.get("SIGNAL_BUFFER")  # shared memory written by signal_buffers.py; set it to serve from several workers
 
 
 # --- Global Data Structures and Control Flags ---
@@ -50,18 +59,34 @@ ALL_AVAILABLE_SIGNALS_MAPPED = {}
 # --- Initial Data Discovery (Run once at app startup) ---
 # This discovers all possible data items to present to the user for selection.
 # It does NOT start polling or populate the main DataFrame yet.
-print("Performing initial discovery of all available MTConnect data items...")
-raw_numerical, raw_status = discover_dataitems(URL) # Returns {label: name}
+# In multi-worker mode one ingestion process (signal_buffers.py) polls every signal into shared memory:
+# workers take the signal list from its schema and never poll the agent themselves.
+shared_signals = None
+if SIGNAL_BUFFER:
+    shared_signals = SharedSignals(SIGNAL_BUFFER)
+    raw_numerical, raw_status = shared_signals.signals()
+    print(f"Reading signals from shared memory '{SIGNAL_BUFFER}' (worker pid {os.getpid()}).")
+else:
+    print("Performing initial discovery of all available MTConnect data items...")
+    raw_numerical, raw_status = discover_dataitems(URL) # Returns {label: name}
+
+def set_available_signals(raw_numerical, raw_status):
+    """Populate the global dictionaries, replacing any earlier signal list."""
+    ALL_NUMERICAL_SIGNALS.clear()
+    ALL_NUMERICAL_SIGNALS.update(raw_numerical)
+    ALL_STATUS_SIGNALS.clear()
+    ALL_STATUS_SIGNALS.update(raw_status)
+
+    # Create the mapped dictionary used for selection and lookup
+    ALL_AVAILABLE_SIGNALS_MAPPED.clear()
+    for label, name in raw_numerical.items():
+        ALL_AVAILABLE_SIGNALS_MAPPED[label] = {"name": name}
+    for label, name in raw_status.items():
+        ALL_AVAILABLE_SIGNALS_MAPPED[label] = {"name": name}
 
-# Populate the global dictionaries
-ALL_NUMERICAL_SIGNALS.update(raw_numerical)
-ALL_STATUS_SIGNALS.update(raw_status)
 
-# Create the mapped dictionary used for selection and lookup
-for label, name in raw_numerical.items():
-    ALL_AVAILABLE_SIGNALS_MAPPED[label] = {"name": name}
-for label, name in raw_status.items():
-    ALL_AVAILABLE_SIGNALS_MAPPED[label] = {"name": name}
+set_available_signals(raw_numerical, raw_status)
+shared_instance = shared_signals.buffer.instance if shared_signals is not None else None
 
 if not ALL_AVAILABLE_SIGNALS_MAPPED:
     print("WARNING: No usable data items found during initial discovery. Dashboard selection will be empty.")
@@ -69,6 +94,20 @@ else:
     print(f"Discovered {len(ALL_AVAILABLE_SIGNALS_MAPPED)} total data items for selection.")
 
 
+# --- Alert Engine (Run once at app startup) ---
+# Rules are evaluated on every observation as it arrives (SHDR stream or the agent's /sample buffer),
+# independent of the polling thread and the UI refresh.
+alert_engine = None
+if shared_signals is not None:
+    alert_engine = shared_signals if shared_signals.alerts is not None else None  # the ingestion process runs the rules
+elif os.path.exists(RULES_PATH):
+    alert_engine = RuleEngine(load_rules(RULES_PATH), sinks=[print_alert, AlertLog()])
+    alert_stream = follow(URL, alert_engine)
+    print(f"Alerting on {len(alert_engine.rules)} rules from {RULES_PATH}.")
+else:
+    print(f"No {RULES_PATH} found; alerts are disabled.")
+
+
 # --- Polling Thread Function ---
 def poll_data_loop():
     """
@@ -112,8 +151,24 @@ def poll_data_loop():
     print("Polling thread stopped.")
 
 
+def current_data(labels):
+    """Copy of the collected history for Timestamp and labels: the shared buffers in multi-worker mode, else df."""
+    global shared_instance
+    if shared_signals is not None:
+        frame = shared_signals.history(labels)  # labels the buffer does not have are left out
+        if shared_signals.buffer.instance != shared_instance:
+            # The ingestion process restarted, possibly with other signals: take the list from its schema
+            shared_instance = shared_signals.buffer.instance
+            set_available_signals(*shared_signals.signals())
+            print(f"Shared memory '{SIGNAL_BUFFER}' was recreated; {len(ALL_AVAILABLE_SIGNALS_MAPPED)} data items.")
+        return frame
+    with df_lock: # Acquire lock before reading the global DataFrame
+        return df[[col for col in ["Timestamp"] + list(labels) if col in df.columns]].copy()
+
+
 # --- Dash App Initialization ---
 app = Dash(__name__)
+server = app.server # WSGI entry point for multi-worker serving, e.g. gunicorn -w 4 dashboard:server
 app.title = "Dynamic Machine Status Dashboard"
 
 # --- Dash App Layout ---
@@ -151,6 +206,11 @@ app.layout = html.Div([
         html.Div(id="emergency-stop", className="status-box", children="E-Stop: --"),
     ], style={"display": "flex", "justifyContent": "center", "gap": "25px", "marginBottom": "40px"}),
 
+    # Alerts from the rule engine, refreshed on their own faster interval
+    html.H2("Alerts", style={"textAlign": "center", "marginTop": "20px", "color": "#2c3e50"}),
+    html.Div(id="alerts-panel", style={"width": "60%", "maxWidth": "800px", "margin": "0 auto 40px auto"}),
+    dcc.Interval(id="alert-interval", interval=ALERT_UPDATE_INTERVAL, n_intervals=0),
+
     # Panel for plotting selected signals
     html.H2("Live Signal Plot", style={"textAlign": "center", "marginTop": "20px", "color": "#2c3e50"}),
     html.Div([
@@ -170,6 +230,18 @@ app.layout = html.Div([
     dcc.Interval(id="update-interval", interval=UPDATE_INTERVAL_DASH, n_intervals=0) # Controls UI refresh rate
 ], style={"fontFamily": "Arial, sans-serif", "padding": "30px", "backgroundColor": "#f0f2f5"}) # Changed body background
 
+# --- Point Cloud Viewer (optional) ---
+# Streams octree tiles of the fused cloud at the current zoom, with the capture trajectory.
+if CLOUD_TILES_DIR:
+    sys.path.append(CLOUD_DIR)
+    import cloud_viewer
+    from lod_tiles import TileSet
+    cloud_trajectory, cloud_images = cloud_viewer.load_trajectory(
+        os.path.join(CLOUD_DIR, cloud_viewer.LOG_PATH), os.path.join(CLOUD_DIR, cloud_viewer.POSES_PATH))
+    app.layout.children.append(cloud_viewer.cloud_layout())
+    cloud_viewer.register_callbacks(app, TileSet(CLOUD_TILES_DIR), cloud_trajectory, cloud_images)
+    print(f"Point cloud viewer enabled for tiles in {CLOUD_TILES_DIR}.")
+
 # Custom HTML template for the Dash app (correctly includes all lowercase placeholders)
 app.index_string = '''
 <!DOCTYPE html>
@@ -222,7 +294,7 @@ app.index_string = '''
     Output('plot-signal-dropdown', 'options'), # Update plot dropdown options
     Output('plot-signal-dropdown', 'value'),   # Set default value for plot dropdown
     Input('start-polling-button', 'n_clicks'),
-    State('signal-selection-dropdown', 'value'), # Get the list of selected labels from the user
+    Input('signal-selection-dropdown', 'value'), # Selected labels; changing them only refreshes the plot choices
     prevent_initial_call=False # This allows the callback to run on initial page load to set up dropdowns
 )
 def manage_polling_and_update_plot_dropdown(n_clicks, selected_labels_from_ui):
@@ -231,7 +303,7 @@ def manage_polling_and_update_plot_dropdown(n_clicks, selected_labels_from_ui):
     # Check which input triggered the callback
     triggered_id = callback_context.triggered_id if callback_context.triggered_id else 'initial_load'
 
-    if triggered_id == 'start-polling-button' and n_clicks > 0:
+    if triggered_id == 'start-polling-button' and n_clicks > 0 and shared_signals is None:
         print(f"User clicked 'Start/Restart Polling'. Selected labels: {selected_labels_from_ui}")
 
         # 1. Stop any existing polling thread gracefully
@@ -292,11 +364,12 @@ def manage_polling_and_update_plot_dropdown(n_clicks, selected_labels_from_ui):
     Input("plot-signal-dropdown", "value") # Input from the dropdown selecting what to plot
 )
 def update_graph(n_intervals, selected_label_to_plot):
-    with df_lock: # Acquire lock before reading the global DataFrame
-        local_df = df.copy() # Work on a copy to release the lock quickly
+    local_df = current_data([selected_label_to_plot] if selected_label_to_plot else []) # Work on a copy
 
     # Handle initial state or no selection
     if local_df.empty or not selected_label_to_plot or selected_label_to_plot not in local_df.columns:
+        if shared_signals is not None:  # the ingestion process collects every signal; the button only picks what to plot
+            return go.Figure(layout=go.Layout(title="Select signals, then one to plot (ingestion is already collecting them)"))
         return go.Figure(layout=go.Layout(title="Select signals and click 'Start Polling'"))
 
     # --- Data Cleaning and Preparation for Plotting ---
@@ -351,11 +424,6 @@ def update_graph(n_intervals, selected_label_to_plot):
     Input("update-interval", "n_intervals")
 )
 def update_status_panels(n_intervals):
-    with df_lock: # Acquire lock before reading the global DataFrame
-        if df.empty:
-            return "Execution: --", "Availability: --", "E-Stop: --"
-        latest = df.iloc[-1] # Get the very last row (most recent data)
-
     # Dynamically find the correct 'label' for each specific status signal
     # We iterate through ALL_AVAILABLE_SIGNALS_MAPPED to find the labels whose
     # internal 'name' attribute contains "execution", "availability", or "estop".
@@ -371,6 +439,11 @@ def update_status_panels(n_intervals):
          if 'estop' in cfg['name'].lower() or 'emergency_stop' in cfg['name'].lower()), None
     )
 
+    local_df = current_data([lbl for lbl in (execution_label, availability_label, emergency_stop_label) if lbl])
+    if local_df.empty:
+        return "Execution: --", "Availability: --", "E-Stop: --"
+    latest = local_df.iloc[-1] # Get the very last row (most recent data)
+
     # Retrieve values using the found labels. Use .get() with a default for safety.
     execution_val = latest.get(execution_label, '--') if execution_label else '--'
     availability_val = latest.get(availability_label, '--') if availability_label else '--'
@@ -382,6 +455,27 @@ def update_status_panels(n_intervals):
         f"E-Stop: {emergency_stop_val}"
     )
 
+# Callback for the alerts panel
+@app.callback(
+    Output("alerts-panel", "children"),
+    Input("alert-interval", "n_intervals")
+)
+def update_alerts_panel(n_intervals):
+    if alert_engine is None:
+        return html.Div(f"Alerts disabled: add rules to {RULES_PATH}", className="status-box")
+    active, recent = alert_engine.snapshot()
+
+    def alert_row(alert):
+        color = SEVERITY_COLORS.get(alert.severity, "#7f8c8d")
+        return html.Div(f"{alert.timestamp}  {alert.state}  {alert.message}",
+                        style={"borderLeft": f"6px solid {color}", "padding": "6px 12px", "marginBottom": "4px",
+                               "backgroundColor": "#ffffff", "opacity": 1.0 if alert.state == "ACTIVE" else 0.6})
+
+    children = [html.Div(f"{len(active)} active", className="status-box", style={"marginBottom": "12px"})]
+    children += [alert_row(alert) for alert in active]
+    children += [alert_row(alert) for alert in recent[:ALERTS_SHOWN]]
+    return children
+
 # --- Run the Dash Server ---
 if __name__ == "__main__":
     # app.run() is the current method. host='0.0.0.0' allows external access.
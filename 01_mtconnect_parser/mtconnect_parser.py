@@ -2,6 +2,9 @@ import requests
 import xml.etree.ElementTree as ET
 import pandas as pd
 import time
+import threading
+
+from shdr_client import Observation, ShdrStream
 
 # Define the MTConnect Streams namespace
 # Key point: The 'm' prefix maps to the default namespace URI.
@@ -9,8 +12,19 @@ import time
 # if we want to use findall with prefixes.
 MTCONNECT_STREAMS_NAMESPACE = {'m': 'urn:mtconnect.org:MTConnectStreams:2.5'}
 
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def condition_level(element):
+    """'FAULT', 'WARNING', 'NORMAL' or 'UNAVAILABLE' for a Condition element (the level is the element name)."""
+    return local_name(element.tag).upper()
+
+
 # Discover available dataitems
 def discover_dataitems(url):
+    if url.startswith("shdr://"):
+        return discover_shdr_dataitems(url)
     response = requests.get(url)
     if response.status_code != 200:
         print(f"Failed to fetch MTConnect stream for discovery. Status code: {response.status_code}")
@@ -66,12 +80,14 @@ def discover_dataitems(url):
                     data_item_id = data_item_element.attrib.get("dataItemId")
                     type_attribute = data_item_element.attrib.get("type")
 
-                    signal_name = name_attrib or data_item_id or type_attribute or ET.QName(data_item_element.tag).localname
+                    signal_name = name_attrib or data_item_id or type_attribute or local_name(data_item_element.tag)
 
                     label = f"{signal_name.replace('_', ' ').title()} ({component_name} - {device_name})"
                     value = data_item_element.text
+                    if data_set_type_tag == "m:Condition":
+                        value = condition_level(data_item_element)  # Normal/Warning/Fault elements, text is only a message
 
-                    # print(f"    DEBUG: Found DataItem - Tag: {ET.QName(data_item_element.tag).localname}, Name: {signal_name}, Value: '{value}'")
+                    # print(f"    DEBUG: Found DataItem - Tag: {local_name(data_item_element.tag)}, Name: {signal_name}, Value: '{value}'")
 
 
                     if not value or value.upper() == "UNAVAILABLE":
@@ -103,27 +119,88 @@ def discover_dataitems(url):
 # The rest of your code (select_dataitems_to_track, mtconnect_parser, run_stream_logger, __main__)
 # The mtconnect_parser also needs to reflect the corrected paths if they are different from what was previously assumed.
 
+# --- Direct SHDR ingestion ---
+# "shdr://host:port" URLs read the adapter's pipe-delimited TCP stream instead of the agent's XML.
+# One background reader per URL keeps the latest values, so a "pull" is a dictionary copy.
+_shdr_streams = {}
+
+def get_shdr_stream(url, connect_timeout=5.0):
+    if url not in _shdr_streams:
+        stream = ShdrStream.from_url(url).start()
+        stream.connected.wait(connect_timeout)
+        _shdr_streams[url] = stream
+    return _shdr_streams[url]
+
+
+def discover_shdr_dataitems(url, listen_seconds=2.0):
+    stream = get_shdr_stream(url)
+    time.sleep(listen_seconds)  # adapters send their full state on connect, then only changes
+    _, current, conditions = stream.snapshot()
+    source = f"{stream.host}:{stream.port}"
+
+    numeric_signals = {}
+    status_signals = {}
+    for key, value in current.items():
+        if not value or value.upper() == "UNAVAILABLE":
+            continue
+        label = f"{key.replace('_', ' ').title()} (SHDR - {source})"
+        try:
+            float(value)
+            numeric_signals[label] = key
+        except ValueError:
+            status_signals[label] = key
+
+    for key in conditions:
+        status_signals[f"{key.replace('_', ' ').title()} (SHDR - {source})"] = key
+
+    print(f"\nDiscovered {len(numeric_signals)} numeric and {len(status_signals)} status signals "
+          f"({len(conditions)} conditions) from the SHDR adapter at {source}.")
+    return numeric_signals, status_signals
+
+
+def shdr_parser(url, selected_items, verbose=True):
+    stream = get_shdr_stream(url)
+    if not stream.connected.is_set() and not stream.current:
+        if verbose:
+            print(f"Not connected to SHDR adapter at {stream.host}:{stream.port}")
+        return None
+    timestamp, current, conditions = stream.snapshot()
+    dataitem_status = {"Timestamp": timestamp or "Unknown"}
+    for label, config in selected_items.items():
+        value = current.get(config["name"]) or conditions.get(config["name"], {}).get("level")
+        dataitem_status[label] = value if value and value.upper() != "UNAVAILABLE" else "N/A"
+    return dataitem_status
+
+
 # Parse a single MTConnect snapshot
-def mtconnect_parser(url, selected_items):
+def mtconnect_parser(url, selected_items, verbose=True):
+    if url.startswith("shdr://"):
+        return shdr_parser(url, selected_items, verbose)
     response = requests.get(url)
     if response.status_code != 200:
-        print(f"Failed to get data from MTConnect stream. Status code: {response.status_code}")
+        if verbose:
+            print(f"Failed to get data from MTConnect stream. Status code: {response.status_code}")
         return None
 
     root = ET.fromstring(response.text)
-    dataitem_status = {"Timestamp": root.attrib.get("timestamp", "Unknown")}
+    # Agents put the response time on the Header, not the root
+    header = root.find("m:Header", MTCONNECT_STREAMS_NAMESPACE)
+    timestamp = root.attrib.get("timestamp") or (header.attrib.get("creationTime") if header is not None else None)
+    dataitem_status = {"Timestamp": timestamp or "Unknown"}
 
     # Apply namespace to findall calls here as well
     for device_stream in root.findall("m:Streams/m:DeviceStream", MTCONNECT_STREAMS_NAMESPACE):
         for component_stream in device_stream.findall("m:ComponentStream", MTCONNECT_STREAMS_NAMESPACE):
-            for section_tag in ["m:Samples", "m:Events"]:
+            for section_tag in ["m:Samples", "m:Events", "m:Condition"]:
                 for data_item_element in component_stream.findall(f"./{section_tag}/*", MTCONNECT_STREAMS_NAMESPACE):
                     name_attrib = data_item_element.attrib.get("name")
                     data_item_id = data_item_element.attrib.get("dataItemId")
                     type_attribute = data_item_element.attrib.get("type")
 
-                    current_signal_name = name_attrib or data_item_id or type_attribute or ET.QName(data_item_element.tag).localname
+                    current_signal_name = name_attrib or data_item_id or type_attribute or local_name(data_item_element.tag)
                     value = data_item_element.text
+                    if section_tag == "m:Condition":
+                        value = condition_level(data_item_element)
 
                     if not value or value.upper() == "UNAVAILABLE":
                         continue
@@ -138,6 +215,95 @@ def mtconnect_parser(url, selected_items):
 
     return dataitem_status
 
+# --- Streaming observations from /sample ---
+def parse_observations(root):
+    """Every observation in a /current or /sample document as Observations keyed by dataItemId, in sequence order.
+
+    Condition values are dicts in the same shape as the SHDR reader produces.
+    """
+    observations = []
+    for component_stream in root.findall("m:Streams/m:DeviceStream/m:ComponentStream", MTCONNECT_STREAMS_NAMESPACE):
+        for section_tag in ["m:Samples", "m:Events", "m:Condition"]:
+            category = section_tag[2:]
+            for element in component_stream.findall(f"./{section_tag}/*", MTCONNECT_STREAMS_NAMESPACE):
+                a = element.attrib
+                key = a.get("dataItemId") or a.get("name")
+                text = (element.text or "").strip()
+                if category == "Condition":
+                    value = {"level": condition_level(element), "native_code": a.get("nativeCode", ""),
+                             "native_severity": a.get("nativeSeverity", ""), "qualifier": a.get("qualifier", ""),
+                             "message": text}
+                else:
+                    value = text
+                observations.append((int(a.get("sequence", 0)), Observation(a.get("timestamp"), key, value, category)))
+    observations.sort(key=lambda pair: pair[0])
+    return [obs for _, obs in observations]
+
+
+class SampleStream:
+    """Follows an agent's /sample buffer by sequence number and hands every new observation to listeners.
+
+    Only changed data items come back from /sample, so listeners see each
+    change once, in order, instead of diffing /current snapshots.
+    """
+
+    def __init__(self, url, listeners=None, interval=0.5, count=1000):
+        self.base = url.rstrip("/")
+        for suffix in ("/current", "/sample"):
+            if self.base.endswith(suffix):
+                self.base = self.base[:-len(suffix)]
+        self.listeners = list(listeners or [])
+        self.interval = interval
+        self.count = count
+        self.next_sequence = None
+        self.observations = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def _fetch(self, path):
+        response = requests.get(self.base + path, timeout=10)
+        if response.status_code != 200:
+            return None
+        root = ET.fromstring(response.content)
+        header = root.find("m:Header", MTCONNECT_STREAMS_NAMESPACE)
+        self.next_sequence = int(header.attrib["nextSequence"])
+        return parse_observations(root)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                if self.next_sequence is None:
+                    observations = self._fetch("/current")  # initial state, or resync after falling out of the buffer
+                else:
+                    observations = self._fetch(f"/sample?from={self.next_sequence}&count={self.count}")
+                    if observations is None:
+                        print("SampleStream: fell behind the agent buffer, resyncing from /current")
+                        self.next_sequence = None
+                        continue
+                for obs in observations or []:
+                    for listener in self.listeners:
+                        listener(obs)
+                self.observations += len(observations or [])
+                if observations and len(observations) >= self.count:
+                    continue  # more waiting in the buffer
+            except (requests.RequestException, ET.ParseError, KeyError) as e:
+                print(f"SampleStream error: {e}")
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+
 # The other functions (select_dataitems_to_track, run_stream_logger, __main__) are assumed to be correct
 # from the previous version and don't need changes related to XML parsing.
 # Paste them here if you want a complete runnable block.
@@ -211,7 +377,7 @@ def run_stream_logger(url, selected_items, interval_seconds=3, max_iterations=10
 
 # MAIN
 if __name__ == "__main__":
-    stream_url = "https://demo.mtconnect.org/current"
+    stream_url = "https://demo.mtconnect.org/current"  # or "shdr://localhost:7878" to read an adapter directly
     print(f"Attempting to discover data items from: {stream_url}")
     numeric, status = discover_dataitems(stream_url)
 
@@ -0,0 +1,586 @@
+import io
+import os
+import re
+import sys
+import glob
+import time
+import threading
+import contextlib
+import urllib.request
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from mtconnect_parser import MTCONNECT_STREAMS_NAMESPACE, discover_dataitems, mtconnect_parser
+
+# --- CONFIG ---
+REPLAY_PORT = 5000          # the port a real cppagent listens on
+BUFFER_SIZE = 131072        # observations kept for /sample, like the agent's BufferSize
+SAMPLE_COUNT = 100          # default /sample count, as in the agent
+RECORD_INTERVAL = 1.0       # seconds between /sample requests while recording
+BENCH_DEVICES = (1, 10, 50, 200)
+BENCH_POLLS = 20
+
+CATEGORIES = ("Samples", "Events", "Condition")
+ITEM_COLUMNS = ["device", "uuid", "component", "component_name", "component_id",
+                "category", "name", "data_item_id", "type"]
+LABEL_PATTERN = re.compile(r"^(.*) \((.*) - (.*)\)$")  # "Spindle Speed (Controller - Mazak)", as built by discover_dataitems
+
+
+def iso_timestamp(t):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(t)) + f".{int(t % 1 * 1000):03d}Z"
+
+
+# --- Recordings ---
+class Recording:
+    """Data items plus one loop of timestamped observations, in time order."""
+
+    def __init__(self, items, events, duration=None):
+        # items: DataFrame with ITEM_COLUMNS; events: DataFrame [t (seconds from start), item, tag, value]
+        events = events.sort_values(["item", "t"], kind="stable")
+        # An agent only records a value when it changes
+        changed = (events["item"].ne(events["item"].shift()) | events["tag"].ne(events["tag"].shift())
+                   | events["value"].ne(events["value"].shift()))
+        events = events[changed].sort_values("t", kind="stable").reset_index(drop=True)
+
+        self.items = items.reset_index(drop=True)
+        self.t = events["t"].to_numpy(float)
+        self.item = events["item"].to_numpy(np.int64)
+        self.tag = events["tag"].to_numpy(object)
+        self.value = events["value"].to_numpy(object)
+        self.by_item = np.argsort(self.item, kind="stable")  # per item, still in time order
+        self.starts = np.searchsorted(self.item[self.by_item], np.arange(len(self.items) + 1))
+        gaps = np.diff(np.unique(self.t))
+        self.duration = duration or float(self.t.max() + (np.median(gaps) if len(gaps) else 1.0))
+
+    def __len__(self):
+        return len(self.t)
+
+    def state_at(self, positions):
+        """[items, devices] index of each item's latest event at each loop position (the previous loop's last if none yet)."""
+        state = np.full((len(self.items), len(positions)), -1, dtype=np.int64)
+        for i in range(len(self.items)):
+            events = self.by_item[self.starts[i]:self.starts[i + 1]]
+            if len(events):
+                k = np.searchsorted(self.t[events], positions, side="right") - 1
+                state[i] = events[k]  # k = -1 wraps to the last event
+        return state
+
+
+def _item_frame(rows):
+    return pd.DataFrame(rows, columns=ITEM_COLUMNS).drop_duplicates().reset_index(drop=True)
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def observations_from_xml(text):
+    """Every observation in an MTConnectStreams document (/current or /sample) as a list of dicts."""
+    root = ET.fromstring(text)
+    rows = []
+    for device in root.iter():
+        if _local_name(device.tag) != "DeviceStream":
+            continue
+        for component in device:
+            for section in component:
+                category = _local_name(section.tag)
+                if category not in CATEGORIES:
+                    continue
+                for element in section:
+                    a = element.attrib
+                    rows.append({
+                        "device": device.attrib.get("name", "UnknownDevice"),
+                        "uuid": device.attrib.get("uuid", ""),
+                        "component": component.attrib.get("component", ""),
+                        "component_name": component.attrib.get("name", ""),
+                        "component_id": component.attrib.get("componentId", ""),
+                        "category": category,
+                        "name": a.get("name") or a.get("dataItemId"),
+                        "data_item_id": a.get("dataItemId") or a.get("name"),
+                        "type": a.get("type", ""),
+                        "tag": _local_name(element.tag),
+                        "value": (element.text or "").strip(),
+                        "timestamp": a.get("timestamp"),
+                    })
+    return rows
+
+
+def _to_recording(rows):
+    frame = pd.DataFrame(rows)
+    frame["time"] = pd.to_datetime(frame["timestamp"], utc=True, errors="coerce", format="ISO8601")
+    frame = frame.dropna(subset=["time"])
+    if frame.empty:
+        raise ValueError("No timestamped observations in the recording")
+    items = _item_frame(frame[ITEM_COLUMNS].values.tolist())
+    frame = frame.merge(items.reset_index().rename(columns={"index": "item"}), on=ITEM_COLUMNS)
+    frame["t"] = (frame["time"] - frame["time"].min()).dt.total_seconds()
+    return Recording(items, frame[["t", "item", "tag", "value"]])
+
+
+def load_xml_recording(path):
+    """A directory of recorded /current and /sample responses (see record()), or a single XML file."""
+    files = sorted(glob.glob(os.path.join(path, "*.xml"))) if os.path.isdir(path) else [path]
+    rows = []
+    for filename in files:
+        with open(filename, "rb") as f:
+            rows += observations_from_xml(f.read())
+    return _to_recording(rows)
+
+
+def load_table_recording(path):
+    """A history table: the wide Timestamp + label CSV written by run_stream_logger, or its Parquet equivalent."""
+    table = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path, dtype=str)
+    rows = []
+    for label in table.columns:
+        if label == "Timestamp":
+            continue
+        match = LABEL_PATTERN.match(label)
+        signal, component, device = match.groups() if match else (label, "Controller", "Device")
+        values = [str(v) if pd.notna(v) else "" for v in table[label]]
+        numeric = pd.to_numeric(pd.Series(values), errors="coerce").notna().mean() > 0.5
+        # The label was built as name.replace('_', ' ').title(); this name rebuilds the same label on discovery
+        name = signal.replace(" ", "_")
+        tag = re.sub(r"[^A-Za-z0-9]", "", signal.title())
+        tag = tag if tag[:1].isalpha() else "Value"
+        item = (device, device, component, component, component, "Samples" if numeric else "Events", name, name, "")
+        for timestamp, value in zip(table["Timestamp"], values):
+            if value not in ("N/A", "UNAVAILABLE", ""):
+                rows.append(dict(zip(ITEM_COLUMNS, item), tag=tag, value=value, timestamp=timestamp))
+    return _to_recording(rows)
+
+
+def synthetic_recording(duration=60.0, rate=10.0):
+    """A machine with a spindle, one axis, execution/availability/e-stop events and a condition, for load tests without recordings."""
+    t = np.arange(0, duration, 1.0 / rate)
+    phase = 2 * np.pi * t / duration
+    device = ("Mill", "mill-0001")
+    controller = device + ("Controller", "controller", "cont")
+    spindle = device + ("Rotary", "C", "c1")
+    axis = device + ("Linear", "X", "x1")
+    items = [
+        spindle + ("Samples", "Sspeed", "c1_speed", "ROTARY_VELOCITY"),
+        axis + ("Samples", "Xact", "x1_pos", "POSITION"),
+        controller + ("Events", "execution", "exec", "EXECUTION"),
+        controller + ("Events", "avail", "avail", "AVAILABILITY"),
+        controller + ("Events", "estop", "estop", "EMERGENCY_STOP"),
+        controller + ("Condition", "system", "system_cond", "SYSTEM"),
+    ]
+    active = np.sin(phase) > -0.5
+    fault = (t > 0.3 * duration) & (t < 0.35 * duration)
+    columns = [
+        ("RotarySpeed", np.where(active, np.round(8000 + 500 * np.sin(7 * phase), 1), 0.0).astype(str)),
+        ("Position", np.round(150 * np.sin(3 * phase), 3).astype(str)),
+        ("Execution", np.where(fault, "INTERRUPTED", np.where(active, "ACTIVE", "READY"))),
+        ("Availability", np.full(len(t), "AVAILABLE")),
+        ("EmergencyStop", np.full(len(t), "ARMED")),
+    ]
+    frames = [pd.DataFrame({"t": t, "item": i, "tag": tag, "value": values}) for i, (tag, values) in enumerate(columns)]
+    frames.append(pd.DataFrame({"t": t, "item": len(columns), "tag": np.where(fault, "Fault", "Normal"),
+                                "value": np.where(fault, "Spindle overload", "")}))
+    return Recording(_item_frame(items), pd.concat(frames, ignore_index=True), duration)
+
+
+def load_recording(source):
+    if source == "synthetic":
+        return synthetic_recording()
+    if source.endswith((".csv", ".parquet")):
+        return load_table_recording(source)
+    return load_xml_recording(source)
+
+
+# --- Replay Agent ---
+class ReplayAgent:
+    """A stand-in MTConnect agent that loops a Recording for many simulated devices at a speed multiplier.
+
+    Serves /current and /sample like an agent: every observation gets a
+    sequence number, /sample reads a bounded buffer. Devices are copies of the
+    recorded device(s), each started at a different point of the loop so
+    they do not change in lockstep. The replay clock advances on each request,
+    so an idle agent costs nothing.
+    """
+
+    def __init__(self, recording, devices=1, speed=1.0, host="127.0.0.1", port=REPLAY_PORT,
+                 buffer_size=BUFFER_SIZE):
+        self.recording = recording
+        self.devices = devices
+        self.speed = speed
+        self.buffer_size = buffer_size
+        self.phases = np.arange(devices) * recording.duration / devices
+        self.instance_id = int(time.time())
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "bytes": 0, "render_seconds": 0.0, "observations": 0}
+
+        # Observation buffer, indexed by (sequence - 1) % buffer_size
+        self.ring_device = np.zeros(buffer_size, dtype=np.int32)
+        self.ring_event = np.zeros(buffer_size, dtype=np.int64)
+        self.ring_time = np.zeros(buffer_size)
+        self.next_sequence = 1
+        self.first_sequence = 1  # oldest sequence still in the buffer, besides the buffer_size limit
+
+        # Like an agent at startup: every item's current value is an observation
+        self.start_time = time.time()
+        self.elapsed = 0.0  # replay seconds
+        state = recording.state_at(self.phases)
+        items, devs = np.nonzero(state >= 0)
+        self._append(devs, state[items, devs], np.full(len(items), self.start_time))
+        self.latest_event = state
+        self.latest_sequence = np.zeros(state.shape, dtype=np.int64)
+        self.latest_time = np.full(state.shape, self.start_time)
+        self.latest_sequence[items, devs] = np.arange(1, len(items) + 1)
+
+        self._prepare_render()
+        self.server = ThreadingHTTPServer((host, port), make_handler(self))
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    # -- clock --
+    def _append(self, devs, events, times):
+        count = len(devs)
+        sequences = self.next_sequence + np.arange(count)
+        keep = slice(max(0, count - self.buffer_size), count)
+        slots = (sequences[keep] - 1) % self.buffer_size
+        self.ring_device[slots] = devs[keep]
+        self.ring_event[slots] = events[keep]
+        self.ring_time[slots] = times[keep]
+        self.next_sequence += count
+        return sequences
+
+    def _advance_chunk(self, a, b):
+        """Emit the events of every device between replay times a and b (b - a <= one loop)."""
+        rec = self.recording
+        duration, n = rec.duration, len(rec)
+        lo_pos = (a + self.phases) % duration
+        hi_pos = lo_pos + (b - a)
+        lo = np.searchsorted(rec.t, lo_pos, side="right")
+        hi = np.searchsorted(rec.t, np.where(hi_pos > duration, hi_pos - duration, hi_pos), side="right")
+        devs, events, offsets = [], [], []
+        for d in range(self.devices):
+            if hi_pos[d] > duration:  # wrapped into the next loop
+                idx = np.concatenate([np.arange(lo[d], n), np.arange(0, hi[d])])
+                offset = rec.t[idx] - lo_pos[d]
+                offset[offset < 0] += duration
+            else:
+                idx = np.arange(lo[d], hi[d])
+                offset = rec.t[idx] - lo_pos[d]
+            devs.append(np.full(len(idx), d, dtype=np.int32))
+            events.append(idx)
+            offsets.append(offset)
+        devs, events, offsets = np.concatenate(devs), np.concatenate(events), np.concatenate(offsets)
+        order = np.argsort(offsets, kind="stable")
+        devs, events, offsets = devs[order], events[order], offsets[order]
+        times = self.start_time + (a + offsets) / self.speed
+        sequences = self._append(devs, events, times)
+
+        # Latest value per (item, device): the last occurrence in sequence order
+        items = rec.item[events]
+        key = items * self.devices + devs
+        _, last = np.unique(key[::-1], return_index=True)
+        last = len(key) - 1 - last
+        self.latest_event[items[last], devs[last]] = events[last]
+        self.latest_sequence[items[last], devs[last]] = sequences[last]
+        self.latest_time[items[last], devs[last]] = times[last]
+        self.stats["observations"] += len(events)
+
+    def advance(self, now=None):
+        now = now or time.time()
+        b = (now - self.start_time) * self.speed
+        duration = self.recording.duration
+        with self.lock:
+            if b - self.elapsed > 2 * duration:
+                # Long idle gap: whole loops change no state, only sequence numbers
+                skipped = int((b - self.elapsed) // duration) - 1
+                self.next_sequence += skipped * len(self.recording) * self.devices
+                self.first_sequence = self.next_sequence  # the skipped observations were never written
+                self.elapsed += skipped * duration
+            while self.elapsed < b:
+                step = min(b, self.elapsed + duration)
+                self._advance_chunk(self.elapsed, step)
+                self.elapsed = step
+
+    # -- documents --
+    def _prepare_render(self):
+        items = self.recording.items
+        order = items.sort_values(["device", "component_id", "category"], kind="stable").index.to_numpy()
+        self.item_rank = np.empty(len(items), dtype=np.int64)
+        self.item_rank[order] = np.arange(len(items))
+        self.item_rows = list(items.itertuples())
+        self.item_attrs = []  # per device copy: per item, the attribute string
+        for d in range(self.devices):
+            suffix = f"_{d:03d}" if self.devices > 1 else ""
+            self.item_attrs.append([
+                f'dataItemId={quoteattr(row.data_item_id + suffix)} name={quoteattr(row.name)}'
+                + (f' type={quoteattr(row.type)}' if row.category == "Condition" and row.type else "")
+                for row in items.itertuples()])
+
+    def _device_names(self, d, row):
+        if self.devices == 1:
+            return row.device, row.uuid
+        return f"{row.device}-{d:03d}", f"{row.uuid}-{d:03d}"
+
+    def render(self, devs, events, sequences, times):
+        """MTConnectStreams document for these observations, grouped by device, component and category."""
+        rec = self.recording
+        items = rec.item[events]
+        order = np.lexsort((sequences, self.item_rank[items], devs))
+        with self.lock:
+            first = max(self.first_sequence, self.next_sequence - self.buffer_size)
+            header = (self.next_sequence, first, self.next_sequence - 1)
+        parts = [
+            '<?xml version="1.0" encoding="UTF-8"?>\n',
+            f'<MTConnectStreams xmlns="{MTCONNECT_STREAMS_NAMESPACE["m"]}">',
+            f'<Header creationTime="{iso_timestamp(time.time())}" sender="replay_agent" instanceId="{self.instance_id}" '
+            f'version="2.5" bufferSize="{self.buffer_size}" nextSequence="{header[0]}" '
+            f'firstSequence="{header[1]}" lastSequence="{header[2]}"/>',
+            "<Streams>",
+        ]
+        open_device = open_component = open_category = None
+        for k in order:
+            d, item = int(devs[k]), int(items[k])
+            row = self.item_rows[item]
+            if (d, row.device) != open_device:
+                if open_category:
+                    parts.append(f"</{open_category}></ComponentStream>")
+                if open_device:
+                    parts.append("</DeviceStream>")
+                name, uuid = self._device_names(d, row)
+                parts.append(f"<DeviceStream name={quoteattr(name)} uuid={quoteattr(uuid)}>")
+                open_device, open_component, open_category = (d, row.device), None, None
+            if row.component_id != open_component:
+                if open_category:
+                    parts.append(f"</{open_category}></ComponentStream>")
+                parts.append(f"<ComponentStream component={quoteattr(row.component)} name={quoteattr(row.component_name)} "
+                             f"componentId={quoteattr(row.component_id)}>")
+                open_component, open_category = row.component_id, None
+            if row.category != open_category:
+                if open_category:
+                    parts.append(f"</{open_category}>")
+                parts.append(f"<{row.category}>")
+                open_category = row.category
+            tag = rec.tag[events[k]]
+            parts.append(f'<{tag} {self.item_attrs[d][item]} timestamp="{iso_timestamp(times[k])}" '
+                         f'sequence="{sequences[k]}">{escape(str(rec.value[events[k]]))}</{tag}>')
+        if open_category:
+            parts.append(f"</{open_category}></ComponentStream>")
+        if open_device:
+            parts.append("</DeviceStream>")
+        parts.append("</Streams></MTConnectStreams>")
+        return "".join(parts).encode("utf-8")
+
+    def current(self):
+        self.advance()
+        with self.lock:
+            events = self.latest_event.copy()
+            sequences = self.latest_sequence.copy()
+            times = self.latest_time.copy()
+        items, devs = np.nonzero(events >= 0)
+        return self.render(devs, events[items, devs], sequences[items, devs], times[items, devs])
+
+    def sample(self, start=None, count=SAMPLE_COUNT):
+        """Observations from sequence start (default: the oldest buffered). None if start has left the buffer."""
+        self.advance()
+        with self.lock:
+            first = max(self.first_sequence, self.next_sequence - self.buffer_size)
+            start = first if start is None else start
+            if start < first or start > self.next_sequence:
+                return None
+            sequences = np.arange(start, min(start + count, self.next_sequence))
+            slots = (sequences - 1) % self.buffer_size
+            devs, events, times = self.ring_device[slots], self.ring_event[slots], self.ring_time[slots]
+        return self.render(devs, events, sequences, times)
+
+    # -- lifecycle --
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+
+def make_handler(agent):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            started = time.perf_counter()
+            if url.path.rstrip("/").endswith("/current") or url.path in ("", "/"):
+                body = agent.current()
+            elif url.path.rstrip("/").endswith("/sample"):
+                start = int(query["from"][0]) if "from" in query else None
+                body = agent.sample(start, int(query.get("count", [SAMPLE_COUNT])[0]))
+                if body is None:
+                    self._send(400, b'<MTConnectError><Errors><Error errorCode="OUT_OF_RANGE">'
+                                    b"'from' is outside the buffer</Error></Errors></MTConnectError>")
+                    return
+            else:
+                self._send(404, b'<MTConnectError><Errors><Error errorCode="UNSUPPORTED">'
+                                b"Only /current and /sample are replayed</Error></Errors></MTConnectError>")
+                return
+            with agent.lock:
+                agent.stats["requests"] += 1
+                agent.stats["bytes"] += len(body)
+                agent.stats["render_seconds"] += time.perf_counter() - started
+            self._send(200, body)
+
+    return Handler
+
+
+# --- Recording a live agent ---
+def record(agent_url, out_dir, seconds=60.0, interval=RECORD_INTERVAL):
+    """Save one /current response, then chained /sample responses, so replay sees every change, not just polled ones."""
+    base = re.sub(r"/(current|sample)/?$", "", agent_url.rstrip("/"))
+    os.makedirs(out_dir, exist_ok=True)
+    ns = MTCONNECT_STREAMS_NAMESPACE
+
+    def fetch(path, index):
+        with urllib.request.urlopen(base + path, timeout=10) as response:
+            body = response.read()
+        with open(os.path.join(out_dir, f"{index:06d}.xml"), "wb") as f:
+            f.write(body)
+        header = ET.fromstring(body).find("m:Header", ns)
+        return int(header.attrib["nextSequence"]) if header is not None else None
+
+    next_sequence = fetch("/current", 0)
+    index, deadline = 1, time.time() + seconds
+    while time.time() < deadline and next_sequence is not None:
+        time.sleep(interval)
+        next_sequence = fetch(f"/sample?from={next_sequence}&count=10000", index)
+        index += 1
+    print(f"Recorded {index} responses from {base} to {out_dir}")
+
+
+# --- Load test ---
+def _percentiles(values):
+    values = np.asarray(values) * 1000
+    return f"{np.percentile(values, 50):8.1f} {np.percentile(values, 95):8.1f}" if len(values) else "     -        -"
+
+
+def _callback_timings(rows, numeric, status, url):
+    """Time the dashboard's plot and status callbacks against a history of parsed rows. None without Dash."""
+    # Importing the dashboard runs its discovery and alert stream against MTCONNECT_URL: point them at the replay
+    os.environ["MTCONNECT_URL"] = url
+    os.environ.pop("SIGNAL_BUFFER", None)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            import dashboard
+    except (ImportError, SystemExit):
+        return None
+    if getattr(dashboard, "alert_stream", None) is not None:
+        dashboard.alert_stream.stop()  # the agent it follows is shut down after this device count
+        dashboard.alert_stream = None
+    labels = {**numeric, **status}
+    with dashboard.df_lock:
+        dashboard.df = pd.DataFrame(rows).iloc[-1000:]
+    dashboard.ALL_AVAILABLE_SIGNALS_MAPPED = {label: {"name": name} for label, name in labels.items()}
+    plot_label = next(iter(numeric), None)
+    graph, panels = [], []
+    for _ in range(5):
+        started = time.perf_counter()
+        dashboard.update_graph(0, plot_label)
+        graph.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        dashboard.update_status_panels(0)
+        panels.append(time.perf_counter() - started)
+    return graph, panels
+
+
+def bench(source="synthetic", speed=10.0, device_counts=BENCH_DEVICES, clients=1, polls=BENCH_POLLS):
+    """Replay the recording for each device count and time /current parsing and the dashboard callbacks."""
+    recording = load_recording(source)
+    print(f"Recording: {len(recording.items)} items, {len(recording)} observations per {recording.duration:.1f}s loop; "
+          f"speed {speed}x, {clients} concurrent client(s)")
+    print(f"{'devices':>7} {'obs/s':>9} {'KB/poll':>8} {'render p50/p95 ms':>18} {'parse p50/p95 ms':>18} "
+          f"{'polls/s':>8} {'graph p50/p95 ms':>18} {'status p50/p95 ms':>18}")
+    dash_missing = False
+    for devices in device_counts:
+        with ReplayAgent(recording, devices, speed, port=0) as agent:
+            url = agent.url + "/current"
+            with contextlib.redirect_stdout(io.StringIO()):
+                numeric, status = discover_dataitems(url)
+            selected = {label: {"name": name} for label, name in {**numeric, **status}.items()}
+            renders, parses, rows = [], [], []
+
+            def poll(_):
+                times = []
+                for _ in range(polls):
+                    requests_before, render_before = agent.stats["requests"], agent.stats["render_seconds"]
+                    started = time.perf_counter()
+                    row = mtconnect_parser(url, selected, verbose=False)
+                    times.append(time.perf_counter() - started)
+                    if clients == 1 and agent.stats["requests"] == requests_before + 1:
+                        renders.append(agent.stats["render_seconds"] - render_before)
+                    if row:
+                        rows.append(row)
+                return times
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(clients) as pool:
+                for times in pool.map(poll, range(clients)):
+                    parses += times
+            wall = time.perf_counter() - started
+            replay_seconds = (time.time() - agent.start_time) * speed
+            obs_rate = agent.stats["observations"] / max(replay_seconds / speed, 1e-9)
+            kb = agent.stats["bytes"] / max(agent.stats["requests"], 1) / 1024
+            callbacks = _callback_timings(rows, numeric, status, url)
+            graph, panels = callbacks if callbacks else ([], [])
+            dash_missing = callbacks is None
+            print(f"{devices:>7} {obs_rate:>9.0f} {kb:>8.1f} {_percentiles(renders):>18} {_percentiles(parses):>18} "
+                  f"{len(parses) / wall:>8.1f} {_percentiles(graph):>18} {_percentiles(panels):>18}")
+    if dash_missing:
+        print("(dashboard callbacks not timed: Dash is not installed)")
+
+
+# --- MAIN ---
+if __name__ == "__main__":
+    # python replay_agent.py serve <recording dir|history.csv|history.parquet|synthetic> [devices] [speed] [port]
+    # python replay_agent.py record <agent url> <out dir> [seconds]
+    # python replay_agent.py bench <recording> [speed] [devices,devices,...] [clients]
+    command = sys.argv[1] if len(sys.argv) > 1 else "serve"
+    args = sys.argv[2:]
+    if command == "record":
+        record(args[0], args[1], float(args[2]) if len(args) > 2 else 60.0)
+    elif command == "bench":
+        bench(args[0] if args else "synthetic",
+              float(args[1]) if len(args) > 1 else 10.0,
+              tuple(int(n) for n in args[2].split(",")) if len(args) > 2 else BENCH_DEVICES,
+              int(args[3]) if len(args) > 3 else 1)
+    else:
+        recording = load_recording(args[0] if args else "synthetic")
+        devices = int(args[1]) if len(args) > 1 else 1
+        speed = float(args[2]) if len(args) > 2 else 1.0
+        port = int(args[3]) if len(args) > 3 else REPLAY_PORT
+        agent = ReplayAgent(recording, devices, speed, host="0.0.0.0", port=port)
+        print(f"Replaying {len(recording.items)} items x {devices} device(s) at {speed}x on http://localhost:{agent.port}/current "
+              f"({recording.duration:.1f}s loop)")
+        try:
+            agent.server.serve_forever()
+        except KeyboardInterrupt:
+            agent.server.server_close()
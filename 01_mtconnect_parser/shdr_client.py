@@ -0,0 +1,306 @@
+import socket
+import sys
+import threading
+import time
+from collections import namedtuple
+
+# --- CONFIG ---
+SHDR_PORT = 7878               # default adapter port
+RECONNECT_INTERVAL = 1.0       # first retry delay, doubled up to MAX_RECONNECT_INTERVAL
+MAX_RECONNECT_INTERVAL = 10.0
+LEGACY_TIMEOUT = 60.0          # adapters that never answer PING: drop the link after this much silence
+
+# One data item value. category is "Samples", "Events" or "Condition" when known;
+# SHDR does not say whether a key is a sample or an event, so plain values have None.
+Observation = namedtuple("Observation", ["timestamp", "key", "value", "category"])
+
+
+def parse_shdr_line(line, condition_keys=()):
+    """Parse one SHDR line into a list of Observations.
+
+    Handles key|value pairs (any number per line), conditions
+    (key|level|native_code|native_severity|qualifier|message) and messages
+    (key|native_code|text). Command lines ("* ...") return [].
+
+    SHDR does not mark conditions, and a line of three key|value pairs has
+    the same shape, so only keys in condition_keys are parsed as conditions.
+    """
+    if not line or line[0] == "*":
+        return []
+    fields = line.split("|")
+    timestamp = fields[0] or None  # an empty timestamp means "now" to the agent
+    n = len(fields) - 1
+    if n >= 6 and fields[1] in condition_keys:
+        level, native_code, severity, qualifier, message = fields[2:7]
+        value = {"level": level, "native_code": native_code, "native_severity": severity,
+                 "qualifier": qualifier, "message": message}
+        return [Observation(timestamp, fields[1], value, "Condition")]
+    if n == 3:
+        # MESSAGE data items carry a native code before the text
+        return [Observation(timestamp, fields[1], fields[3], "Events")]
+    return [Observation(timestamp, key, value, None) for key, value in zip(fields[1::2], fields[2::2])]
+
+
+def parse_shdr_url(url):
+    """'shdr://host:port' -> (host, port)."""
+    address = url[len("shdr://"):] if url.startswith("shdr://") else url
+    host, _, port = address.partition("?")[0].rstrip("/").partition(":")
+    return host or "localhost", int(port) if port else SHDR_PORT
+
+
+def parse_condition_keys(url):
+    """Condition data items named in the URL: 'shdr://host:port?conditions=system,servo_cond' -> ['system', 'servo_cond']."""
+    query = url.partition("?")[2]
+    for param in query.split("&"):
+        name, _, value = param.partition("=")
+        if name == "conditions":
+            return [key for key in value.split(",") if key]
+    return []
+
+
+class ShdrStream:
+    """Reads an adapter's SHDR stream directly, without an MTConnect agent in between.
+
+    Keeps the latest value of every key, answers the adapter's heartbeat
+    protocol the way an agent does ("* PING" -> "* PONG <ms>") and reconnects
+    with backoff when the adapter goes away or stops answering.
+    """
+
+    def __init__(self, host="localhost", port=SHDR_PORT, condition_keys=(), listeners=None,
+                 reconnect_interval=RECONNECT_INTERVAL):
+        self.host = host
+        self.port = port
+        self.reconnect_interval = reconnect_interval
+        self.condition_keys = set(condition_keys)
+        self.listeners = list(listeners or [])
+        self.current = {}        # key -> latest value
+        self.timestamps = {}     # key -> adapter timestamp of that value
+        self.conditions = {}     # key -> latest condition fields
+        self.last_timestamp = None
+        self.lines_received = 0
+        self.reconnects = 0
+        self.heartbeat_ms = None  # set once the adapter answers a PING
+        self.connected = threading.Event()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.sock = None
+        self.thread = None
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        host, port = parse_shdr_url(url)
+        kwargs.setdefault("condition_keys", parse_condition_keys(url))
+        return cls(host, port, **kwargs)
+
+    # -- lifecycle --
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def add_listener(self, callback):
+        """callback(observation) is called on the reader thread for every parsed observation."""
+        self.listeners.append(callback)
+
+    # -- reading --
+    def _handle_line(self, line):
+        if line.startswith("* PONG"):
+            parts = line.split()
+            self.heartbeat_ms = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else self.heartbeat_ms
+            return
+        observations = parse_shdr_line(line, self.condition_keys)
+        if not observations:
+            return
+        with self.lock:
+            self.lines_received += 1
+            for obs in observations:
+                if obs.category == "Condition":
+                    self.conditions[obs.key] = obs.value
+                else:
+                    self.current[obs.key] = obs.value
+                self.timestamps[obs.key] = obs.timestamp
+            self.last_timestamp = observations[0].timestamp or self.last_timestamp
+        for listener in self.listeners:
+            for obs in observations:
+                listener(obs)
+
+    def _session(self):
+        """One connection: returns when the adapter disconnects or misses its heartbeat."""
+        self.sock = socket.create_connection((self.host, self.port), timeout=5)
+        self.sock.settimeout(0.25)
+        self.sock.sendall(b"* PING\n")
+        self.heartbeat_ms = None
+        self.connected.set()
+        buffer = b""
+        last_data = next_ping = time.time()
+        while not self.stop_event.is_set():
+            now = time.time()
+            interval = self.heartbeat_ms / 1000.0 if self.heartbeat_ms else None
+            if interval and now >= next_ping:
+                self.sock.sendall(b"* PING\n")
+                next_ping = now + interval
+            # Agents treat two missed heartbeat periods of silence as a dead link
+            if now - last_data > (2 * interval if interval else LEGACY_TIMEOUT):
+                print(f"[SHDR] No data from {self.host}:{self.port} in {now - last_data:.1f}s, reconnecting")
+                return
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            if not data:
+                return
+            last_data = time.time()
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                self._handle_line(line.decode("utf-8", "replace").strip())
+
+    def _run(self):
+        delay = self.reconnect_interval
+        while not self.stop_event.is_set():
+            try:
+                self._session()
+                delay = self.reconnect_interval
+            except OSError as e:
+                if self.stop_event.is_set():
+                    break
+                print(f"[SHDR] {self.host}:{self.port}: {e}")
+            finally:
+                self.connected.clear()
+                if self.sock is not None:
+                    self.sock.close()
+            if self.stop_event.wait(delay):
+                break
+            delay = min(2 * delay, MAX_RECONNECT_INTERVAL)
+            self.reconnects += 1
+
+    # -- queries --
+    def snapshot(self):
+        """(last adapter timestamp, {key: value}, {key: condition})."""
+        with self.lock:
+            return self.last_timestamp, dict(self.current), dict(self.conditions)
+
+    def wait_for(self, key, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self.lock:
+                if key in self.current:
+                    return self.current[key]
+            time.sleep(0.01)
+        return None
+
+
+# --- Fake Adapter (local testing) ---
+class FakeAdapter:
+    """Serves scripted SHDR lines on a local port and answers PING like a real adapter."""
+
+    def __init__(self, port=0, heartbeat_ms=1000):
+        self.server = socket.create_server(("127.0.0.1", port))
+        self.server.settimeout(0.25)
+        self.port = self.server.getsockname()[1]
+        self.heartbeat_ms = heartbeat_ms
+        self.clients = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                client, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            with self.lock:
+                self.clients.append(client)
+            threading.Thread(target=self._ping_loop, args=(client,), daemon=True).start()
+
+    def _ping_loop(self, client):
+        client.settimeout(0.25)
+        while not self.stop_event.is_set():
+            try:
+                data = client.recv(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not data:
+                break
+            if b"* PING" in data and self.heartbeat_ms:
+                try:
+                    client.sendall(f"* PONG {self.heartbeat_ms}\n".encode("ascii"))
+                except OSError:
+                    break
+
+    def send(self, *lines):
+        payload = "".join(line + "\n" for line in lines).encode("utf-8")
+        with self.lock:
+            for client in list(self.clients):
+                try:
+                    client.sendall(payload)
+                except OSError:
+                    self.clients.remove(client)
+
+    def drop_clients(self):
+        """Close every connection, as a restarting adapter would."""
+        with self.lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+
+    def close(self):
+        self.stop_event.set()
+        self.drop_clients()
+        self.server.close()
+
+
+# --- MAIN ---
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "demo":
+        adapter = FakeAdapter(heartbeat_ms=500)
+        received = []
+        with ShdrStream("127.0.0.1", adapter.port, condition_keys=["system"], listeners=[received.append],
+                        reconnect_interval=0.2) as stream:
+            stream.connected.wait(2)
+            adapter.send("2025-01-02T13:38:13.000Z|j1|10.5|j2|-4.25|execution|ACTIVE",
+                         "2025-01-02T13:38:13.100Z|path_position|100.0 20.0 300.0",
+                         "2025-01-02T13:38:13.200Z|system|FAULT|E42|1||Servo overload")
+            stream.wait_for("path_position")
+            print(f"Heartbeat: {stream.heartbeat_ms} ms")
+            adapter.drop_clients()
+            deadline = time.time() + 3
+            while stream.reconnects == 0 and time.time() < deadline:
+                time.sleep(0.05)
+            stream.connected.wait(3)
+            time.sleep(0.1)  # let the adapter register the new connection
+            adapter.send("|j1|11.0")
+            time.sleep(0.2)
+            timestamp, current, conditions = stream.snapshot()
+            print(f"Reconnects: {stream.reconnects}, lines: {stream.lines_received}, observations: {len(received)}")
+            print(f"Current: {current}")
+            print(f"Conditions: {conditions}")
+        adapter.close()
+    else:
+        with ShdrStream.from_url(sys.argv[1] if len(sys.argv) > 1 else f"localhost:{SHDR_PORT}", listeners=[print]) as stream:
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
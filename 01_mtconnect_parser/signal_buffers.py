@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory, resource_tracker
+
+from mtconnect_parser import discover_dataitems, mtconnect_parser
+from alert_rules import Alert, RuleEngine, AlertLog, load_rules, follow, print_alert, RULES_PATH
+
+# --- CONFIG ---
+BUFFER_NAME = "mtconnect_signals"
+CAPACITY = 1000          # rows kept per buffer, like the dashboard's 1000-row history
+STRING_WIDTH = 32        # bytes per status value; longer values are truncated
+ALERT_CAPACITY = 200
+POLL_INTERVAL = 3        # seconds between ingestion polls
+
+MAGIC = 0x4D544353       # "MTCS"
+VERSION = 2
+RETIRED = 0              # instance id written into a segment's header once its writer has replaced or closed it
+HEADER_DTYPE = np.dtype([
+    ("magic", "<u4"), ("version", "<u4"), ("instance", "<u8"), ("capacity", "<u8"),
+    ("row_size", "<u8"), ("schema_len", "<u8"), ("write_count", "<u8"), ("heartbeat", "<f8"),
+    ("writing", "<u8"),
+])
+HEADER_SIZE = 64
+ALERT_COLUMNS = [{"label": field, "kind": "status"} for field in
+                 ("timestamp", "rule", "key", "value", "severity", "state")] + [
+                {"label": "message", "kind": "status", "width": 128}]
+
+
+def row_dtype(columns, string_width=STRING_WIDTH):
+    """Timestamp string plus one float64 per numeric column and one fixed-width byte string per status column."""
+    fields = [("Timestamp", f"S{string_width}")]
+    for column in columns:
+        fields.append((column["label"], "<f8" if column["kind"] == "numeric" else f"S{column.get('width', string_width)}"))
+    return np.dtype(fields)
+
+
+class SignalBuffer:
+    """Fixed-schema ring buffer of signal rows in a named shared-memory segment.
+
+    Layout: a 64-byte header (magic, instance id, capacity, row size, schema
+    length, write count, heartbeat, writing flag), the schema as JSON, then `capacity` rows
+    of a numpy structured dtype built from the schema. One process writes;
+    any number of processes map the same memory and read rows directly,
+    with no serialization between them.
+
+    The writer raises the writing flag, fills the next slot, then advances
+    write_count and lowers the flag. A reader that checks both again after
+    copying knows which slots the writer may have reused meanwhile and drops
+    only those. A writer that replaces or closes the segment sets its
+    instance id to RETIRED, so readers notice with one header read.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        if self.header["magic"] != MAGIC or self.header["version"] != VERSION:
+            raise ValueError(f"Shared memory {shm.name} is not a signal buffer")
+        schema_len = int(self.header["schema_len"])
+        self.schema = json.loads(bytes(shm.buf[HEADER_SIZE:HEADER_SIZE + schema_len]).decode("utf-8"))
+        self.columns = self.schema["columns"]
+        self.dtype = row_dtype(self.columns, self.schema["string_width"])
+        self.capacity = int(self.header["capacity"])
+        offset = HEADER_SIZE + -(-schema_len // 64) * 64
+        self.rows = np.ndarray((self.capacity,), dtype=self.dtype, buffer=shm.buf, offset=offset)
+        self.instance = int(self.header["instance"])
+
+    @classmethod
+    def create(cls, name, columns, capacity=CAPACITY, string_width=STRING_WIDTH):
+        """New buffer for columns [{"label", "name", "kind": "numeric" | "status"}]; replaces a stale one of the same name."""
+        schema = json.dumps({"columns": columns, "string_width": string_width}).encode("utf-8")
+        dtype = row_dtype(columns, string_width)
+        size = HEADER_SIZE + -(-len(schema) // 64) * 64 + capacity * dtype.itemsize
+        try:
+            old = shared_memory.SharedMemory(name=name)
+            _retire(old)  # left behind by a writer that crashed; readers still mapping it move to the new one
+            old.close()
+            old.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        header[...] = (MAGIC, VERSION, time.time_ns(), capacity, dtype.itemsize, len(schema), 0, time.time(), 0)
+        shm.buf[HEADER_SIZE:HEADER_SIZE + len(schema)] = schema
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        # Readers must not unlink the segment when they exit; before Python 3.13 attached segments are tracked too
+        if sys.version_info >= (3, 13):
+            return cls(shared_memory.SharedMemory(name=name, track=False), owner=False)
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    # -- writing --
+    def append(self, values, timestamp=""):
+        """Write one row: {label: value}. Missing or non-numeric values in numeric columns become NaN."""
+        count = int(self.header["write_count"])
+        row = np.zeros((), dtype=self.dtype)
+        row["Timestamp"] = str(timestamp).encode("utf-8")[:self.dtype["Timestamp"].itemsize]
+        for column in self.columns:
+            value = values.get(column["label"])
+            if column["kind"] == "numeric":
+                try:
+                    row[column["label"]] = float(value)
+                except (TypeError, ValueError):
+                    row[column["label"]] = np.nan
+            else:
+                width = self.dtype[column["label"]].itemsize
+                row[column["label"]] = ("" if value is None else str(value)).encode("utf-8")[:width]
+        self.header["writing"] = 1
+        self.rows[count % self.capacity] = row
+        self.header["write_count"] = count + 1  # publish only after the row is complete
+        self.header["writing"] = 0
+        self.header["heartbeat"] = time.time()
+
+    def touch(self):
+        self.header["heartbeat"] = time.time()
+
+    # -- reading --
+    @property
+    def write_count(self):
+        return int(self.header["write_count"])
+
+    @property
+    def retired(self):
+        """True once the writer has replaced or closed this segment."""
+        return int(self.header["instance"]) != self.instance
+
+    @property
+    def age(self):
+        """Seconds since the writer last wrote or checked in."""
+        return time.time() - float(self.header["heartbeat"])
+
+    def read(self, n=None, columns=None):
+        """Structured array copy of the last n complete rows, oldest first (only the requested columns)."""
+        end = self.write_count
+        n = min(end, self.capacity, n or self.capacity)
+        indices = np.arange(end - n, end)
+        fields = ["Timestamp"] + list(columns) if columns is not None else None
+        source = self.rows[fields] if fields else self.rows
+        data = source[indices % self.capacity].copy()
+        # Rows the writer may have overwritten while we copied: up to the one it is writing now, if any
+        after, writing = self.write_count, int(self.header["writing"])
+        if after == end and not writing:
+            return data
+        last_written = after if writing else after - 1
+        return data[indices > last_written - self.capacity]
+
+    def frame(self, n=None, columns=None):
+        """DataFrame of the last n rows with status columns decoded, shaped like the dashboard's df."""
+        data = self.read(n, columns)
+        frame = pd.DataFrame({name: np.char.decode(data[name], "utf-8", "replace") if data.dtype[name].kind == "S"
+                              else data[name] for name in data.dtype.names})
+        return frame
+
+    def close(self):
+        if self.owner:
+            self.header["instance"] = RETIRED
+        self.rows = None
+        self.header = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _retire(shm):
+    """Mark a segment's header RETIRED if it holds a signal buffer."""
+    if shm.size < HEADER_SIZE:
+        return
+    header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+    if header["magic"] == MAGIC:
+        header["instance"] = RETIRED
+    del header
+
+
+class SharedSignals:
+    """Reader side used by dashboard workers: reattaches when the ingestion process restarts."""
+
+    def __init__(self, name=BUFFER_NAME):
+        self.name = name
+        self.buffer = SignalBuffer.attach(name)
+        try:
+            self.alerts = SignalBuffer.attach(name + "_alerts")
+        except FileNotFoundError:
+            self.alerts = None
+
+    def _refresh(self):
+        if not self.buffer.retired:
+            return
+        try:
+            fresh = SignalBuffer.attach(self.name)
+        except (FileNotFoundError, ValueError):
+            return  # not recreated yet; keep showing the last rows
+        if fresh.instance != self.buffer.instance:
+            self.buffer.close()
+            self.buffer = fresh
+            try:
+                self.alerts = SignalBuffer.attach(self.name + "_alerts")
+            except FileNotFoundError:
+                self.alerts = None
+        else:
+            fresh.close()
+
+    def signals(self):
+        """(numeric {label: name}, status {label: name}) from the buffer schema, like discover_dataitems."""
+        numeric = {c["label"]: c["name"] for c in self.buffer.columns if c["kind"] == "numeric"}
+        status = {c["label"]: c["name"] for c in self.buffer.columns if c["kind"] == "status"}
+        return numeric, status
+
+    def history(self, columns=None, n=None):
+        """Frame of the last n rows; requested columns the current buffer does not have are left out."""
+        self._refresh()
+        if columns is not None:
+            columns = [column for column in columns if column in self.buffer.dtype.names and column != "Timestamp"]
+        return self.buffer.frame(n, columns)
+
+    def recent_alerts(self, n=ALERT_CAPACITY):
+        """Alerts newest first, as dicts with the alert_rules.Alert fields."""
+        if self.alerts is None:
+            return []
+        return self.alerts.frame(n).drop(columns="Timestamp").iloc[::-1].to_dict("records")
+
+    def snapshot(self):
+        """(active alerts, most recent alerts first) as Alert tuples, like RuleEngine.snapshot."""
+        recent = [Alert(**record) for record in self.recent_alerts()]
+        latest = {}
+        for alert in reversed(recent):  # oldest first, so the last state per (rule, key) wins
+            latest[(alert.rule, alert.key)] = alert
+        return [alert for alert in latest.values() if alert.state == "ACTIVE"], recent
+
+
+# --- Ingestion Process ---
+def run_ingestion(url, name=BUFFER_NAME, capacity=CAPACITY, interval=POLL_INTERVAL):
+    """Poll every discovered signal once per interval into shared memory; run alert rules into a second buffer."""
+
+    numeric, status = discover_dataitems(url)
+    columns = ([{"label": label, "name": n, "kind": "numeric"} for label, n in numeric.items()]
+               + [{"label": label, "name": n, "kind": "status"} for label, n in status.items()])
+    items = {c["label"]: {"name": c["name"]} for c in columns}
+    signals = SignalBuffer.create(name, columns, capacity)
+    alerts = SignalBuffer.create(name + "_alerts", ALERT_COLUMNS, ALERT_CAPACITY)
+    print(f"Ingesting {len(columns)} signals from {url} into shared memory '{name}' "
+          f"({signals.shm.size / 1024 ** 2:.1f} MB, {capacity} rows)")
+
+    stream = None
+    if os.path.exists(RULES_PATH):
+        engine = RuleEngine(load_rules(RULES_PATH),
+                            sinks=[print_alert, AlertLog(), lambda alert: alerts.append(alert._asdict())])
+        stream = follow(url, engine)
+    else:
+        print(f"No {RULES_PATH} found; alerts are disabled.")
+    try:
+        while True:
+            started = time.time()
+            try:
+                row = mtconnect_parser(url, items)
+                if row:
+                    signals.append(row, row.get("Timestamp", ""))
+                else:
+                    signals.touch()
+            except Exception as e:
+                print(f"Ingestion error: {e}")
+            alerts.touch()
+            time.sleep(max(0.0, interval - (time.time() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stream is not None:
+            stream.stop()
+        signals.close()
+        alerts.close()
+
+
+# --- MAIN ---
+if __name__ == "__main__":
+    # python signal_buffers.py [agent url | shdr://host:port] [buffer name]
+    run_ingestion(sys.argv[1] if len(sys.argv) > 1 else os.environ.get("MTCONNECT_URL", "https://demo.mtconnect.org/current"),
+                  sys.argv[2] if len(sys.argv) > 2 else BUFFER_NAME)
@@ -0,0 +1,44 @@
+from shdr_client import Observation, parse_condition_keys, parse_shdr_line, parse_shdr_url
+
+
+def test_value_pairs():
+    assert parse_shdr_line("2025-01-02T13:38:13.000Z|j1|10.5|execution|ACTIVE") == [
+        Observation("2025-01-02T13:38:13.000Z", "j1", "10.5", None),
+        Observation("2025-01-02T13:38:13.000Z", "execution", "ACTIVE", None),
+    ]
+
+
+def test_empty_timestamp_and_commands():
+    assert parse_shdr_line("|j1|11.0") == [Observation(None, "j1", "11.0", None)]
+    assert parse_shdr_line("* PONG 1000") == []
+    assert parse_shdr_line("") == []
+
+
+def test_three_pairs_starting_with_a_level_are_not_a_condition():
+    # An adapter's initial dump: execution is UNAVAILABLE until the controller reports
+    observations = parse_shdr_line("t|execution|UNAVAILABLE|j1|1|j2|2")
+    assert [(obs.key, obs.value, obs.category) for obs in observations] == [
+        ("execution", "UNAVAILABLE", None), ("j1", "1", None), ("j2", "2", None),
+    ]
+    observations = parse_shdr_line("t|mode|NORMAL|j1|1|j2|2", condition_keys={"system"})
+    assert all(obs.category is None for obs in observations)
+
+
+def test_condition_from_known_key():
+    [obs] = parse_shdr_line("t|system|FAULT|E42|1||Servo overload", condition_keys={"system"})
+    assert obs.category == "Condition"
+    assert obs.key == "system"
+    assert obs.value == {"level": "FAULT", "native_code": "E42", "native_severity": "1",
+                         "qualifier": "", "message": "Servo overload"}
+
+
+def test_message():
+    assert parse_shdr_line("t|msg|CODE1|Door open") == [Observation("t", "msg", "Door open", "Events")]
+
+
+def test_url_parsing():
+    assert parse_shdr_url("shdr://robot:7879") == ("robot", 7879)
+    assert parse_shdr_url("shdr://robot:7879?conditions=system") == ("robot", 7879)
+    assert parse_shdr_url("shdr://") == ("localhost", 7878)
+    assert parse_condition_keys("shdr://robot:7879?conditions=system,servo_cond") == ["system", "servo_cond"]
+    assert parse_condition_keys("shdr://robot:7879") == []
@@ -2,6 +2,7 @@ import threading
 import time
 import json
 import os
+import sys
 import requests
 import xml.etree.ElementTree as ET
 import pyrealsense2 as rs
@@ -10,8 +11,14 @@ import cv2
 
 from igus_bridge import IgusBridge
 
+# The SHDR reader lives with the MTConnect parser
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "01_mtconnect_parser"))
+from shdr_client import ShdrStream
+
 # --- CONFIG ---
 MTCONNECT_URL = "http://localhost:5001/current"
+SHDR_URL = None  # e.g. "shdr://localhost:7878" to read the robot's adapter directly instead of the agent XML
+SHDR_KEYS = {"position": "path_position", "orientation": "orientation"}  # adapter keys; joints are j1..j6
 SAVE_DIR = "robot_capture_sequence"
 JSON_LOG = os.path.join(SAVE_DIR, "capture_log.json")
 os.makedirs(SAVE_DIR, exist_ok=True)
@@ -25,7 +32,39 @@ for _ in range(10):  # warm up
     pipeline.wait_for_frames()
 
 # --- MTConnect Poller ---
+_shdr_stream = None
+
+def _floats(text, count):
+    return list(map(float, text.strip().split())) if text else [None] * count
+
+def get_shdr_state():
+    global _shdr_stream
+    if _shdr_stream is None:
+        _shdr_stream = ShdrStream.from_url(SHDR_URL).start()
+        _shdr_stream.wait_for(SHDR_KEYS["position"], timeout=5)
+    _, current, _ = _shdr_stream.snapshot()
+    if not current:
+        print("[SHDR] No data from adapter yet")
+        return None
+    try:
+        joint_angles = {}
+        for i in range(1, 7):
+            value = current.get(f"j{i}")
+            joint_angles[f"j{i}"] = float(value) if value not in (None, "UNAVAILABLE") else None
+        position = current.get(SHDR_KEYS["position"])
+        orientation = current.get(SHDR_KEYS["orientation"])
+        return {
+            "joint_angles": joint_angles,
+            "position": _floats(position if position != "UNAVAILABLE" else None, 3),
+            "orientation": _floats(orientation if orientation != "UNAVAILABLE" else None, 3)
+        }
+    except ValueError as e:
+        print(f"[SHDR] Error: {e}")
+        return None
+
 def get_mtconnect_state():
+    if SHDR_URL:
+        return get_shdr_state()
     try:
         response = requests.get(MTCONNECT_URL, timeout=2)
         response.raise_for_status()
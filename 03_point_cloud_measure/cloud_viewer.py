@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import numpy as np
+import plotly.graph_objs as go
+from dash import Dash, dcc, html, callback_context, no_update
+from dash.dependencies import Input, Output, State
+
+from lod_tiles import TileSet, TILES_DIR
+from register_views import camera_pose, LOG_PATH, POSES_PATH
+
+# --- CONFIG ---
+POINT_BUDGET = 300_000                     # points sent to the browser per view
+BUDGET_OPTIONS = [100_000, 300_000, 1_000_000]
+MIN_VIEW_SIZE = 5.0                        # mm; zooming stops refining below this box size
+DEFAULT_EYE_DISTANCE = 1.25 * np.sqrt(3)   # plotly's default scene camera eye is (1.25, 1.25, 1.25)
+VIEWER_PORT = 8051
+
+
+def load_trajectory(log_path=LOG_PATH, poses_path=POSES_PATH):
+    """(camera centres in capture order, image names): registered poses if available, else the robot-reported ones."""
+    if os.path.exists(poses_path):
+        with open(poses_path, "r") as f:
+            views = json.load(f)["views"]
+        return np.array([np.array(v["pose"])[:3, 3] for v in views]).reshape(-1, 3), [v["image"] for v in views]
+    if not os.path.exists(log_path):
+        return np.empty((0, 3)), []
+    with open(log_path, "r") as f:
+        log = json.load(f)
+    entries = [e for e in log if e.get("position") and e.get("orientation")
+               and None not in e["position"] and None not in e["orientation"]]
+    centres = [camera_pose(e["position"], e["orientation"])[:3, 3] for e in entries]
+    return np.array(centres).reshape(-1, 3), [e["image"] for e in entries]
+
+
+def full_view(tiles, trajectory):
+    lo, hi = tiles.bounds
+    if len(trajectory):
+        lo, hi = np.minimum(lo, trajectory.min(axis=0)), np.maximum(hi, trajectory.max(axis=0))
+    return {"box": [lo.tolist(), hi.tolist()], "eye": [1.25, 1.25, 1.25]}
+
+
+def zoomed_view(view, camera, limits):
+    """The view box after a user zoom/pan, from plotly's scene camera.
+
+    The scene cube spans [-1, 1] along its longest axis, so the camera centre
+    maps back to data units and the eye distance gives the zoom factor. The
+    viewing direction is kept; only the distance resets with the new box.
+    """
+    lo, hi = np.asarray(view["box"][0]), np.asarray(view["box"][1])
+    half = (hi - lo).max() / 2
+    eye = np.array([camera["eye"][axis] for axis in "xyz"])
+    focus = np.array([camera.get("center", {}).get(axis, 0.0) for axis in "xyz"])
+    zoom = np.linalg.norm(eye - focus) / DEFAULT_EYE_DISTANCE
+    center = (lo + hi) / 2 + focus * half
+    new_half = max(half * zoom, MIN_VIEW_SIZE / 2)
+    new_lo = np.maximum(center - new_half, limits["box"][0])
+    new_hi = np.minimum(center + new_half, limits["box"][1])
+    direction = (eye - focus) / max(np.linalg.norm(eye - focus), 1e-9) * DEFAULT_EYE_DISTANCE
+    return {"box": [new_lo.tolist(), new_hi.tolist()], "eye": direction.tolist()}
+
+
+def cloud_figure(tiles, view, budget, trajectory, images):
+    lo, hi = np.asarray(view["box"][0]), np.asarray(view["box"][1])
+    points, n_tiles = tiles.points_in_box(lo, hi, budget)
+    fig = go.Figure()
+    fig.add_trace(go.Scatter3d(
+        x=points[:, 0], y=points[:, 1], z=points[:, 2], mode="markers", name="Cloud", hoverinfo="skip",
+        marker=dict(size=1.5, color=points[:, 2], colorscale="Viridis"),
+    ))
+    if len(trajectory):
+        order = np.linspace(1.0, 0.2, len(trajectory))  # earliest = lighter, as in plot_camera_capture.py
+        fig.add_trace(go.Scatter3d(
+            x=trajectory[:, 0], y=trajectory[:, 1], z=trajectory[:, 2], mode="lines+markers", name="Camera path",
+            text=images, hoverinfo="text", line=dict(color="#7f8c8d", width=2),
+            marker=dict(size=4, color=order, colorscale="Plasma", cmin=0, cmax=1),
+        ))
+    extent = np.maximum(hi - lo, 1e-9)
+    ratio = extent / extent.max()
+    fig.update_layout(
+        title=f"{len(points):,} of {tiles.total_points:,} points from {n_tiles} tiles",
+        template="plotly_white",
+        height=700,
+        margin=dict(l=0, r=0, t=50, b=0),
+        uirevision=str(view["box"]),  # a new box applies the camera below; budget changes keep the user's
+        scene=dict(
+            xaxis=dict(range=[lo[0], hi[0]], title="X (mm)"),
+            yaxis=dict(range=[lo[1], hi[1]], title="Y (mm)"),
+            zaxis=dict(range=[lo[2], hi[2]], title="Z (mm)"),
+            aspectmode="manual",
+            aspectratio=dict(x=ratio[0], y=ratio[1], z=ratio[2]),
+            camera=dict(eye=dict(zip("xyz", view["eye"])), center=dict(x=0, y=0, z=0)),
+        ),
+    )
+    return fig
+
+
+def cloud_layout():
+    return html.Div([
+        html.H2("Point Cloud", style={"textAlign": "center", "marginTop": "20px", "color": "#2c3e50"}),
+        html.Div([
+            html.Label("Point budget:", style={'fontWeight': 'bold', 'marginRight': '10px', 'color': '#34495e'}),
+            dcc.Dropdown(id="cloud-budget", options=[{"label": f"{b:,}", "value": b} for b in BUDGET_OPTIONS],
+                         value=POINT_BUDGET, clearable=False, style={'width': '200px'}),
+            html.Button("Reset View", id="cloud-reset", n_clicks=0, style={'marginLeft': '20px'}),
+        ], style={"display": "flex", "alignItems": "center", "justifyContent": "center", "marginBottom": "10px"}),
+        dcc.Graph(id="cloud-graph"),
+        dcc.Store(id="cloud-view"),
+    ])
+
+
+def register_callbacks(app, tiles, trajectory, images):
+    """Zooming or panning the 3D view narrows the box; only tiles inside it are read, coarse first."""
+    limits = full_view(tiles, trajectory)
+
+    @app.callback(
+        Output("cloud-view", "data"),
+        Input("cloud-graph", "relayoutData"),
+        Input("cloud-reset", "n_clicks"),
+        State("cloud-view", "data"),
+    )
+    def update_view(relayout, n_clicks, view):
+        if view is None or callback_context.triggered_id == "cloud-reset":
+            return limits
+        if relayout and "scene.camera" in relayout:
+            new_view = zoomed_view(view, relayout["scene.camera"], limits)
+            if not np.allclose(new_view["box"], view["box"]):  # a pure rotation needs no new tiles
+                return new_view
+        return no_update
+
+    @app.callback(
+        Output("cloud-graph", "figure"),
+        Input("cloud-view", "data"),
+        Input("cloud-budget", "value"),
+    )
+    def update_cloud(view, budget):
+        return cloud_figure(tiles, view or limits, budget, trajectory, images)
+
+
+# --- MAIN ---
+if __name__ == "__main__":
+    # python cloud_viewer.py [tiles dir] [capture_log.json]
+    tiles = TileSet(sys.argv[1] if len(sys.argv) > 1 else TILES_DIR)
+    trajectory, images = load_trajectory(sys.argv[2] if len(sys.argv) > 2 else LOG_PATH)
+
+    app = Dash(__name__)
+    app.title = "Point Cloud Viewer"
+    app.layout = html.Div([cloud_layout()], style={"fontFamily": "Arial, sans-serif", "padding": "30px"})
+    register_callbacks(app, tiles, trajectory, images)
+    app.run(debug=False, host='0.0.0.0', port=VIEWER_PORT)
@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+from collections import OrderedDict
+import numpy as np
+
+from point_cloud_measure import load_point_cloud
+
+# --- CONFIG ---
+CLOUD_PATH = "fused_cloud.ply"
+TILES_DIR = "cloud_tiles"
+INDEX_NAME = "index.json"
+
+NODE_GRID = 24          # each node keeps at most one point per cell of a NODE_GRID^3 grid over its cube (~14k points)
+LEAF_POINTS = 20_000    # nodes with fewer points than this keep all of them and are not split
+MAX_DEPTH = 14          # NODE_GRID * 2^MAX_DEPTH cells per axis must fit in 21 bits
+TILE_CACHE = 256        # tiles kept in memory by TileSet
+
+
+def _encode(coords, bits):
+    return (coords[:, 0] << (2 * bits)) | (coords[:, 1] << bits) | coords[:, 2]
+
+
+def node_name(depth, x, y, z):
+    return f"{depth}-{x}-{y}-{z}"
+
+
+# --- Building ---
+def build_tiles(points, out_dir=TILES_DIR, grid=NODE_GRID, leaf_points=LEAF_POINTS, max_depth=MAX_DEPTH, seed=0):
+    """Split a cloud into octree tiles on disk, one .npy per node.
+
+    Every point is stored once. A node holds an evenly spread subsample of its
+    cube (one point per grid cell) and passes the rest to its children, so the
+    root alone is a coarse preview and each level down adds detail. Levels are
+    processed with whole-array operations, not per node.
+    """
+    points = np.asarray(points, dtype=np.float32)
+    points = points[np.isfinite(points).all(axis=1)]
+    os.makedirs(out_dir, exist_ok=True)
+    origin = points.min(axis=0).astype(np.float64)
+    size = float((points.max(axis=0) - origin).max()) * 1.0001 or 1.0
+
+    # Random order, so "first point in each cell" is an unbiased sample
+    remaining = np.random.default_rng(seed).permutation(len(points))
+    nodes = {}
+    for depth in range(max_depth + 1):
+        if len(remaining) == 0:
+            break
+        n_cells = 1 << depth
+        local = (points[remaining] - origin) / size
+        coords = np.clip((local * n_cells).astype(np.int64), 0, n_cells - 1)
+        keys = _encode(coords, max(depth, 1))
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        take = (counts[inverse] <= leaf_points) | (depth == max_depth)
+
+        sub_cells = n_cells * grid
+        sub = np.clip((local * sub_cells).astype(np.int64), 0, sub_cells - 1)
+        split = np.flatnonzero(~take)
+        _, first = np.unique(_encode(sub[split], (sub_cells - 1).bit_length()), return_index=True)
+        take[split[first]] = True
+
+        # Group this level's points by node and write each node once
+        taken = np.flatnonzero(take)
+        order = taken[np.argsort(keys[taken], kind="stable")]
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for group in np.split(order, bounds):
+            x, y, z = (int(c) for c in coords[group[0]])
+            name = node_name(depth, x, y, z)
+            np.save(os.path.join(out_dir, name + ".npy"), points[remaining[group]])
+            nodes[name] = {"depth": depth, "xyz": [x, y, z], "count": len(group)}
+        remaining = remaining[~take]
+        print(f"Depth {depth}: {len(bounds) + 1} tiles, {len(taken)} points")
+
+    index = {"origin": origin.tolist(), "size": size, "grid": grid, "points": len(points), "nodes": nodes}
+    tmp_path = os.path.join(out_dir, INDEX_NAME + ".part")
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, os.path.join(out_dir, INDEX_NAME))
+    return index
+
+
+# --- Reading ---
+class TileSet:
+    """Octree tiles written by build_tiles, loaded on demand with a small LRU cache."""
+
+    def __init__(self, tiles_dir=TILES_DIR, cache_size=TILE_CACHE):
+        self.dir = tiles_dir
+        with open(os.path.join(tiles_dir, INDEX_NAME), "r") as f:
+            index = json.load(f)
+        self.origin = np.array(index["origin"])
+        self.size = index["size"]
+        self.nodes = index["nodes"]
+        self.total_points = index["points"]
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+    @property
+    def bounds(self):
+        return self.origin, self.origin + self.size
+
+    def node_bounds(self, name):
+        node = self.nodes[name]
+        cell = self.size / (1 << node["depth"])
+        lo = self.origin + np.array(node["xyz"]) * cell
+        return lo, lo + cell
+
+    def children(self, name):
+        node = self.nodes[name]
+        x, y, z = node["xyz"]
+        for dx in (0, 1):
+            for dy in (0, 1):
+                for dz in (0, 1):
+                    child = node_name(node["depth"] + 1, 2 * x + dx, 2 * y + dy, 2 * z + dz)
+                    if child in self.nodes:
+                        yield child
+
+    def overlap(self, name, box_min, box_max):
+        """Fraction of a node's cube inside the box: about the share of its points that will be drawn."""
+        lo, hi = self.node_bounds(name)
+        inside = np.clip(np.minimum(hi, box_max) - np.maximum(lo, box_min), 0, None)
+        return float(np.prod(inside / (hi - lo)))
+
+    def select(self, box_min, box_max, budget):
+        """Tiles to draw for a view box within a point budget, coarse first.
+
+        Walks the octree breadth-first from the root, skipping nodes outside the
+        box; nearer-to-centre nodes are refined first at each depth. Ancestors
+        are always included, since a node only adds detail to them. Each tile
+        is charged only for its share inside the box, so a zoomed-in view
+        spends the budget on detail it can show. Returns (names, estimated
+        points drawn).
+        """
+        box_min, box_max = np.asarray(box_min), np.asarray(box_max)
+        focus = (box_min + box_max) / 2
+        root = node_name(0, 0, 0, 0)
+        selected, total = [], 0
+        frontier = [root] if root in self.nodes else []
+        while frontier:
+            next_frontier = []
+            ranked = sorted(frontier, key=lambda n: np.linalg.norm(np.mean(self.node_bounds(n), axis=0) - focus))
+            for name in ranked:
+                lo, hi = self.node_bounds(name)
+                if np.any(lo > box_max) or np.any(hi < box_min):
+                    continue
+                count = self.nodes[name]["count"] * self.overlap(name, box_min, box_max)
+                if total + count > budget:
+                    continue
+                selected.append(name)
+                total += count
+                next_frontier.extend(self.children(name))
+            frontier = next_frontier
+        return selected, int(total)
+
+    def load(self, name):
+        if name in self.cache:
+            self.cache.move_to_end(name)
+            return self.cache[name]
+        points = np.load(os.path.join(self.dir, name + ".npy"))
+        self.cache[name] = points
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return points
+
+    def points_in_box(self, box_min, box_max, budget):
+        """(points, number of tiles) for a view box, at the finest detail the budget allows."""
+        names, _ = self.select(box_min, box_max, budget)
+        if not names:
+            return np.empty((0, 3), dtype=np.float32), 0
+        points = np.concatenate([self.load(name) for name in names])
+        inside = np.all((points >= box_min) & (points <= box_max), axis=1)
+        return points[inside], len(names)
+
+
+# --- MAIN ---
+if __name__ == "__main__":
+    # python lod_tiles.py [cloud] [tiles dir]
+    cloud_path = sys.argv[1] if len(sys.argv) > 1 else CLOUD_PATH
+    tiles_dir = sys.argv[2] if len(sys.argv) > 2 else TILES_DIR
+
+    start_time = time.time()
+    points = load_point_cloud(cloud_path)
+    print(f"Loaded {len(points)} points from {cloud_path}")
+    index = build_tiles(points, tiles_dir)
+    print(f"\n[INFO] Wrote {len(index['nodes'])} tiles to {tiles_dir} in {time.time() - start_time:.1f}s")
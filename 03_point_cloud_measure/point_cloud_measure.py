@@ -0,0 +1,345 @@
+import json
+import os
+import sys
+import numpy as np
+from scipy.spatial import cKDTree
+
+# --- CONFIG ---
+CLOUD_PATH = "fused_cloud.ply"
+PAIRS_PATH = "feature_pairs.json"
+RESULTS_PATH = "measurement_results.json"
+LINEAR_UNIT = "mm"
+
+NEIGHBOURHOOD_K = 16      # neighbours averaged around each picked coordinate
+PLANE_K = 200             # neighbours used to fit a reference plane (wider support = steadier normal)
+TRIM_FRACTION = 0.25      # fraction of the farthest neighbours dropped before averaging
+MAX_SNAP_DISTANCE = 5.0   # picks farther than this from any point are flagged (same unit as the cloud)
+
+# PLY property types -> numpy dtypes
+PLY_DTYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+
+
+# --- Loading ---
+def _read_ply_header(f, path):
+    if f.readline().strip() != b"ply":
+        raise ValueError(f"{path} is not a PLY file")
+
+    fmt = None
+    vertex_count = 0
+    properties = []
+    in_vertex = False
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError(f"Unexpected end of PLY header in {path}")
+        parts = line.decode("ascii").strip().split()
+        if not parts:
+            continue
+        if parts[0] == "format":
+            fmt = parts[1]
+        elif parts[0] == "element":
+            in_vertex = parts[1] == "vertex"
+            if in_vertex:
+                vertex_count = int(parts[2])
+        elif parts[0] == "property" and in_vertex:
+            if parts[1] == "list":
+                raise ValueError("List properties on vertices are not supported")
+            properties.append((parts[2], PLY_DTYPES[parts[1]]))
+        elif parts[0] == "end_header":
+            break
+    return fmt, vertex_count, properties
+
+
+def _ply_vertex_dtype(fmt, properties):
+    endian = "<" if fmt == "binary_little_endian" else ">"
+    return np.dtype([(name, endian + code) for name, code in properties])
+
+
+def _read_ply_vertices(path):
+    with open(path, "rb") as f:
+        fmt, vertex_count, properties = _read_ply_header(f, path)
+
+        if fmt == "ascii":
+            data = np.loadtxt(f, max_rows=vertex_count, usecols=range(len(properties)), ndmin=2)
+            names = [name for name, _ in properties]
+            return data[:, [names.index(axis) for axis in ("x", "y", "z")]].astype(np.float64)
+
+        # Vertex block comes first in RealSense / Blender exports, so read it in one shot
+        vertices = np.fromfile(f, dtype=_ply_vertex_dtype(fmt, properties), count=vertex_count)
+        return np.column_stack([vertices["x"], vertices["y"], vertices["z"]]).astype(np.float64)
+
+
+def load_point_cloud(path):
+    """Load an (N, 3) float64 array of XYZ points from .npy, .ply, .xyz, .txt or .csv."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        points = np.load(path, mmap_mode="r")[:, :3]
+    elif ext == ".ply":
+        points = _read_ply_vertices(path)
+    elif ext in (".xyz", ".txt", ".csv"):
+        delimiter = "," if ext == ".csv" else None
+        points = np.loadtxt(path, delimiter=delimiter, usecols=(0, 1, 2), ndmin=2)
+    else:
+        raise ValueError(f"Unsupported point cloud format: {ext}")
+    return np.ascontiguousarray(points, dtype=np.float64)
+
+
+def iter_point_chunks(path, chunk_size=5_000_000):
+    """Yield (n, 3) float64 chunks of a cloud without holding the whole file in memory.
+
+    .npy and binary .ply files are memory-mapped and sliced; text formats are
+    loaded once and sliced, since they cannot be mapped.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        source = np.load(path, mmap_mode="r")
+        for start in range(0, len(source), chunk_size):
+            yield np.array(source[start:start + chunk_size, :3], dtype=np.float64)
+        return
+
+    if ext == ".ply":
+        with open(path, "rb") as f:
+            fmt, vertex_count, properties = _read_ply_header(f, path)
+            offset = f.tell()
+        if fmt != "ascii":
+            vertices = np.memmap(path, dtype=_ply_vertex_dtype(fmt, properties), mode="r",
+                                 offset=offset, shape=(vertex_count,))
+            for start in range(0, vertex_count, chunk_size):
+                block = vertices[start:start + chunk_size]
+                yield np.column_stack([block["x"], block["y"], block["z"]]).astype(np.float64)
+            return
+
+    points = load_point_cloud(path)
+    for start in range(0, len(points), chunk_size):
+        yield points[start:start + chunk_size]
+
+
+def save_point_cloud(path, points, normals=None):
+    """Write points (and optional normals) as .npy or binary little-endian .ply."""
+    points = np.asarray(points, dtype=np.float32)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        np.save(path, points if normals is None else np.hstack([points, np.asarray(normals, dtype=np.float32)]))
+        return
+    if ext != ".ply":
+        raise ValueError(f"Unsupported point cloud format: {ext}")
+
+    names = ["x", "y", "z"] + ([] if normals is None else ["nx", "ny", "nz"])
+    vertices = np.empty(len(points), dtype=[(name, "<f4") for name in names])
+    vertices["x"], vertices["y"], vertices["z"] = points.T
+    if normals is not None:
+        vertices["nx"], vertices["ny"], vertices["nz"] = np.asarray(normals, dtype=np.float32).T
+
+    header = ["ply", "format binary_little_endian 1.0", f"element vertex {len(points)}"]
+    header += [f"property float {name}" for name in names]
+    header.append("end_header")
+    with open(path, "wb") as f:
+        f.write(("\n".join(header) + "\n").encode("ascii"))
+        vertices.tofile(f)
+
+
+# --- Spatial Index ---
+class PointCloudIndex:
+    """KD-tree over a fused point cloud for snapping, radius queries and local neighbourhoods."""
+
+    def __init__(self, points, leafsize=32, workers=-1):
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        self.workers = workers
+        # Sliding-midpoint build without node compaction is several times faster on 10M+ points
+        self.tree = cKDTree(self.points, leafsize=leafsize, balanced_tree=False, compact_nodes=False)
+
+    def __len__(self):
+        return len(self.points)
+
+    def snap(self, coords, max_distance=np.inf):
+        """Snap picked coordinates to their nearest cloud points.
+
+        Returns (indices, snapped_points, distances). Picks with no point within
+        max_distance get index -1 and a NaN snapped point.
+        """
+        coords = np.atleast_2d(np.asarray(coords, dtype=np.float64))
+        distances, indices = self.tree.query(coords, k=1, distance_upper_bound=max_distance, workers=self.workers)
+        missing = ~np.isfinite(distances)
+        indices = np.where(missing, -1, indices)
+        snapped = np.full(coords.shape, np.nan)
+        snapped[~missing] = self.points[indices[~missing]]
+        return indices, snapped, distances
+
+    def radius_query(self, center, radius, return_sorted=False):
+        """Indices of every point within radius of center."""
+        return np.asarray(self.tree.query_ball_point(center, radius, workers=self.workers,
+                                                     return_sorted=return_sorted), dtype=np.intp)
+
+    def neighbourhoods(self, coords, k=NEIGHBOURHOOD_K):
+        """(M, k, 3) array of the k nearest cloud points around each coordinate."""
+        coords = np.atleast_2d(np.asarray(coords, dtype=np.float64))
+        k = min(k, len(self.points))
+        _, indices = self.tree.query(coords, k=k, workers=self.workers)
+        return self.points[indices.reshape(len(coords), k)]
+
+    def local_centroids(self, coords, k=NEIGHBOURHOOD_K, trim=TRIM_FRACTION):
+        """Robust local position around each coordinate.
+
+        Averages the k nearest neighbours after dropping the `trim` fraction that lie
+        farthest from the neighbourhood median, so single stray points do not pull
+        the estimate. Returns (centroids, spread) where spread is the RMS distance of
+        the kept neighbours from their centroid.
+        """
+        neighbours = self.neighbourhoods(coords, k)
+        keep = max(1, int(round(neighbours.shape[1] * (1.0 - trim))))
+        median = np.median(neighbours, axis=1, keepdims=True)
+        order = np.argsort(np.linalg.norm(neighbours - median, axis=2), axis=1)[:, :keep]
+        kept = np.take_along_axis(neighbours, order[:, :, None], axis=1)
+        centroids = kept.mean(axis=1)
+        spread = np.sqrt(np.mean(np.sum((kept - centroids[:, None, :]) ** 2, axis=2), axis=1))
+        return centroids, spread
+
+    def local_planes(self, coords, k=PLANE_K):
+        """Least-squares plane through the k neighbours of each coordinate.
+
+        Returns (origins, normals, rms) where rms is the out-of-plane residual.
+        """
+        neighbours = self.neighbourhoods(coords, k)
+        origins = neighbours.mean(axis=1)
+        centered = neighbours - origins[:, None, :]
+        covariance = np.einsum("mki,mkj->mij", centered, centered) / neighbours.shape[1]
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        # eigh sorts ascending: the smallest-variance direction is the plane normal
+        normals = eigenvectors[:, :, 0]
+        rms = np.sqrt(np.clip(eigenvalues[:, 0], 0.0, None))
+        return origins, normals, rms
+
+
+# --- Measurement ---
+def measure_point_to_point(index, a, b, k=NEIGHBOURHOOD_K):
+    """Distance between the robust local positions around two picked coordinates."""
+    return measure_batch(index, [{"a": a, "b": b, "mode": "point"}], k=k)[0]
+
+
+def measure_point_to_plane(index, point, plane_point, k=NEIGHBOURHOOD_K, plane_k=PLANE_K):
+    """Distance from the local position around `point` to the plane fitted around `plane_point`."""
+    return measure_batch(index, [{"a": point, "b": plane_point, "mode": "plane"}], k=k, plane_k=plane_k)[0]
+
+
+def measure_batch(index, pairs, k=NEIGHBOURHOOD_K, plane_k=PLANE_K, max_snap_distance=MAX_SNAP_DISTANCE):
+    """Measure many feature pairs with one KD-tree query per stage.
+
+    Each pair is a dict with "a" and "b" coordinates and an optional "mode"
+    ("point" for point-to-point, "plane" for point-to-plane where "b" picks the
+    plane). Optional "name", "nominal" and "tolerance" are carried through.
+    """
+    if not pairs:
+        return []
+
+    a = np.array([p["a"] for p in pairs], dtype=np.float64)
+    b = np.array([p["b"] for p in pairs], dtype=np.float64)
+    modes = np.array([p.get("mode", "point") for p in pairs])
+    plane_mask = modes == "plane"
+
+    # Snap and average both ends together so each stage is a single vectorized query
+    ends = np.vstack([a, b])
+    _, _, snap_distances = index.snap(ends, max_distance=max_snap_distance)
+    centroids, spread = index.local_centroids(ends, k=k)
+    a_pos, b_pos = centroids[:len(pairs)], centroids[len(pairs):]
+    a_spread, b_spread = spread[:len(pairs)], spread[len(pairs):]
+    a_snap, b_snap = snap_distances[:len(pairs)], snap_distances[len(pairs):]
+
+    distances = np.linalg.norm(a_pos - b_pos, axis=1)
+    uncertainty = np.sqrt(a_spread ** 2 + b_spread ** 2) / np.sqrt(k)
+    normals = np.full((len(pairs), 3), np.nan)
+
+    if plane_mask.any():
+        origins, plane_normals, plane_rms = index.local_planes(b[plane_mask], k=plane_k)
+        offsets = np.einsum("ij,ij->i", a_pos[plane_mask] - origins, plane_normals)
+        distances[plane_mask] = np.abs(offsets)
+        b_pos[plane_mask] = origins
+        normals[plane_mask] = plane_normals
+        uncertainty[plane_mask] = np.sqrt(a_spread[plane_mask] ** 2 / k + plane_rms ** 2 / plane_k)
+
+    results = []
+    for i, pair in enumerate(pairs):
+        result = {
+            "name": pair.get("name", f"pair_{i + 1}"),
+            "mode": str(modes[i]),
+            "distance": float(distances[i]),
+            "uncertainty": float(uncertainty[i]),
+            "a": a_pos[i].tolist(),
+            "b": b_pos[i].tolist(),
+            "snapped": bool(np.isfinite(a_snap[i]) and np.isfinite(b_snap[i])),
+        }
+        if plane_mask[i]:
+            result["normal"] = normals[i].tolist()
+        if "nominal" in pair:
+            result["nominal"] = pair["nominal"]
+            result["tolerance"] = pair.get("tolerance")
+        results.append(result)
+    return results
+
+
+# --- QIF Output ---
+def _characteristic_status(result):
+    if "nominal" not in result or result.get("tolerance") is None:
+        return "NOT_INSPECTED"
+    deviation = abs(result["distance"] - result["nominal"])
+    return "PASS" if deviation <= result["tolerance"] else "FAIL"
+
+
+def to_qif_results(results, linear_unit=LINEAR_UNIT, source=CLOUD_PATH):
+    """Wrap measurement results in a QIF MeasurementResults-shaped dictionary."""
+    characteristics = []
+    for i, result in enumerate(results, start=1):
+        measurement = {
+            "id": i,
+            "name": result["name"],
+            "type": "DistanceBetweenCharacteristicMeasurement",
+            "Value": round(result["distance"], 6),
+            "Uncertainty": round(result["uncertainty"], 6),
+            "Status": {"CharacteristicStatusEnum": _characteristic_status(result)},
+            "MeasuredPoints": [result["a"], result["b"]],
+        }
+        if "normal" in result:
+            measurement["PlaneNormal"] = result["normal"]
+        if "nominal" in result:
+            measurement["Nominal"] = result["nominal"]
+            measurement["Tolerance"] = result["tolerance"]
+        characteristics.append(measurement)
+
+    return {
+        "QIFDocument": {
+            "FileUnits": {"PrimaryUnits": {"LinearUnit": {"UnitName": linear_unit}}},
+            "MeasurementsResults": {
+                "MeasurementResults": [{
+                    "id": 1,
+                    "Source": source,
+                    "MeasuredCharacteristics": {"CharacteristicMeasurements": characteristics},
+                }]
+            },
+        }
+    }
+
+
+# --- MAIN ---
+if __name__ == "__main__":
+    cloud_path = sys.argv[1] if len(sys.argv) > 1 else CLOUD_PATH
+    pairs_path = sys.argv[2] if len(sys.argv) > 2 else PAIRS_PATH
+
+    points = load_point_cloud(cloud_path)
+    print(f"Loaded {len(points)} points from {cloud_path}")
+    index = PointCloudIndex(points)
+
+    with open(pairs_path, "r") as f:
+        pairs = json.load(f)
+
+    results = measure_batch(index, pairs)
+    for r in results:
+        flag = "" if r["snapped"] else "  (pick far from cloud)"
+        print(f"{r['name']}: {r['distance']:.3f} {LINEAR_UNIT} ± {r['uncertainty']:.3f} [{r['mode']}]{flag}")
+
+    with open(RESULTS_PATH, "w") as f:
+        json.dump(to_qif_results(results, source=cloud_path), f, indent=2)
+    print(f"\n[INFO] QIF results saved to {RESULTS_PATH}")
@@ -0,0 +1,146 @@
+import sys
+import time
+import numpy as np
+from scipy.spatial import cKDTree
+
+from point_cloud_measure import PointCloudIndex, iter_point_chunks, save_point_cloud
+
+# --- CONFIG ---
+INPUT_PATHS = ["fused_cloud.ply"]
+OUTPUT_PATH = "fused_cloud_clean.ply"
+
+VOXEL_SIZE = 1.0            # mm; one output point per occupied voxel
+CHUNK_SIZE = 5_000_000      # points read per chunk while downsampling
+QUERY_CHUNK_SIZE = 500_000  # points queried per chunk during outlier removal / normals
+
+SOR_K = 20                  # neighbours for statistical outlier removal
+SOR_STD_RATIO = 2.0         # drop points whose mean neighbour distance exceeds mean + ratio * std
+RADIUS = 3.0                # mm; radius outlier removal search radius (None to skip)
+MIN_NEIGHBOURS = 4          # points with fewer neighbours than this inside RADIUS are dropped
+NORMAL_K = 20               # neighbours used for normal estimation
+
+# 21 bits per axis lets three voxel coordinates share one int64 key
+_KEY_BITS = 21
+_KEY_OFFSET = 1 << (_KEY_BITS - 1)
+
+
+# --- Voxel Downsampling ---
+def _voxel_keys(points, voxel_size):
+    coords = np.floor(points / voxel_size).astype(np.int64) + _KEY_OFFSET
+    if coords.min(initial=0) < 0 or coords.max(initial=0) >= (1 << _KEY_BITS):
+        raise ValueError(f"Cloud extent too large for voxel size {voxel_size}; increase the voxel size")
+    return (coords[:, 0] << (2 * _KEY_BITS)) | (coords[:, 1] << _KEY_BITS) | coords[:, 2]
+
+
+def _reduce_voxels(keys, sums, counts):
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    reduced = np.column_stack([np.bincount(inverse, weights=sums[:, axis], minlength=len(unique_keys))
+                               for axis in range(3)])
+    return unique_keys, reduced, np.bincount(inverse, weights=counts, minlength=len(unique_keys))
+
+
+def voxel_downsample(points, voxel_size=VOXEL_SIZE):
+    """Replace all points in each occupied voxel with their centroid."""
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) == 0:
+        return points.reshape(0, 3)
+    _, sums, counts = _reduce_voxels(_voxel_keys(points, voxel_size), points, np.ones(len(points)))
+    return sums / counts[:, None]
+
+
+def voxel_downsample_chunks(chunks, voxel_size=VOXEL_SIZE):
+    """Voxel-downsample a stream of (n, 3) chunks into one cloud.
+
+    Only per-voxel sums and counts are kept between chunks, so memory scales with
+    the number of occupied voxels rather than the number of input points. Views
+    that overlap land in the same voxels and are merged automatically.
+    """
+    keys = np.empty(0, dtype=np.int64)
+    sums = np.empty((0, 3))
+    counts = np.empty(0)
+    total = 0
+
+    for chunk in chunks:
+        chunk = chunk[np.isfinite(chunk).all(axis=1)]
+        total += len(chunk)
+        chunk_keys, chunk_sums, chunk_counts = _reduce_voxels(
+            _voxel_keys(chunk, voxel_size), chunk, np.ones(len(chunk)))
+        keys, sums, counts = _reduce_voxels(
+            np.concatenate([keys, chunk_keys]), np.vstack([sums, chunk_sums]),
+            np.concatenate([counts, chunk_counts]))
+
+    print(f"Voxel downsample: {total} -> {len(keys)} points (voxel {voxel_size})")
+    return sums / counts[:, None]
+
+
+def voxel_downsample_files(paths, voxel_size=VOXEL_SIZE, chunk_size=CHUNK_SIZE):
+    """Voxel-downsample one or more clouds chunk by chunk (see voxel_downsample_chunks)."""
+    return voxel_downsample_chunks((chunk for path in paths for chunk in iter_point_chunks(path, chunk_size)),
+                                   voxel_size)
+
+
+# --- Outlier Removal ---
+def statistical_outlier_mask(points, k=SOR_K, std_ratio=SOR_STD_RATIO, tree=None, chunk_size=QUERY_CHUNK_SIZE):
+    """Boolean mask of points whose mean distance to their k neighbours is not anomalous."""
+    tree = tree or cKDTree(points, balanced_tree=False, compact_nodes=False)
+    mean_distances = np.empty(len(points))
+    for start in range(0, len(points), chunk_size):
+        # k + 1 because every point is its own nearest neighbour
+        distances, _ = tree.query(points[start:start + chunk_size], k=k + 1, workers=-1)
+        mean_distances[start:start + chunk_size] = distances[:, 1:].mean(axis=1)
+    threshold = mean_distances.mean() + std_ratio * mean_distances.std()
+    return mean_distances <= threshold
+
+
+def radius_outlier_mask(points, radius=RADIUS, min_neighbours=MIN_NEIGHBOURS, tree=None, chunk_size=QUERY_CHUNK_SIZE):
+    """Boolean mask of points with at least min_neighbours other points inside radius."""
+    tree = tree or cKDTree(points, balanced_tree=False, compact_nodes=False)
+    counts = np.empty(len(points), dtype=np.intp)
+    for start in range(0, len(points), chunk_size):
+        counts[start:start + chunk_size] = tree.query_ball_point(
+            points[start:start + chunk_size], radius, return_length=True, workers=-1)
+    return counts - 1 >= min_neighbours
+
+
+# --- Normals ---
+def estimate_normals(points, k=NORMAL_K, index=None, viewpoint=None, chunk_size=QUERY_CHUNK_SIZE):
+    """Per-point normals from a local plane fit, optionally flipped to face viewpoint."""
+    index = index or PointCloudIndex(points)
+    normals = np.empty((len(points), 3))
+    for start in range(0, len(points), chunk_size):
+        _, normals[start:start + chunk_size], _ = index.local_planes(points[start:start + chunk_size], k=k)
+    if viewpoint is not None:
+        flip = np.einsum("ij,ij->i", normals, np.asarray(viewpoint) - points) < 0
+        normals[flip] *= -1
+    return normals
+
+
+# --- Pipeline ---
+def preprocess_clouds(paths, voxel_size=VOXEL_SIZE, radius=RADIUS, min_neighbours=MIN_NEIGHBOURS,
+                      sor_k=SOR_K, sor_std_ratio=SOR_STD_RATIO, normal_k=NORMAL_K, chunk_size=CHUNK_SIZE):
+    """Downsample, clean and estimate normals for one or more overlapping views.
+
+    Returns (points, normals). Outlier removal and normals run on the downsampled
+    cloud, which is orders of magnitude smaller than the raw captures.
+    """
+    points = voxel_downsample_files(paths, voxel_size, chunk_size)
+
+    tree = cKDTree(points, balanced_tree=False, compact_nodes=False)
+    keep = statistical_outlier_mask(points, sor_k, sor_std_ratio, tree=tree)
+    if radius is not None:
+        keep &= radius_outlier_mask(points, radius, min_neighbours, tree=tree)
+    print(f"Outlier removal: {len(points)} -> {int(keep.sum())} points")
+    points = points[keep]
+
+    normals = estimate_normals(points, k=normal_k)
+    return points, normals
+
+
+# --- MAIN ---
+if __name__ == "__main__":
+    input_paths = sys.argv[1:] or INPUT_PATHS
+
+    start_time = time.time()
+    points, normals = preprocess_clouds(input_paths)
+    save_point_cloud(OUTPUT_PATH, points, normals)
+    print(f"\n[INFO] Saved {len(points)} points to {OUTPUT_PATH} in {time.time() - start_time:.1f}s")
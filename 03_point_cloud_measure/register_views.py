@@ -0,0 +1,290 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.spatial import cKDTree
+from scipy.spatial.transform import Rotation
+
+from point_cloud_measure import load_point_cloud, iter_point_chunks, save_point_cloud
+from preprocess_cloud import voxel_downsample, voxel_downsample_chunks, estimate_normals, VOXEL_SIZE
+
+# --- CONFIG ---
+LOG_PATH = "../02_mtconnect_camera_coordinates/robot_capture_sequence/capture_log.json"
+VIEW_DIR = "../02_mtconnect_camera_coordinates/robot_capture_sequence"  # one cloud per log entry, named like its image
+POSES_PATH = "registered_poses.json"
+OUTPUT_PATH = "fused_cloud.ply"
+VIEW_EXTENSIONS = (".ply", ".npy", ".xyz")
+
+# Camera mount in the end-effector frame (same offset as 02 plot_camera_capture.py)
+CAMERA_OFFSET = np.array([63.5, -37.1, 0.0])
+CAMERA_ROTATION = np.eye(3)   # camera axes in the end-effector frame, from hand-eye calibration
+CLOUD_SCALE = 1000.0          # view clouds in metres (RealSense) -> mm
+
+PYRAMID_VOXELS = (8.0, 4.0, 2.0)  # mm, coarse to fine
+NORMAL_K = 20
+MAX_DISTANCE_VOXELS = 3.0     # correspondences farther than this many voxels are ignored at each level
+HUBER_VOXELS = 0.5            # residuals beyond this many voxels are down-weighted
+ICP_ITERATIONS = 30
+ICP_TOLERANCE = 1e-5          # stop when the update is below this (rad / mm)
+
+PAIR_NEIGHBOURS = 4           # each view is paired with its nearest cameras...
+PAIR_MAX_DISTANCE = 400.0     # ...within this many mm, and with the next capture
+MIN_OVERLAP = 0.2             # pairs with fewer source points matched than this are not trusted
+MIN_INLIERS = 200
+
+POSE_SIGMA_MM = 2.0           # robot-reported pose uncertainty: how far registration may move a view
+POSE_SIGMA_DEG = 0.5
+RESIDUAL_FLOOR = 0.1          # mm; keeps a near-perfect pair from dominating the pose graph
+WORKERS = None                # process pool size (None = all cores)
+
+
+# --- Poses ---
+def euler_to_matrix(rx, ry, rz):
+    """ZYX rotation from the robot's [roll, pitch, yaw] in degrees, as in 02 plot_camera_capture.py."""
+    rx, ry, rz = np.radians([rx, ry, rz])
+    Rx = np.array([[1, 0, 0], [0, np.cos(rx), -np.sin(rx)], [0, np.sin(rx), np.cos(rx)]])
+    Ry = np.array([[np.cos(ry), 0, np.sin(ry)], [0, 1, 0], [-np.sin(ry), 0, np.cos(ry)]])
+    Rz = np.array([[np.cos(rz), -np.sin(rz), 0], [np.sin(rz), np.cos(rz), 0], [0, 0, 1]])
+    return Rz @ Ry @ Rx
+
+
+def camera_pose(position, orientation):
+    """4x4 camera-to-world transform from a capture_log entry's tool position and orientation."""
+    tool = np.eye(4)
+    tool[:3, :3] = euler_to_matrix(*orientation)
+    tool[:3, 3] = position
+    mount = np.eye(4)
+    mount[:3, :3] = CAMERA_ROTATION
+    mount[:3, 3] = CAMERA_OFFSET
+    return tool @ mount
+
+
+def transform(points, pose):
+    return points @ pose[:3, :3].T + pose[:3, 3]
+
+
+def _centered_twist(pose, center):
+    """(rotation vector, translation) of a small rigid motion, with rotation about center instead of the origin."""
+    R, t = pose[:3, :3], pose[:3, 3]
+    return np.concatenate([Rotation.from_matrix(R).as_rotvec(), R @ center + t - center])
+
+
+def _twist_pose(twist, center):
+    pose = np.eye(4)
+    pose[:3, :3] = Rotation.from_rotvec(twist[:3]).as_matrix()
+    pose[:3, 3] = twist[3:] + center - pose[:3, :3] @ center
+    return pose
+
+
+def view_path(view_dir, image):
+    stem = os.path.splitext(image)[0]
+    for ext in VIEW_EXTENSIONS:
+        path = os.path.join(view_dir, stem + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def load_views(log_path=LOG_PATH, view_dir=VIEW_DIR):
+    """[(image, cloud path, initial camera pose)] for log entries with a complete pose and a view cloud."""
+    with open(log_path, "r") as f:
+        log = json.load(f)
+    views = []
+    for entry in log:
+        pos, ori = entry.get("position"), entry.get("orientation")
+        path = view_path(view_dir, entry["image"])
+        if pos and ori and None not in pos and None not in ori and path:
+            views.append((entry["image"], path, camera_pose(pos, ori)))
+    return views
+
+
+# --- Per-view pyramids ---
+def build_pyramid(path, pose, voxels=PYRAMID_VOXELS, scale=CLOUD_SCALE, normal_k=NORMAL_K):
+    """World-frame (points, normals) of one view at each voxel size, coarse to fine."""
+    points = transform(load_point_cloud(path) * scale, pose)
+    points = points[np.isfinite(points).all(axis=1)]
+    levels = []
+    for voxel in voxels:
+        level = voxel_downsample(points, voxel)
+        # Normals face the camera, so both sides of thin parts stay distinguishable
+        normals = estimate_normals(level, k=min(normal_k, len(level)), viewpoint=pose[:3, 3])
+        levels.append((level, normals))
+    return levels
+
+
+# --- Point-to-plane ICP ---
+def point_to_plane_icp(source, target, target_normals, tree, center, init=np.eye(4), max_distance=6.0,
+                       huber=1.0, iterations=ICP_ITERATIONS, tolerance=ICP_TOLERANCE):
+    """Rigid transform moving source onto the target surface.
+
+    Each iteration solves one 6x6 linear system over all correspondences, with
+    rotation linearized about center for conditioning. Returns
+    (pose, information, rms, inliers) where information is the 6x6 Hessian of
+    the last iteration in centered-twist coordinates, scaled by the residual.
+    """
+    pose = init.copy()
+    A, rms, inliers = np.zeros((6, 6)), np.inf, 0
+    for _ in range(iterations):
+        moved = transform(source, pose)
+        distances, indices = tree.query(moved, distance_upper_bound=max_distance, workers=1)
+        matched = np.isfinite(distances)
+        inliers = int(matched.sum())
+        if inliers < 6:
+            break
+        p = moved[matched] - center
+        n = target_normals[indices[matched]]
+        r = np.einsum("ij,ij->i", p - (target[indices[matched]] - center), n)
+        J = np.hstack([np.cross(p, n), n])
+        w = np.minimum(1.0, huber / np.maximum(np.abs(r), 1e-12))  # Huber weights
+        A = J.T @ (J * w[:, None])
+        step = np.linalg.solve(A + 1e-9 * np.eye(6), -J.T @ (w * r))
+        pose = _twist_pose(step, center) @ pose
+        rms = float(np.sqrt(np.mean(r ** 2)))
+        if np.abs(step).max() < tolerance:
+            break
+    information = A / max(rms, RESIDUAL_FLOOR) ** 2
+    return pose, information, rms, inliers
+
+
+def register_pair(task):
+    """Coarse-to-fine ICP of one view against a neighbour. Runs in a worker process."""
+    i, j, source_levels, target_levels, center, voxels = task
+    pose = np.eye(4)
+    for (source, _), (target, normals), voxel in zip(source_levels, target_levels, voxels):
+        tree = cKDTree(target, balanced_tree=False, compact_nodes=False)
+        pose, information, rms, inliers = point_to_plane_icp(
+            source, target, normals, tree, center, pose,
+            max_distance=MAX_DISTANCE_VOXELS * voxel, huber=HUBER_VOXELS * voxel)
+    overlap = inliers / max(len(source_levels[-1][0]), 1)
+    return i, j, pose, information, rms, inliers, overlap
+
+
+# --- Pairing ---
+def neighbour_pairs(centers, k=PAIR_NEIGHBOURS, max_distance=PAIR_MAX_DISTANCE):
+    """Index pairs (i < j) of views whose cameras are close, plus consecutive captures."""
+    pairs = {(i, i + 1) for i in range(len(centers) - 1)}
+    if len(centers) > 1:
+        distances, indices = cKDTree(centers).query(centers, k=min(k + 1, len(centers)),
+                                                    distance_upper_bound=max_distance)
+        for i, (row_d, row_i) in enumerate(zip(distances, indices)):
+            for d, j in zip(row_d[1:], row_i[1:]):
+                if np.isfinite(d):
+                    pairs.add((min(i, j), max(i, j)))
+    return sorted(pairs)
+
+
+def _bounds_overlap(a, b, margin):
+    return bool(np.all(a.min(axis=0) - margin <= b.max(axis=0)) and np.all(b.min(axis=0) - margin <= a.max(axis=0)))
+
+
+# --- Pose Graph ---
+def solve_pose_graph(n_views, edges, center, sigma_mm=POSE_SIGMA_MM, sigma_deg=POSE_SIGMA_DEG):
+    """Per-view corrections (centered twists) from pairwise ICP results and the robot-pose prior.
+
+    Each edge says view i moved by twist ~ view j's correction composed with the
+    pair's ICP result; to first order x_i - x_j = twist_ij. The prior keeps every
+    correction near zero with the robot's stated uncertainty, so views with no
+    trusted pair keep their reported pose.
+    """
+    size = 6 * n_views
+    A = np.zeros((size, size))
+    b = np.zeros(size)
+    prior = np.diag([np.radians(sigma_deg) ** -2] * 3 + [sigma_mm ** -2] * 3)
+    for v in range(n_views):
+        A[6 * v:6 * v + 6, 6 * v:6 * v + 6] += prior
+    for i, j, pose, information in edges:
+        twist = _centered_twist(pose, center)
+        si, sj = slice(6 * i, 6 * i + 6), slice(6 * j, 6 * j + 6)
+        A[si, si] += information
+        A[sj, sj] += information
+        A[si, sj] -= information
+        A[sj, si] -= information
+        b[si] += information @ twist
+        b[sj] -= information @ twist
+    x = np.linalg.solve(A, b).reshape(n_views, 6)
+    return [_twist_pose(twist, center) for twist in x]
+
+
+# --- Pipeline ---
+def register_views(views, voxels=PYRAMID_VOXELS, workers=WORKERS):
+    """Refine robot-reported camera poses by ICP between neighbouring views.
+
+    views: [(image, cloud path, initial camera-to-world pose)]. Returns
+    (refined poses, pair reports).
+    """
+    initial = [pose for _, _, pose in views]
+    centers = np.array([pose[:3, 3] for pose in initial])
+    with ProcessPoolExecutor(workers) as pool:
+        start_time = time.time()
+        pyramids = list(pool.map(build_pyramid, [path for _, path, _ in views], initial))
+        print(f"Built {len(voxels)}-level pyramids for {len(views)} views in {time.time() - start_time:.1f}s")
+
+        scene_center = np.mean([levels[0][0].mean(axis=0) for levels in pyramids], axis=0)
+        margin = MAX_DISTANCE_VOXELS * voxels[0]
+        tasks = [(i, j, pyramids[i], pyramids[j], scene_center, voxels)
+                 for i, j in neighbour_pairs(centers)
+                 if _bounds_overlap(pyramids[i][0][0], pyramids[j][0][0], margin)]
+        start_time = time.time()
+        results = list(pool.map(register_pair, tasks))
+        print(f"Registered {len(results)} neighbouring pairs in {time.time() - start_time:.1f}s")
+
+    edges, reports = [], []
+    for i, j, pose, information, rms, inliers, overlap in results:
+        used = overlap >= MIN_OVERLAP and inliers >= MIN_INLIERS
+        if used:
+            edges.append((i, j, pose, information))
+        twist = _centered_twist(pose, scene_center)
+        reports.append({"a": views[i][0], "b": views[j][0], "rms": round(rms, 4), "inliers": inliers,
+                        "overlap": round(overlap, 3), "used": used,
+                        "relative_mm": round(float(np.linalg.norm(twist[3:])), 3),
+                        "relative_deg": round(float(np.degrees(np.linalg.norm(twist[:3]))), 4)})
+
+    corrections = solve_pose_graph(len(views), edges, scene_center)
+    return [correction @ pose for correction, pose in zip(corrections, initial)], reports
+
+
+def fuse_views(views, poses, voxel_size=VOXEL_SIZE, scale=CLOUD_SCALE):
+    """One world-frame cloud from every view at its refined pose, merged on a voxel grid."""
+    chunks = (transform(chunk * scale, pose) for (_, path, _), pose in zip(views, poses)
+              for chunk in iter_point_chunks(path))
+    return voxel_downsample_chunks(chunks, voxel_size)
+
+
+def save_poses(path, views, poses, reports):
+    entries = []
+    for (image, cloud_path, initial), pose in zip(views, poses):
+        delta = pose @ np.linalg.inv(initial)
+        entries.append({
+            "image": image,
+            "cloud": cloud_path,
+            "initial_pose": np.round(initial, 6).tolist(),
+            "pose": np.round(pose, 6).tolist(),
+            "correction_mm": round(float(np.linalg.norm(pose[:3, 3] - initial[:3, 3])), 4),
+            "correction_deg": round(float(np.degrees(np.linalg.norm(Rotation.from_matrix(delta[:3, :3]).as_rotvec()))), 4),
+        })
+    with open(path, "w") as f:
+        json.dump({"views": entries, "pairs": reports}, f, indent=2)
+
+
+# --- MAIN ---
+if __name__ == "__main__":
+    # python register_views.py [capture_log.json] [view dir]
+    log_path = sys.argv[1] if len(sys.argv) > 1 else LOG_PATH
+    view_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.dirname(log_path) or "."
+
+    start_time = time.time()
+    views = load_views(log_path, view_dir)
+    print(f"Found {len(views)} views with poses and clouds in {view_dir}")
+    poses, reports = register_views(views)
+    save_poses(POSES_PATH, views, poses, reports)
+
+    corrections = [np.linalg.norm(p[:3, 3] - v[2][:3, 3]) for v, p in zip(views, poses)]
+    used = sum(r["used"] for r in reports)
+    print(f"{used}/{len(reports)} pairs used; camera corrections: median {np.median(corrections):.2f} mm, "
+          f"max {np.max(corrections):.2f} mm")
+
+    points = fuse_views(views, poses)
+    save_point_cloud(OUTPUT_PATH, points)
+    print(f"\n[INFO] Saved {len(points)} registered points to {OUTPUT_PATH} in {time.time() - start_time:.1f}s")
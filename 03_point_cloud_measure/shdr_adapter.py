@@ -0,0 +1,351 @@
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# --- CONFIG ---
+ADAPTER_HOST = "0.0.0.0"
+ADAPTER_PORT = 7878           # default port the MTConnect agent connects to for SHDR
+HEARTBEAT_MS = 10000          # advertised in "* PONG" so the agent knows how often to ping
+FLUSH_INTERVAL = 0.1          # seconds between batched SHDR writes
+MAX_ITEMS_PER_LINE = 64       # key|value pairs packed into a single SHDR line
+SEND_TIMEOUT = 10.0           # seconds an agent may take to accept a write before it is dropped
+
+
+def shdr_timestamp(t=None):
+    t = time.time() if t is None else t
+    return datetime.fromtimestamp(t, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def _clean(value):
+    # SHDR is pipe-delimited and line-based, so neither may appear inside a value
+    if value is None:
+        return "UNAVAILABLE"
+    if isinstance(value, float):
+        value = f"{value:.6f}".rstrip("0").rstrip(".")
+    return str(value).replace("|", "/").replace("\n", " ").replace("\r", " ")
+
+
+# --- Adapter ---
+class _Client:
+    """One agent connection. Sends are serialized, so lines from different threads never interleave."""
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.lock = threading.Lock()
+
+    def send(self, payload):
+        with self.lock:
+            self.sock.sendall(payload)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)  # wakes the heartbeat thread's recv
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class ShdrAdapter:
+    """Minimal MTConnect adapter: serves SHDR over TCP to any connected agent.
+
+    Updates are buffered and flushed every FLUSH_INTERVAL as few SHDR lines with
+    many key|value pairs each. Newly connected agents receive the full current
+    state first, and "* PING" heartbeats are answered with "* PONG".
+    """
+
+    def __init__(self, host=ADAPTER_HOST, port=ADAPTER_PORT, heartbeat_ms=HEARTBEAT_MS,
+                 flush_interval=FLUSH_INTERVAL):
+        self.host = host
+        self.port = port
+        self.heartbeat_ms = heartbeat_ms
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()  # orders flushes and new agents' snapshots
+        self.current = {}       # key -> last value sent, replayed to new agents
+        self.pending = {}       # key -> value waiting for the next flush
+        self.conditions = {}    # key -> condition fields, one SHDR line each
+        self.pending_conditions = {}
+        self.clients = []
+        self.stop_event = threading.Event()
+        self.server = None
+        self.threads = []
+
+    # -- lifecycle --
+    def start(self):
+        self.server = socket.create_server((self.host, self.port))
+        self.server.settimeout(0.5)
+        self.port = self.server.getsockname()[1]  # resolves port 0 to the bound port
+        for target in (self._accept_loop, self._flush_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        print(f"[SHDR] Adapter listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        self.flush()
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=2)
+        with self.lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+        if self.server:
+            self.server.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # -- observations --
+    def update(self, key, value):
+        with self.lock:
+            if self.current.get(key) != _clean(value) or key in self.pending:
+                self.pending[key] = _clean(value)
+
+    def update_many(self, values):
+        with self.lock:
+            for key, value in values.items():
+                if self.current.get(key) != _clean(value) or key in self.pending:
+                    self.pending[key] = _clean(value)
+
+    def set_condition(self, key, level, native_code="", native_severity="", qualifier="", message=""):
+        """Condition level is NORMAL, WARNING, FAULT or UNAVAILABLE."""
+        fields = [level.upper(), native_code, native_severity, qualifier, message]
+        with self.lock:
+            self.pending_conditions[key] = [_clean(f) for f in fields]
+
+    def flush(self):
+        """Send everything buffered since the last flush."""
+        with self.send_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                conditions, self.pending_conditions = self.pending_conditions, {}
+                self.current.update(pending)
+                self.conditions.update(conditions)
+            if pending or conditions:
+                self._broadcast(self._format_lines(pending, conditions))
+
+    def _format_lines(self, values, conditions, timestamp=None):
+        timestamp = timestamp or shdr_timestamp()
+        lines = []
+        items = list(values.items())
+        for start in range(0, len(items), MAX_ITEMS_PER_LINE):
+            fields = [timestamp]
+            for key, value in items[start:start + MAX_ITEMS_PER_LINE]:
+                fields += [key, value]
+            lines.append("|".join(fields))
+        for key, fields in conditions.items():
+            lines.append("|".join([timestamp, key] + fields))
+        return "".join(line + "\n" for line in lines).encode("utf-8")
+
+    # -- networking --
+    def _broadcast(self, payload):
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.send(payload)
+            except OSError:
+                self._drop(client)
+
+    def _drop(self, client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        client.close()
+
+    def _accept_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                sock, address = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(SEND_TIMEOUT)
+            client = _Client(sock, address)
+            print(f"[SHDR] Agent connected from {address[0]}:{address[1]}")
+            # No flush runs between the snapshot and joining self.clients, so nothing is missed or sent early
+            with self.send_lock:
+                with self.lock:
+                    snapshot = self._format_lines(dict(self.current), dict(self.conditions))
+                try:
+                    client.send(snapshot)
+                except OSError:
+                    client.close()
+                    continue
+                with self.lock:
+                    self.clients.append(client)
+            threading.Thread(target=self._heartbeat_loop, args=(client,), daemon=True).start()
+
+    def _heartbeat_loop(self, client):
+        buffer = b""
+        while not self.stop_event.is_set():
+            try:
+                data = client.sock.recv(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not data:
+                break
+            buffer += data
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                if line.strip().startswith(b"* PING"):
+                    try:
+                        client.send(f"* PONG {self.heartbeat_ms}\n".encode("ascii"))
+                    except OSError:
+                        break
+        self._drop(client)
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+
+# --- Publishing Helpers ---
+def measurement_key(name):
+    return "".join(c if c.isalnum() else "_" for c in name).strip("_").lower()
+
+
+def publish_measurements(adapter, results):
+    """Publish point_cloud_measure.measure_batch results as distance/status data items."""
+    values = {"measurement_count": len(results)}
+    failed = []
+    for result in results:
+        key = measurement_key(result["name"])
+        values[f"{key}_distance"] = result["distance"]
+        values[f"{key}_uncertainty"] = result["uncertainty"]
+        if "nominal" in result and result.get("tolerance") is not None:
+            in_tolerance = abs(result["distance"] - result["nominal"]) <= result["tolerance"]
+            values[f"{key}_status"] = "PASS" if in_tolerance else "FAIL"
+            if not in_tolerance:
+                failed.append(result)
+    # One condition per batch: it clears back to NORMAL once a batch has no failures
+    if failed:
+        adapter.set_condition("measurement_condition", "WARNING", native_code=measurement_key(failed[0]["name"]),
+                              message=", ".join(r["name"] for r in failed) + " out of tolerance")
+    else:
+        adapter.set_condition("measurement_condition", "NORMAL")
+    adapter.update_many(values)
+
+
+def publish_capture_progress(adapter, captured, total, state="ACTIVE"):
+    """Publish capture progress for the robot scan (state: READY, ACTIVE, STOPPED)."""
+    adapter.update_many({
+        "capture_state": state,
+        "capture_image_count": captured,
+        "capture_progress": 100.0 * captured / total if total else 0.0,
+    })
+
+
+# --- Local Stand-in Agent ---
+class LocalAgent:
+    """Connects to an adapter the way an MTConnect agent would and keeps the latest values.
+
+    Used to exercise the adapter end-to-end without installing an agent.
+    """
+
+    def __init__(self, host="127.0.0.1", port=ADAPTER_PORT, ping_interval=1.0):
+        self.sock = socket.create_connection((host, port), timeout=5)
+        self.sock.settimeout(0.5)
+        self.ping_interval = ping_interval
+        self.current = {}
+        self.conditions = {}
+        self.lines_received = 0
+        self.last_pong = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._read_loop, daemon=True)
+        self.thread.start()
+
+    def _handle_line(self, line):
+        if line.startswith("* PONG"):
+            self.last_pong = time.time()
+            return
+        fields = line.split("|")
+        if len(fields) < 3:
+            return
+        with self.lock:
+            self.lines_received += 1
+            if len(fields) == 7 and fields[2] in ("NORMAL", "WARNING", "FAULT", "UNAVAILABLE"):
+                self.conditions[fields[1]] = fields[2:]
+                return
+            for key, value in zip(fields[1::2], fields[2::2]):
+                self.current[key] = value
+
+    def _read_loop(self):
+        buffer = b""
+        next_ping = 0.0
+        while not self.stop_event.is_set():
+            if time.time() >= next_ping:
+                self.sock.sendall(b"* PING\n")
+                next_ping = time.time() + self.ping_interval
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not data:
+                break
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                self._handle_line(line.decode("utf-8").strip())
+
+    def wait_for(self, key, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self.lock:
+                if key in self.current:
+                    return self.current[key]
+            time.sleep(0.01)
+        return None
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join(timeout=2)
+        self.sock.close()
+
+
+# --- MAIN ---
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "demo":
+        # End-to-end check against the local stand-in agent on an ephemeral port
+        with ShdrAdapter(host="127.0.0.1", port=0) as adapter:
+            agent = LocalAgent(port=adapter.port)
+            for i in range(1, 11):
+                publish_capture_progress(adapter, i, 10)
+            publish_measurements(adapter, [
+                {"name": "slot_width", "distance": 18.31, "uncertainty": 0.02, "nominal": 18.0, "tolerance": 0.2},
+                {"name": "step_height", "distance": 9.98, "uncertainty": 0.01},
+            ])
+            publish_capture_progress(adapter, 10, 10, state="READY")
+            agent.wait_for("measurement_count")
+            time.sleep(3 * FLUSH_INTERVAL)
+            print(f"Agent received {agent.lines_received} SHDR lines:")
+            for key, value in sorted(agent.current.items()):
+                print(f"  {key} = {value}")
+            for key, fields in agent.conditions.items():
+                print(f"  {key} [condition] = {fields}")
+            print(f"Heartbeat answered: {agent.last_pong is not None}")
+            agent.close()
+    else:
+        adapter = ShdrAdapter().start()
+        publish_capture_progress(adapter, 0, 0, state="READY")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            adapter.stop()
@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from vector_index import normalize
+
+PROTOTYPES_FILE = "prototypes.npz"
+
+
+def load_reference_classes(ids, class_map_path=None, label_dir=None, default_class=0, known=None):
+    """Class id for each reference crop.
+
+    Looks in a {crop_id: class_id} map first (a JSON file path or a dict; known,
+    e.g. vector_index.verified_classes, takes precedence over it), then in a
+    YOLO label file <label_dir>/<crop_id>.txt (class of its first box), else
+    default_class.
+    """
+    class_map = {}
+    if isinstance(class_map_path, dict):
+        class_map = dict(class_map_path)
+    elif class_map_path and os.path.exists(class_map_path):
+        with open(class_map_path, "r") as f:
+            class_map = {k: int(v) for k, v in json.load(f).items()}
+    class_map.update(known or {})
+
+    classes = np.full(len(ids), default_class, dtype=np.int64)
+    for i, crop_id in enumerate(ids):
+        if crop_id in class_map:
+            classes[i] = class_map[crop_id]
+        elif label_dir:
+            label_path = os.path.join(label_dir, crop_id + ".txt")
+            if os.path.exists(label_path):
+                with open(label_path, "r") as f:
+                    first = f.readline().split()
+                if first:
+                    classes[i] = int(float(first[0]))
+    return classes
+
+
+def k_medoids(vectors, k, iterations=10, max_points=2000, seed=0):
+    """Indices of k medoid rows of unit vectors under cosine distance."""
+    rng = np.random.default_rng(seed)
+    rows = np.arange(len(vectors))
+    if len(rows) > max_points:
+        rows = rng.choice(rows, max_points, replace=False)
+    if len(rows) <= k:
+        return rows
+    similarity = vectors[rows] @ vectors[rows].T
+    medoids = rng.choice(len(rows), k, replace=False)
+    for _ in range(iterations):
+        assignment = np.argmax(similarity[:, medoids], axis=1)
+        updated = medoids.copy()
+        for cluster in range(k):
+            members = np.nonzero(assignment == cluster)[0]
+            if len(members):
+                # the member with the highest total similarity to its cluster is the new medoid
+                updated[cluster] = members[np.argmax(similarity[np.ix_(members, members)].sum(axis=1))]
+        if np.array_equal(updated, medoids):
+            break
+        medoids = updated
+    return rows[medoids]
+
+
+class ClassPrototypes:
+    """One centroid (plus optional medoid sub-prototypes) per class.
+
+    Candidates are scored against K prototypes instead of every reference
+    embedding. A class's score is its best-matching prototype.
+    """
+
+    def __init__(self, vectors=None, classes=None):
+        self.vectors = np.empty((0, 0), dtype=np.float32) if vectors is None else vectors
+        self.classes = np.empty(0, dtype=np.int64) if classes is None else classes
+        self.key = None  # what the prototypes were built from, see prototypes_key()
+
+    @classmethod
+    def build(cls, reference_vectors, reference_classes, sub_prototypes=0):
+        reference_vectors = normalize(reference_vectors)
+        reference_classes = np.asarray(reference_classes)
+        vectors, classes = [], []
+        for class_id in np.unique(reference_classes):
+            members = reference_vectors[reference_classes == class_id]
+            vectors.append(normalize(members.mean(axis=0)))
+            classes.append(class_id)
+            if sub_prototypes > 1:
+                medoids = k_medoids(members, sub_prototypes)
+                vectors.append(members[medoids])
+                classes.extend([class_id] * len(medoids))
+        return cls(np.vstack(vectors).astype(np.float32), np.asarray(classes, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.classes)
+
+    def class_scores(self, queries):
+        """[N, n_classes] best prototype score per class, and the class id of each column."""
+        scores = normalize(queries) @ self.vectors.T
+        class_ids, column = np.unique(self.classes, return_inverse=True)
+        per_class = np.full((len(scores), len(class_ids)), -np.inf, dtype=np.float32)
+        for c in range(len(class_ids)):
+            per_class[:, c] = scores[:, column == c].max(axis=1)
+        return per_class, class_ids
+
+    def classify(self, queries):
+        """(class, score, margin to the runner-up class) per query."""
+        per_class, class_ids = self.class_scores(queries)
+        order = np.argsort(-per_class, axis=1)
+        best = np.take_along_axis(per_class, order[:, :1], axis=1)[:, 0]
+        if per_class.shape[1] > 1:
+            runner_up = np.take_along_axis(per_class, order[:, 1:2], axis=1)[:, 0]
+        else:
+            runner_up = np.full(len(best), -1.0, dtype=np.float32)
+        return class_ids[order[:, 0]], best, best - runner_up
+
+    def save(self, path, key=None):
+        self.key = key or self.key
+        np.savez(path, vectors=self.vectors, classes=self.classes, key=np.array(self.key or ""))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        prototypes = cls(data["vectors"], data["classes"])
+        prototypes.key = str(data["key"]) if "key" in data.files else None
+        return prototypes
+
+
+def prototypes_key(index, classes, sub_prototypes):
+    """What the prototypes were built from: the reference ids, their classes and the sub-prototype count."""
+    digest = hashlib.sha1("\n".join(index.ids).encode("utf-8"))
+    digest.update(np.asarray(classes, dtype=np.int64).tobytes())
+    digest.update(f"|{sub_prototypes}|{json.dumps(index.source, sort_keys=True)}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_or_build_prototypes(index, classes, index_dir, sub_prototypes=0):
+    """Prototypes cached next to a saved reference index, rebuilt when the index, the classes or sub_prototypes change."""
+    path = os.path.join(index_dir, PROTOTYPES_FILE)
+    key = prototypes_key(index, classes, sub_prototypes)
+    if os.path.exists(path):
+        prototypes = ClassPrototypes.load(path)
+        if prototypes.key == key:
+            return prototypes
+    prototypes = ClassPrototypes.build(index.vectors, classes, sub_prototypes)
+    prototypes.save(path, key)
+    return prototypes
+
+
+def lookup_neighbour_classes(reference_classes, neighbour_rows):
+    """Class of each neighbour, and a mask of real neighbours (IVF pads missing ones with row -1)."""
+    valid = neighbour_rows >= 0
+    return np.asarray(reference_classes)[np.where(valid, neighbour_rows, 0)], valid
+
+
+def knn_vote(neighbour_scores, neighbour_classes, valid=None):
+    """Similarity-weighted class vote over each query's k nearest references.
+
+    Returns (class, mean similarity of the winning class's neighbours, vote share).
+    Neighbours outside valid are ignored; a query with none gets class -1 and score -1.
+    """
+    if valid is None:
+        valid = np.isfinite(neighbour_scores)
+    classes = np.full(len(neighbour_scores), -1, dtype=np.int64)
+    scores = np.full(len(neighbour_scores), -1.0, dtype=np.float32)
+    shares = np.zeros(len(neighbour_scores), dtype=np.float32)
+    weights = np.clip(neighbour_scores, 0.0, None)
+    for i in range(len(neighbour_scores)):
+        keep = valid[i]
+        if not keep.any():
+            continue
+        labels, inverse = np.unique(neighbour_classes[i][keep], return_inverse=True)
+        votes = np.bincount(inverse, weights=weights[i][keep], minlength=len(labels))
+        winner = np.argmax(votes)
+        classes[i] = labels[winner]
+        scores[i] = neighbour_scores[i][keep][inverse == winner].mean()
+        shares[i] = votes[winner] / max(votes.sum(), 1e-12)
+    return classes, scores, shares
+
+
+def passes_threshold(classes, scores, class_thresholds, default_threshold):
+    thresholds = np.array([class_thresholds.get(int(c), default_threshold) for c in classes], dtype=np.float32)
+    return scores >= thresholds
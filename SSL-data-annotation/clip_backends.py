@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import numpy as np
+
+# "torch" is the fp32 reference; the others are CPU-oriented drop-ins with the same encode_image()
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+DEFAULT_ONNX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ssl-data-annotation", "onnx")
+ONNX_OPSET = 17
+
+
+def model_id(model_name, backend):
+    """Identifier for caches: embeddings from different backends differ slightly, so they are not mixed."""
+    return model_name if backend == "torch" else f"{model_name}/{backend}"
+
+
+def backend_device(backend):
+    """Device a backend runs on: CUDA for fp32 torch when available, the CPU for the quantized and ONNX backends."""
+    import torch
+    return "cuda" if backend == "torch" and torch.cuda.is_available() else "cpu"
+
+
+def onnx_path(model_name, pretrained, quantized=False, cache_dir=DEFAULT_ONNX_DIR):
+    suffix = "-int8" if quantized else ""
+    return os.path.join(cache_dir, f"{model_name}-{pretrained}-visual{suffix}.onnx")
+
+
+def export_onnx(model, path, image_size=224):
+    """Export the image tower of an open_clip model to ONNX with a dynamic batch axis."""
+    import torch
+
+    class _ImageEncoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, image):
+            return self.model.encode_image(image)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    model = model.to("cpu").eval()
+    dummy = torch.zeros(1, 3, image_size, image_size)
+    # Export to a temp name so an interrupted export is never mistaken for a cached model
+    tmp_path = path + ".part"
+    with torch.inference_mode():
+        torch.onnx.export(
+            _ImageEncoder(model), dummy, tmp_path,
+            input_names=["image"], output_names=["embedding"],
+            dynamic_axes={"image": {0: "batch"}, "embedding": {0: "batch"}},
+            opset_version=ONNX_OPSET,
+        )
+    os.replace(tmp_path, path)
+    return path
+
+
+def quantize_onnx(fp32_path, int8_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp_path = int8_path + ".part"
+    quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, int8_path)
+    return int8_path
+
+
+class OnnxImageEncoder:
+    """ONNX Runtime session with the encode_image() interface of an open_clip model."""
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def encode_image(self, images):
+        import torch
+        outputs = self.session.run(None, {"image": images.detach().cpu().numpy().astype(np.float32)})
+        return torch.from_numpy(outputs[0])
+
+    # No-ops so callers can treat this like a torch module
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+
+def quantize_torch(model):
+    """Dynamic int8 quantization of the Linear layers (CPU only)."""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model.to("cpu").eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def wrap_model(model, backend="torch", device="cpu", model_name="ViT-B-32", pretrained="openai",
+               image_size=224, cache_dir=DEFAULT_ONNX_DIR, threads=None):
+    """Return an object with encode_image() for the chosen backend, built from an fp32 open_clip model.
+
+    ONNX exports are cached in cache_dir, so the export cost is paid once per model.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "torch":
+        return model.to(device).eval()
+    if device != "cpu":
+        raise ValueError(f"Backend {backend!r} runs on the CPU only; use 'torch' on {device}")
+    if backend == "torch-int8":
+        return quantize_torch(model)
+
+    fp32_path = onnx_path(model_name, pretrained, cache_dir=cache_dir)
+    if not os.path.exists(fp32_path):
+        print(f"Exporting {model_name} image encoder to {fp32_path}")
+        export_onnx(model, fp32_path, image_size)
+    path = fp32_path
+    if backend == "onnx-int8":
+        path = onnx_path(model_name, pretrained, quantized=True, cache_dir=cache_dir)
+        if not os.path.exists(path):
+            quantize_onnx(fp32_path, path)
+    return OnnxImageEncoder(path, threads)
+
+
+def validate(image_dir, backends=BACKENDS[1:], n_images=256, batch_size=32):
+    """Compare each backend's embeddings and speed with the fp32 torch model on a sample of images."""
+    import torch
+    from PIL import Image
+    from extract_clip_features import custom_preprocess, list_images, load_model, model_name
+
+    filenames = list_images(image_dir)[:n_images]
+    if not filenames:
+        print(f"No images found in {image_dir}")
+        return {}
+    preprocess = custom_preprocess()
+    tensors = torch.stack([preprocess(Image.open(os.path.join(image_dir, f)).convert("RGB")) for f in filenames])
+    batches = torch.split(tensors, batch_size)
+
+    def run(model):
+        with torch.inference_mode():
+            model.encode_image(batches[0])  # warm-up: lazy init, allocator, ORT graph optimization
+            start = time.time()
+            features = torch.cat([model.encode_image(b).float() for b in batches])
+        return torch.nn.functional.normalize(features, dim=1), len(filenames) / max(time.time() - start, 1e-9)
+
+    reference_model = load_model("cpu", backend="torch")
+    reference, reference_speed = run(reference_model)
+    report = {"torch": {"images_per_s": reference_speed, "mean_cosine": 1.0, "min_cosine": 1.0}}
+    for backend in backends:
+        features, speed = run(wrap_model(reference_model, backend, model_name=model_name))
+        cosine = (features * reference).sum(dim=1)
+        report[backend] = {"images_per_s": speed, "mean_cosine": cosine.mean().item(), "min_cosine": cosine.min().item()}
+
+    print(f"{len(filenames)} images, batch size {batch_size}, {torch.get_num_threads()} torch threads")
+    print(f"{'backend':<12}{'images/s':>10}{'speedup':>9}{'mean cos':>10}{'min cos':>9}")
+    for backend, row in report.items():
+        print(f"{backend:<12}{row['images_per_s']:>10.1f}{row['images_per_s'] / reference_speed:>8.2f}x"
+              f"{row['mean_cosine']:>10.4f}{row['min_cosine']:>9.4f}")
+    return report
+
+
+if __name__ == "__main__":
+    # python clip_backends.py validate <image_dir> [backend ...]
+    if len(sys.argv) < 3 or sys.argv[1] != "validate":
+        print("usage: python clip_backends.py validate <image_dir> [backend ...]")
+        sys.exit(1)
+    validate(sys.argv[2], sys.argv[3:] or BACKENDS[1:])
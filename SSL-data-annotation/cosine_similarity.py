@@ -1,62 +1,96 @@
 import os
 import json
-import torch
-import numpy as np
 from tqdm import tqdm
-from sklearn.metrics.pairwise import cosine_similarity
+
+from feature_store import FeatureStore
+from vector_index import load_or_build_index, verified_classes
+from class_prototypes import load_or_build_prototypes, load_reference_classes, knn_vote, lookup_neighbour_classes, passes_threshold
 
 # --- Config ---
-reference_dir = "original_candidate_features"
+reference_dir = "original_candidate_features"  # feature store directories (see feature_store.py)
 candidate_dir = "yolo_candidate_features"
-metadata_path = "crop_metadata.json"
+metadata_path = "crop_metadata.jsonl"  # written by yolo_candidate_crops.py (older runs: crop_metadata.json)
 output_label_dir = "yolo_pseudo_labels"
+scores_path = os.path.join(output_label_dir, "pseudo_label_scores.jsonl")  # score of every candidate, read by datavalidation.py / evaluate.py
+reference_index_dir = "reference_index"  # persisted search index over the reference features
+index_kind = "exact"  # "exact" (chunked matmul) or "ivf" (approximate, for very large reference sets)
 os.makedirs(output_label_dir, exist_ok=True)
 
 similarity_threshold = 0.4  # You can tune this
+class_thresholds = {}  # per-class overrides, e.g. {2: 0.55}
+
+# --- Classes ---
+reference_classes_path = "reference_classes.json"  # {reference crop id: class id}
+reference_label_dir = None  # or a dir of YOLO .txt labels named after the reference crops
+scoring_mode = "prototype"  # "prototype" (class centroids) or "knn" (vote over nearest references)
+sub_prototypes = 0  # extra k-medoid prototypes per class for multi-modal classes (0 = centroid only)
+knn_k = 5
 
 # --- Load crop metadata ---
 with open(metadata_path, "r") as f:
-    crop_metadata = json.load(f)
+    if metadata_path.endswith(".jsonl"):
+        crop_metadata = [json.loads(line) for line in f if line.strip()]
+    else:
+        crop_metadata = json.load(f)
 
 # Build a lookup from crop filename to metadata
 metadata_lookup = {entry["crop_filename"].replace(".jpg", ""): entry for entry in crop_metadata}
 
-# --- Load reference features ---
-reference_features = []
-for fname in os.listdir(reference_dir):
-    if fname.endswith(".pt"):
-        vec = torch.load(os.path.join(reference_dir, fname)).numpy()
-        reference_features.append(vec)
-reference_matrix = np.stack(reference_features)  # [N_ref, dim]
+# --- Load or build the reference index (normalized once, reused across runs) ---
+reference_index = load_or_build_index(reference_index_dir, reference_dir, kind=index_kind)
+reference_classes = load_reference_classes(reference_index.ids, reference_classes_path, reference_label_dir,
+                                           known=verified_classes(reference_index_dir))
+
+# --- Score all candidates in one batched pass ---
+candidate_store = FeatureStore(candidate_dir)
+candidate_ids = [crop_id for crop_id in candidate_store.ids if crop_id in metadata_lookup]
+candidate_vectors = candidate_store.get(candidate_ids)
+
+if scoring_mode == "knn":
+    neighbour_scores, neighbour_rows = reference_index.search(candidate_vectors, k=knn_k)
+    # Vote share (1.0 = every neighbour agreed) is written as its own field, not on the cosine margin scale
+    pred_classes, pred_scores, pred_margins = knn_vote(neighbour_scores, *lookup_neighbour_classes(reference_classes, neighbour_rows))
+else:
+    prototypes = load_or_build_prototypes(reference_index, reference_classes, reference_index_dir, sub_prototypes)
+    pred_classes, pred_scores, pred_margins = prototypes.classify(candidate_vectors)
+
+accepted = passes_threshold(pred_classes, pred_scores, class_thresholds, similarity_threshold)
 
 # --- Process each candidate ---
-matches_per_image = {}
-
-for fname in tqdm(os.listdir(candidate_dir)):
-    if not fname.endswith(".pt"):
-        continue
-
-    crop_id = os.path.splitext(fname)[0]
-    if crop_id not in metadata_lookup:
-        continue
-
-    vec = torch.load(os.path.join(candidate_dir, fname)).numpy().reshape(1, -1)
-    sims = cosine_similarity(vec, reference_matrix)
-    max_sim = sims.max()
-
-    if max_sim >= similarity_threshold:
-        meta = metadata_lookup[crop_id]
-        x, y, w, h = meta["bbox"]
-        img_w, img_h = meta["image_size"]
-        cx = (x + w / 2) / img_w
-        cy = (y + h / 2) / img_h
-        nw = w / img_w
-        nh = h / img_h
-
-        label_line = f"0 {cx:.6f} {cy:.6f} {nw:.6f} {nh:.6f}\n"
-        out_name = os.path.splitext(meta["source_image"])[0] + ".txt"
-        out_path = os.path.join(output_label_dir, out_name)
-        with open(out_path, "a") as f:
-            f.write(label_line)
+lines_per_image = {}  # source image -> label lines, so each label file is written once
+scores_file = open(scores_path + ".part", "w")  # rewritten each run, so no rows for crops that are gone
+for crop_id, class_id, score, margin, keep in zip(tqdm(candidate_ids), pred_classes, pred_scores, pred_margins, accepted):
+    meta = metadata_lookup[crop_id]
+    x, y, w, h = meta["bbox"]
+    img_w, img_h = meta["image_size"]
+    cx = (x + w / 2) / img_w
+    cy = (y + h / 2) / img_h
+    nw = w / img_w
+    nh = h / img_h
+
+    if keep:
+        label_line = f"{int(class_id)} {cx:.6f} {cy:.6f} {nw:.6f} {nh:.6f}\n"
+        lines_per_image.setdefault(meta["source_image"], []).append(label_line)
+    # Rejected candidates are recorded too, so evaluate.py can sweep thresholds without rerunning
+    scores_file.write(json.dumps({
+        "image": meta["source_image"],
+        "crop": crop_id,
+        "class": int(class_id),
+        "score": round(float(score), 4),
+        "vote_share" if scoring_mode == "knn" else "margin": round(float(margin), 4),
+        "box": [round(cx, 6), round(cy, 6), round(nw, 6), round(nh, 6)],
+        "accepted": bool(keep),
+    }) + "\n")
+scores_file.close()
+os.replace(scores_path + ".part", scores_path)
+
+for source_image in {metadata_lookup[crop_id]["source_image"] for crop_id in candidate_ids}:
+    out_path = os.path.join(output_label_dir, os.path.splitext(source_image)[0] + ".txt")
+    lines = lines_per_image.get(source_image)
+    if lines:
+        with open(out_path, "w") as f:
+            f.writelines(lines)
+    elif os.path.exists(out_path):
+        os.remove(out_path)  # every candidate is now rejected: drop the labels an earlier run wrote
 
 print(f"Pseudo-labeling complete. YOLO .txt files saved to: {output_label_dir}")
@@ -1,6 +1,15 @@
 import cv2
 import os
+import json
+import time
+import queue
 import shutil
+import threading
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from extract_frames import frame_hash
 
 # Config
 image_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\yolo_candidate_crops" #psuedo images to review
@@ -9,11 +18,26 @@ discard_label_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verificatio
 discard_image_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\difficult_images" #unlabeled images
 verified_image_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\verified_images"
 verified_label_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\verified_labels"
+journal_path = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\review_journal.jsonl" #every decision, in order
+
+# Review settings
+prefetch_count = 8 #images decoded and drawn ahead of the one on screen
+move_batch_size = 20 #file moves applied together in the background
+undo_depth = 20 #most recent decisions held back from disk so undo is instant
+grid_mode = False #review many crops per screen
+grid_rows, grid_cols = 3, 3
+grid_cell = 256 #pixels per grid cell
+
+# Active review
+scores_path = os.path.join(label_dir, "pseudo_label_scores.jsonl") #written by cosine_similarity.py / fused_pipeline.py
+review_crops = True #image_dir holds YOLO crops, so scores are looked up per crop; False when reviewing source images
+order_by_uncertainty = True #least confident images first; unscored images come before everything else
+auto_accept_score = 0.85 #keep without review when every label is at least this similar... (None disables)
+auto_accept_margin = 0.10 #...and at least this far ahead of the runner-up class (prototype scoring)
+auto_accept_vote_share = 0.80 #...or won at least this share of the nearest-neighbour vote (knn scoring)
+duplicate_threshold = 4 #bits of a 64-bit image hash; near-duplicates share one decision (None disables)
 
-os.makedirs(discard_label_dir, exist_ok=True)
-os.makedirs(discard_image_dir, exist_ok=True)
-os.makedirs(verified_image_dir, exist_ok=True)
-os.makedirs(verified_label_dir, exist_ok=True)
+WINDOW = "Review Pseudo Labels"
 
 def draw_yolo_boxes(image, label_path):
 	h, w = image.shape[:2]
@@ -33,39 +57,339 @@ def draw_yolo_boxes(image, label_path):
 			cv2.putText(image, str(int(cls)), (x1, y1 -10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
 		return image
 
-# Sort for consistent order
-image_files = sorted([f for f in os.listdir(image_dir) if f.lower().endswith((".jpg", ".png", ".jpeg"))])
+def label_path_for(filename):
+	return os.path.join(label_dir, os.path.splitext(filename)[0] + ".txt")
 
-for filename in image_files:
-	image_path = os.path.join(image_dir, filename)
-	label_path = os.path.join(label_dir, filename.replace(".jpg", ".txt").replace(".png", ".txt"))
-	
-	img = cv2.imread(image_path)
+def render(filename):
+	img = cv2.imread(os.path.join(image_dir, filename))
 	if img is None:
-		print("Failed to load:", image_path)
-		continue
-
-	img_with_boxes = draw_yolo_boxes(img.copy(), label_path)
-	cv2.imshow("Review Pseudo Labels", img_with_boxes)
-
-	print(f"Reviewing {filename} -- Press k to KEEP, d to DISCARD, or q to quit.")
-
-	while True:
-		key = cv2.waitKey(0)
-		if key == ord('q'): #ESC
-			print("Exit requested")
-			exit()
-		elif key == ord('d'): # discard
-			print(f"Discarded {filename}")
-			shutil.move(image_path, os.path.join(discard_image_dir, filename))
-			if os.path.exists(label_path):
-				shutil.move(label_path, os.path.join(discard_label_dir, os.path.basename(label_path)))
-			break
-		elif key == ord('k'): # Keep
-			print(f"Kept {filename}")
-			shutil.move(image_path, os.path.join(verified_image_dir, filename))
-			if os.path.exists(label_path):
-				shutil.move(label_path, os.path.join(verified_label_dir, os.path.basename(label_path)))
-			break
-
-cv2.destroyAllWindows()
\ No newline at end of file
+		return None
+	return draw_yolo_boxes(img, label_path_for(filename))
+
+def confidence_key(filename):
+	return os.path.splitext(filename)[0]
+
+def load_confidence(path, by_crop=review_crops):
+	"""{crop id or image name without extension: (lowest margin, lowest vote share, lowest score)} over its labels.
+
+	Prototype scoring writes a margin and knn scoring a vote share; the
+	field a row does not have counts as infinite.
+	"""
+	if not os.path.exists(path):
+		return {}
+	latest = {}
+	with open(path, "r") as f:
+		for line in f:
+			if line.strip():
+				row = json.loads(line)
+				latest[(row["image"], row["crop"])] = row #reruns append; the last row per crop wins
+	confidence = {}
+	inf = float("inf")
+	for (image, crop), row in latest.items():
+		if not row.get("accepted", True):
+			continue #rejected candidates have no label line to review
+		key = crop if by_crop else confidence_key(image)
+		margin, vote_share, score = confidence.get(key, (inf, inf, inf))
+		confidence[key] = (min(margin, row.get("margin", inf)), min(vote_share, row.get("vote_share", inf)), min(score, row["score"]))
+	return confidence
+
+def confidence_of(confidence, filename):
+	"""(margin, vote share, score) for a file under review; unscored files get -inf so they sort first."""
+	return confidence.get(confidence_key(filename), (float("-inf"), float("-inf"), float("-inf")))
+
+def image_hash(filename):
+	img = cv2.imread(os.path.join(image_dir, filename))
+	return None if img is None else frame_hash(img)
+
+def cluster_near_duplicates(filenames, threshold, workers=8):
+	"""Group filenames whose image hashes differ by at most threshold bits.
+
+	Greedy and order preserving: each image joins the first earlier cluster
+	whose representative is close enough, so the first member of every
+	cluster is its most uncertain one when filenames are in review order.
+	"""
+	with ThreadPoolExecutor(workers) as pool:
+		hashes = list(pool.map(image_hash, filenames))
+	clusters = []
+	representatives = np.zeros((len(filenames), 8), dtype=np.uint8) #hash of each hashable cluster's first member
+	rep_cluster = [] #row in representatives -> index in clusters
+	for filename, h in zip(filenames, hashes):
+		if h is not None and rep_cluster:
+			distances = np.unpackbits(representatives[:len(rep_cluster)] ^ h, axis=1).sum(axis=1)
+			nearest = int(distances.argmin())
+			if distances[nearest] <= threshold:
+				clusters[rep_cluster[nearest]].append(filename)
+				continue
+		clusters.append([filename])
+		if h is not None:
+			representatives[len(rep_cluster)] = h
+			rep_cluster.append(len(clusters) - 1)
+	return clusters
+
+class Prefetcher:
+	"""Background thread that decodes and draws the images around the current position."""
+	def __init__(self, filenames, depth, keep_behind=undo_depth):
+		self.filenames = filenames
+		self.depth = depth
+		self.keep_behind = keep_behind
+		self.rendered = {}
+		self.position = 0
+		self.cond = threading.Condition()
+		self.stopped = False
+		self.thread = threading.Thread(target=self._run, daemon=True)
+		self.thread.start()
+
+	def _next_missing(self):
+		for i in range(self.position, min(self.position + self.depth, len(self.filenames))):
+			if i not in self.rendered:
+				return i
+		return None
+
+	def _run(self):
+		while True:
+			with self.cond:
+				while not self.stopped and self._next_missing() is None:
+					self.cond.wait()
+				if self.stopped:
+					return
+				i = self._next_missing()
+			try:
+				image = render(self.filenames[i]) #decode outside the lock
+			except Exception as e:
+				print(f"Failed to render {self.filenames[i]}: {e}")
+				image = None #shown as a failed load, so get(i) never waits on a dead thread
+			with self.cond:
+				self.rendered[i] = image
+				# drop images far behind the position; undo only ever needs the recent ones
+				for old in [j for j in self.rendered if j < self.position - self.keep_behind]:
+					del self.rendered[old]
+				self.cond.notify_all()
+
+	def get(self, i):
+		with self.cond:
+			self.position = i
+			self.cond.notify_all()
+			while i not in self.rendered:
+				self.cond.wait()
+			return self.rendered[i]
+
+	def stop(self):
+		with self.cond:
+			self.stopped = True
+			self.cond.notify_all()
+
+class DecisionJournal:
+	"""Records decisions, supports undo, and applies file moves in background batches.
+
+	The newest undo_depth decisions are kept pending, so undoing them never
+	touches the disk. Older decisions are moved by a worker thread.
+	"""
+	def __init__(self, path):
+		self.journal = open(path, "a")
+		self.pending = deque()
+		self.jobs = queue.Queue()
+		self.worker = threading.Thread(target=self._apply_loop, daemon=True)
+		self.worker.start()
+
+	def _log(self, entry):
+		entry["time"] = time.time()
+		self.journal.write(json.dumps(entry) + "\n")
+		self.journal.flush()
+
+	def record(self, group, decision):
+		"""One decision for a group of near-duplicate images (usually just one)."""
+		self.pending.append((group, decision))
+		self._log({"files": group, "decision": decision})
+		if len(self.pending) >= undo_depth + move_batch_size:
+			self.jobs.put([self.pending.popleft() for _ in range(move_batch_size)])
+
+	def accept_now(self, groups):
+		"""Keep groups that were never shown; they go straight to the mover and cannot be undone."""
+		for group in groups:
+			self._log({"files": group, "decision": "keep", "auto": True})
+		for start in range(0, len(groups), move_batch_size):
+			self.jobs.put([(group, "keep") for group in groups[start:start + move_batch_size]])
+
+	def undo(self):
+		"""Withdraw the newest pending decision and return its group."""
+		if not self.pending:
+			return None
+		group, decision = self.pending.pop()
+		self._log({"files": group, "decision": "undo", "undone": decision})
+		return group
+
+	def _apply_loop(self):
+		while True:
+			batch = self.jobs.get()
+			if batch is None:
+				return
+			for group, decision in batch:
+				if decision == "keep":
+					image_dest, label_dest = verified_image_dir, verified_label_dir
+				else:
+					image_dest, label_dest = discard_image_dir, discard_label_dir
+				for filename in group:
+					try:
+						shutil.move(os.path.join(image_dir, filename), os.path.join(image_dest, filename))
+						label_path = label_path_for(filename)
+						if os.path.exists(label_path):
+							shutil.move(label_path, os.path.join(label_dest, os.path.basename(label_path)))
+					except OSError as e:
+						print(f"Failed to move {filename}: {e}")
+
+	def close(self):
+		"""Apply everything still pending and wait for the mover to finish."""
+		if self.pending:
+			self.jobs.put(list(self.pending))
+			self.pending.clear()
+		self.jobs.put(None)
+		self.worker.join()
+		self.journal.close()
+
+def describe(group, confidence):
+	text = group[0]
+	if len(group) > 1:
+		text += f" (+{len(group) - 1} near-duplicates)"
+	if confidence_key(group[0]) in confidence:
+		margin, vote_share, score = confidence_of(confidence, group[0])
+		text += f" score {score:.2f}"
+		if margin != float("inf"):
+			text += f" margin {margin:.2f}"
+		if vote_share != float("inf"):
+			text += f" vote {vote_share:.2f}"
+	return text
+
+def review_single(groups, prefetcher, journal, confidence):
+	position = {group[0]: i for i, group in enumerate(groups)}
+	i = 0
+	while i < len(groups):
+		group = groups[i]
+		img = prefetcher.get(i)
+		if img is None:
+			print("Failed to load:", os.path.join(image_dir, group[0]))
+			i += 1
+			continue
+
+		cv2.imshow(WINDOW, img)
+		print(f"[{i + 1}/{len(groups)}] Reviewing {describe(group, confidence)} -- k KEEP, d DISCARD, u UNDO, q quit.")
+
+		while True:
+			key = cv2.waitKey(0)
+			if key == ord('q'):
+				print("Exit requested")
+				return
+			elif key in (ord('k'), ord('d')):
+				decision = "keep" if key == ord('k') else "discard"
+				print(f"{'Kept' if decision == 'keep' else 'Discarded'} {len(group)} image(s)")
+				journal.record(group, decision)
+				i += 1
+				break
+			elif key == ord('u'):
+				undone = journal.undo()
+				if undone is None:
+					print("Nothing left to undo.")
+					continue
+				print(f"Undid decision on {undone[0]}")
+				i = position[undone[0]]
+				break
+
+def compose_grid(images, rejected):
+	canvas = np.zeros((grid_rows * grid_cell, grid_cols * grid_cell, 3), dtype=np.uint8)
+	for n, img in enumerate(images):
+		r, c = divmod(n, grid_cols)
+		y, x = r * grid_cell, c * grid_cell
+		if img is not None:
+			scale = grid_cell / max(img.shape[:2])
+			thumb = cv2.resize(img, (max(1, int(img.shape[1] * scale)), max(1, int(img.shape[0] * scale))))
+			canvas[y:y + thumb.shape[0], x:x + thumb.shape[1]] = thumb
+		color = (0, 0, 255) if n in rejected else (0, 255, 0)
+		cv2.rectangle(canvas, (x, y), (x + grid_cell - 1, y + grid_cell - 1), color, 2)
+		cv2.putText(canvas, str(n + 1), (x + 8, y + 28), cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
+		if n in rejected:
+			cv2.line(canvas, (x, y), (x + grid_cell - 1, y + grid_cell - 1), color, 2)
+			cv2.line(canvas, (x + grid_cell - 1, y), (x, y + grid_cell - 1), color, 2)
+	return canvas
+
+def review_grid(groups, prefetcher, journal, confidence):
+	cells = grid_rows * grid_cols
+	pages = [] #start index of each applied page, for undo
+	i = 0
+	while i < len(groups):
+		page = groups[i:i + cells]
+		images = [prefetcher.get(j) for j in range(i, i + len(page))]
+		rejected = {n for n, img in enumerate(images) if img is None}
+		print(f"[{i + 1}-{i + len(page)}/{len(groups)}] 1-{len(page)} toggle DISCARD, space/a ACCEPT page, u UNDO page, q quit.")
+		for n, group in enumerate(page):
+			print(f"  {n + 1}: {describe(group, confidence)}")
+
+		while True:
+			cv2.imshow(WINDOW, compose_grid(images, rejected))
+			key = cv2.waitKey(0)
+			if key == ord('q'):
+				print("Exit requested")
+				return
+			elif ord('1') <= key < ord('1') + len(page):
+				rejected ^= {key - ord('1')}
+			elif key in (ord(' '), ord('a')):
+				for n, group in enumerate(page):
+					journal.record(group, "discard" if n in rejected else "keep")
+				print(f"Kept {len(page) - len(rejected)}, discarded {len(rejected)}")
+				pages.append(i)
+				i += len(page)
+				break
+			elif key == ord('u'):
+				if not pages or len(journal.pending) < i - pages[-1]:
+					print("Nothing left to undo.")
+					continue
+				start = pages.pop()
+				for _ in range(i - start):
+					journal.undo()
+				print(f"Undid page starting at {groups[start][0]}")
+				i = start
+				break
+
+def is_confident(group, confidence):
+	if auto_accept_score is None:
+		return False
+	for filename in group:
+		margin, vote_share, score = confidence_of(confidence, filename)
+		if score < auto_accept_score or margin < auto_accept_margin or vote_share < auto_accept_vote_share:
+			return False
+	return True
+
+def review(filenames):
+	for d in (discard_label_dir, discard_image_dir, verified_image_dir, verified_label_dir):
+		os.makedirs(d, exist_ok=True)
+
+	confidence = load_confidence(scores_path)
+	if order_by_uncertainty:
+		# smallest margin (or vote share) first, then lowest score; images without scores sort before all scored ones
+		filenames = sorted(filenames, key=lambda f: confidence_of(confidence, f))
+	if duplicate_threshold is not None:
+		groups = cluster_near_duplicates(filenames, duplicate_threshold)
+	else:
+		groups = [[f] for f in filenames]
+
+	journal = DecisionJournal(journal_path)
+	auto = [g for g in groups if is_confident(g, confidence)]
+	groups = [g for g in groups if not is_confident(g, confidence)]
+	journal.accept_now(auto)
+	print(f"{len(filenames)} images: {len(auto)} group(s) auto-accepted, {len(groups)} to review")
+
+	depth = max(prefetch_count, 2 * grid_rows * grid_cols) if grid_mode else prefetch_count
+	prefetcher = Prefetcher([g[0] for g in groups], depth)
+	try:
+		if grid_mode:
+			review_grid(groups, prefetcher, journal, confidence)
+		else:
+			review_single(groups, prefetcher, journal, confidence)
+	finally:
+		prefetcher.stop()
+		print("Applying remaining file moves...")
+		journal.close()
+		cv2.destroyAllWindows()
+
+if __name__ == "__main__":
+	# Sort for consistent order
+	image_files = sorted([f for f in os.listdir(image_dir) if f.lower().endswith((".jpg", ".png", ".jpeg"))])
+	review(image_files)
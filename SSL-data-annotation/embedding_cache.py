@@ -0,0 +1,109 @@
+import os
+import time
+import sqlite3
+import hashlib
+import numpy as np
+
+# Shared by every SSL script regardless of working directory
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ssl-data-annotation", "embeddings.sqlite")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # evict least recently used vectors beyond this
+EVICT_TO = 0.9  # fraction of max_bytes left after an eviction pass
+LOOKUP_CHUNK = 500  # keys per SQL query (SQLite limits bound parameters)
+
+
+def content_key(image_bytes, model_name, preprocess_id):
+    """Cache key: hash of the image bytes plus the model and preprocessing that embed them."""
+    digest = hashlib.sha1(image_bytes)
+    digest.update(f"|{model_name}|{preprocess_id}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def file_key(path, model_name, preprocess_id):
+    with open(path, "rb") as f:
+        return content_key(f.read(), model_name, preprocess_id)
+
+
+class EmbeddingCache:
+    """Content-addressed, size-bounded on-disk cache of embedding vectors (SQLite, LRU eviction)."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, dtype="float16"):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, dtype TEXT NOT NULL, last_used REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        # Total vector bytes, kept current by triggers so the budget check never scans the table.
+        # Caches created before the counter existed are summed once here.
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.db.execute("INSERT OR IGNORE INTO meta VALUES ('bytes', "
+                        "(SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings))")
+        self.db.execute("CREATE TRIGGER IF NOT EXISTS embeddings_insert AFTER INSERT ON embeddings BEGIN "
+                        "UPDATE meta SET value = value + LENGTH(NEW.vector) WHERE name = 'bytes'; END")
+        self.db.execute("CREATE TRIGGER IF NOT EXISTS embeddings_update AFTER UPDATE OF vector ON embeddings BEGIN "
+                        "UPDATE meta SET value = value + LENGTH(NEW.vector) - LENGTH(OLD.vector) WHERE name = 'bytes'; END")
+        self.db.execute("CREATE TRIGGER IF NOT EXISTS embeddings_delete AFTER DELETE ON embeddings BEGIN "
+                        "UPDATE meta SET value = value - LENGTH(OLD.vector) WHERE name = 'bytes'; END")
+        self.db.commit()
+
+    def get_many(self, keys):
+        """{key: float32 vector} for every key present; hits are marked as recently used."""
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start:start + LOOKUP_CHUNK]
+            rows = self.db.execute(
+                f"SELECT key, vector, dtype FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            for key, blob, dtype in rows:
+                found[key] = np.frombuffer(blob, dtype=dtype).astype(np.float32)
+        if found:
+            now = time.time()
+            self.db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+            self.db.commit()
+        return found
+
+    def put_many(self, items):
+        """Store {key: vector} and evict the least recently used entries if over budget."""
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=self.dtype).tobytes(), self.dtype.name, now)
+                for key, vector in items.items()]
+        # An upsert rather than INSERT OR REPLACE: REPLACE deletes without firing the delete trigger
+        self.db.executemany(
+            "INSERT INTO embeddings VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+            "vector = excluded.vector, dtype = excluded.dtype, last_used = excluded.last_used", rows)
+        self.db.commit()
+        self.evict()
+
+    def size_bytes(self):
+        return self.db.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+
+    def evict(self):
+        excess = self.size_bytes() - self.max_bytes
+        if excess <= 0:
+            return 0
+        target = excess + (1.0 - EVICT_TO) * self.max_bytes
+        removed, freed = [], 0
+        for key, size in self.db.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used"):
+            removed.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        self.db.executemany("DELETE FROM embeddings WHERE key = ?", removed)
+        self.db.commit()
+        return len(removed)
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import numpy as np
+
+# --- Config ---
+ground_truth_dir = "standard20/heldout_labels"  # YOLO .txt labels of the held-out images
+scores_path = os.path.join("yolo_pseudo_labels", "pseudo_label_scores.jsonl")  # from cosine_similarity.py / fused_pipeline.py
+score_threshold = 0.4  # similarity_threshold used in cosine_similarity.py, for the precision / recall line
+IOU_THRESHOLDS = np.round(np.arange(0.5, 0.96, 0.05), 2)  # COCO mAP@[.5:.95]
+SWEEP_THRESHOLDS = np.round(np.arange(0.20, 0.951, 0.025), 3)  # similarity thresholds to try
+RECALL_POINTS = np.linspace(0, 1, 101)
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "eval_synthetic")
+
+
+# --- Loading ---
+def load_ground_truth(label_dir):
+    """{image stem: (classes [n], boxes [n, 4] as normalized cx, cy, w, h)} from YOLO .txt files."""
+    ground_truth = {}
+    for filename in sorted(os.listdir(label_dir)):
+        if not filename.endswith(".txt"):
+            continue
+        rows = np.loadtxt(os.path.join(label_dir, filename), ndmin=2)
+        if rows.size == 0:
+            rows = np.zeros((0, 5))
+        ground_truth[os.path.splitext(filename)[0]] = (rows[:, 0].astype(np.int64), rows[:, 1:5])
+    return ground_truth
+
+
+def load_predictions(scores_path, include_rejected=True):
+    """{image stem: (classes, scores, boxes)} from a pseudo_label_scores.jsonl file.
+
+    Rejected candidates (below the similarity threshold used at labeling time)
+    are included by default so that lower thresholds can be evaluated too.
+    """
+    latest = {}
+    with open(scores_path, "r") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                if "box" in row:
+                    latest[(row["image"], row["crop"])] = row  # reruns append; the last row per crop wins
+    grouped = {}
+    for (image, _), row in latest.items():
+        if not include_rejected and not row.get("accepted", True):
+            continue  # filtered after the dedupe, so a crop rejected by the latest run stays rejected
+        grouped.setdefault(os.path.splitext(image)[0], []).append(row)
+    return {
+        image: (np.array([r["class"] for r in rows], dtype=np.int64),
+                np.array([r["score"] for r in rows], dtype=np.float64),
+                np.array([r["box"] for r in rows], dtype=np.float64).reshape(-1, 4))
+        for image, rows in grouped.items()
+    }
+
+
+# --- Geometry / matching ---
+def xywh_to_xyxy(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    half = boxes[:, 2:] / 2
+    return np.hstack([boxes[:, :2] - half, boxes[:, :2] + half])
+
+
+def iou_matrix(a, b):
+    """[N, M] IoU between xyxy boxes a [N, 4] and b [M, 4]."""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-12), 0.0)
+
+
+def match_image(pred_classes, pred_scores, pred_boxes, gt_classes, gt_boxes, iou_thresholds=IOU_THRESHOLDS):
+    """Greedy COCO-style matching at every IoU threshold at once.
+
+    Predictions are taken in descending score order; each claims the
+    unmatched same-class ground truth box with the highest IoU above the
+    threshold. Returns (order, tp) with tp [T, P] for the sorted predictions.
+    Because higher-scored predictions never depend on lower-scored ones,
+    the matches of any score-threshold prefix equal these matches.
+    """
+    order = np.argsort(-pred_scores, kind="stable")
+    thresholds = np.asarray(iou_thresholds)[:, None]
+    tp = np.zeros((len(thresholds), len(order)), dtype=bool)
+    if len(order) == 0 or len(gt_classes) == 0:
+        return order, tp
+    ious = iou_matrix(xywh_to_xyxy(pred_boxes[order]), xywh_to_xyxy(gt_boxes))
+    ious[pred_classes[order][:, None] != gt_classes[None, :]] = 0.0
+    taken = np.zeros((len(thresholds), len(gt_classes)), dtype=bool)
+    for p in range(len(order)):
+        candidates = np.where((ious[p][None, :] >= thresholds) & ~taken, ious[p][None, :], -1.0)  # [T, G]
+        best = candidates.argmax(axis=1)
+        hit = candidates[np.arange(len(thresholds)), best] >= 0
+        tp[hit, p] = True
+        taken[np.flatnonzero(hit), best[hit]] = True
+    return order, tp
+
+
+def match_all(predictions, ground_truth, iou_thresholds=IOU_THRESHOLDS):
+    """Concatenate per-image matches: (classes [P], scores [P], tp [T, P], gt class counts)."""
+    empty_pred = (np.zeros(0, np.int64), np.zeros(0), np.zeros((0, 4)))
+    classes, scores, tps = [], [], []
+    for image in sorted(set(predictions) | set(ground_truth)):
+        pred_classes, pred_scores, pred_boxes = predictions.get(image, empty_pred)
+        gt_classes, gt_boxes = ground_truth.get(image, (np.zeros(0, np.int64), np.zeros((0, 4))))
+        order, tp = match_image(pred_classes, pred_scores, pred_boxes, gt_classes, gt_boxes, iou_thresholds)
+        classes.append(pred_classes[order])
+        scores.append(pred_scores[order])
+        tps.append(tp)
+    gt_all = np.concatenate([gt[0] for gt in ground_truth.values()]) if ground_truth else np.zeros(0, np.int64)
+    gt_counts = dict(zip(*np.unique(gt_all, return_counts=True)))
+    return np.concatenate(classes), np.concatenate(scores), np.concatenate(tps, axis=1), gt_counts
+
+
+# --- Metrics ---
+def average_precision(tp, n_gt):
+    """101-point interpolated AP per IoU threshold for score-sorted tp [T, P]."""
+    if n_gt == 0:
+        return np.full(tp.shape[0], np.nan)
+    if tp.shape[1] == 0:
+        return np.zeros(tp.shape[0])
+    cumulative = np.cumsum(tp, axis=1)
+    recall = cumulative / n_gt
+    precision = cumulative / np.arange(1, tp.shape[1] + 1)
+    envelope = np.maximum.accumulate(precision[:, ::-1], axis=1)[:, ::-1]  # best precision at >= this recall
+    ap = np.zeros(tp.shape[0])
+    for t in range(tp.shape[0]):
+        idx = np.searchsorted(recall[t], RECALL_POINTS, side="left")
+        ap[t] = np.where(idx < tp.shape[1], envelope[t][np.minimum(idx, tp.shape[1] - 1)], 0.0).mean()
+    return ap
+
+
+def evaluate(predictions, ground_truth, score_threshold=None, iou_thresholds=IOU_THRESHOLDS):
+    """mAP per IoU threshold, plus precision / recall / F1 at IoU 0.5 for predictions above score_threshold."""
+    classes, scores, tp, gt_counts = match_all(predictions, ground_truth, iou_thresholds)
+    order = np.argsort(-scores, kind="stable")  # global score order for the PR curve
+    classes, scores, tp = classes[order], scores[order], tp[:, order]
+
+    ap_per_class = {int(c): average_precision(tp[:, classes == c], n) for c, n in gt_counts.items()}
+    mean_ap = np.nanmean(np.vstack(list(ap_per_class.values())), axis=0) if ap_per_class else np.zeros(len(iou_thresholds))
+
+    kept = scores >= score_threshold if score_threshold is not None else np.ones(len(scores), dtype=bool)
+    n_gt = int(sum(gt_counts.values()))
+    true_positives = int(tp[0, kept].sum())
+    precision = true_positives / max(int(kept.sum()), 1)
+    recall = true_positives / max(n_gt, 1)
+    f1 = 2 * precision * recall / max(precision + recall, 1e-12)
+    return {
+        "mAP@0.5": float(mean_ap[0]),
+        "mAP@[.5:.95]": float(mean_ap.mean()),
+        "mAP_per_iou": {f"{t:.2f}": float(v) for t, v in zip(iou_thresholds, mean_ap)},
+        "AP@0.5_per_class": {c: float(ap[0]) for c, ap in ap_per_class.items()},
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "predictions": int(kept.sum()),
+        "ground_truth": n_gt,
+    }
+
+
+def threshold_sweep(predictions, ground_truth, thresholds=SWEEP_THRESHOLDS, iou_threshold=0.5):
+    """Precision / recall / F1 for every similarity threshold from one matching pass.
+
+    Returns a structured array with one row per threshold.
+    """
+    classes, scores, tp, gt_counts = match_all(predictions, ground_truth, [iou_threshold])
+    order = np.argsort(-scores, kind="stable")
+    scores, hits = scores[order], np.concatenate([[0], np.cumsum(tp[0, order])])
+    kept = np.searchsorted(-scores, -np.asarray(thresholds), side="right")  # number of scores >= each threshold
+    true_positives = hits[kept]
+    n_gt = max(sum(gt_counts.values()), 1)
+    precision = np.where(kept > 0, true_positives / np.maximum(kept, 1), 1.0)
+    recall = true_positives / n_gt
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-12)
+    sweep = np.zeros(len(thresholds), dtype=[("threshold", "f8"), ("kept", "i8"), ("precision", "f8"),
+                                             ("recall", "f8"), ("f1", "f8")])
+    sweep["threshold"], sweep["kept"], sweep["precision"], sweep["recall"], sweep["f1"] = \
+        thresholds, kept, precision, recall, f1
+    return sweep
+
+
+def print_report(metrics, sweep=None):
+    print(f"{metrics['predictions']} predictions, {metrics['ground_truth']} ground-truth boxes")
+    print(f"mAP@0.5 {metrics['mAP@0.5']:.4f}   mAP@[.5:.95] {metrics['mAP@[.5:.95]']:.4f}")
+    print(f"precision {metrics['precision']:.4f}   recall {metrics['recall']:.4f}   F1 {metrics['f1']:.4f}")
+    if sweep is not None:
+        print(f"{'threshold':>9}{'kept':>7}{'precision':>11}{'recall':>8}{'F1':>8}")
+        for row in sweep:
+            print(f"{row['threshold']:>9.3f}{row['kept']:>7d}{row['precision']:>11.4f}{row['recall']:>8.4f}{row['f1']:>8.4f}")
+        best = sweep[np.argmax(sweep["f1"])]
+        print(f"Best F1 {best['f1']:.4f} at similarity_threshold = {best['threshold']:.3f}")
+
+
+def check_fixture(fixture_dir=FIXTURE_DIR, tolerance=1e-6):
+    """Evaluate the bundled synthetic fixture and compare with its expected.json. Returns True if all match."""
+    ground_truth = load_ground_truth(os.path.join(fixture_dir, "labels"))
+    predictions = load_predictions(os.path.join(fixture_dir, "pseudo_label_scores.jsonl"))
+    with open(os.path.join(fixture_dir, "expected.json"), "r") as f:
+        expected = json.load(f)
+
+    metrics = evaluate(predictions, ground_truth, score_threshold=expected["score_threshold"])
+    sweep = threshold_sweep(predictions, ground_truth, thresholds=np.array(expected["sweep"]["threshold"]))
+    actual = {key: metrics[key] for key in expected["metrics"]}
+    actual_sweep = {key: sweep[key].tolist() for key in expected["sweep"]}
+
+    failures = []
+    for key, value in expected["metrics"].items():
+        if abs(actual[key] - value) > tolerance:
+            failures.append(f"{key}: expected {value}, got {actual[key]}")
+    for key, values in expected["sweep"].items():
+        if not np.allclose(actual_sweep[key], values, atol=tolerance):
+            failures.append(f"sweep {key}: expected {values}, got {actual_sweep[key]}")
+    for failure in failures:
+        print("FAIL", failure)
+    print("Fixture OK" if not failures else f"{len(failures)} fixture check(s) failed")
+    return not failures
+
+
+if __name__ == "__main__":
+    # python evaluate.py                    -> evaluate scores_path against ground_truth_dir, with a threshold sweep
+    # python evaluate.py check [fixture]    -> verify the metrics on the bundled synthetic fixture
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        sys.exit(0 if check_fixture(*sys.argv[2:3]) else 1)
+    predictions = load_predictions(scores_path)
+    ground_truth = load_ground_truth(ground_truth_dir)
+    print_report(evaluate(predictions, ground_truth, score_threshold), threshold_sweep(predictions, ground_truth))
@@ -0,0 +1,250 @@
+import io
+import os
+import sys
+import json
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+# --- Paths ---
+verified_image_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\verified_images"
+verified_label_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\verified_labels"
+export_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\dataset_shards"
+
+# --- Settings ---
+export_format = "webdataset"  # "webdataset" (image + .txt label per sample in each tar) or "coco" (tars of images + annotations.json)
+samples_per_shard = 1000
+max_shard_bytes = 512 * 1024 ** 2  # start a new shard before this size
+read_threads = 8  # parallel file reads; the tar itself is written sequentially
+class_names = {}  # optional {class id: name} for COCO categories
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+MANIFEST = "manifest.json"
+COCO_ANNOTATIONS = "annotations.json"
+
+
+def _write_json(path, data):
+    # Temp file + rename, so a crash never leaves a half-written manifest
+    tmp_path = path + ".part"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(export_dir, export_format=export_format):
+    """{"format", "shards", "keys": {sample key: shard}, "members": {tar member key: sample key}}."""
+    path = os.path.join(export_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {"format": export_format, "shards": [], "keys": {}, "members": {}}
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    if manifest["format"] != export_format:
+        raise ValueError(f"{export_dir} holds a {manifest['format']} export; cannot append {export_format}")
+    # Exports from before members were recorded keyed samples by file stem
+    manifest.setdefault("members", {key.replace(".", "_"): key for key in manifest["keys"]})
+    return manifest
+
+
+def sample_key(image_dir, filename):
+    """Manifest key of a sample: source folder name plus filename, so folders with the same filenames do not clash."""
+    return f"{os.path.basename(os.path.normpath(image_dir))}/{filename}"
+
+
+def member_key(filename, members):
+    """Tar member key for a new sample, unique within the export.
+
+    WebDataset readers split the member name at the first dot, so dots
+    become underscores; a numeric suffix separates names that then clash.
+    """
+    base = os.path.splitext(filename)[0].replace(".", "_")
+    key, n = base, 1
+    while key in members:
+        n += 1
+        key = f"{base}_{n}"
+    return key
+
+
+def parse_yolo_label(text):
+    """[(class id, cx, cy, w, h)] from the contents of a YOLO .txt file; malformed lines are skipped."""
+    rows = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 5:
+            cls, cx, cy, w, h = map(float, parts)
+            rows.append((int(cls), cx, cy, w, h))
+    return rows
+
+
+def read_sample(image_dir, label_dir, filename):
+    key = sample_key(image_dir, filename)
+    with open(os.path.join(image_dir, filename), "rb") as f:
+        image_bytes = f.read()
+    label_path = os.path.join(label_dir, os.path.splitext(filename)[0] + ".txt")
+    label_text = ""
+    if os.path.exists(label_path):
+        with open(label_path, "r") as f:
+            label_text = f.read()
+    return key, filename, image_bytes, label_text
+
+
+def iter_new_samples(image_dir, label_dir, exported_keys, threads=read_threads):
+    """Yield (key, filename, image bytes, label text) for images not yet exported, in filename order."""
+    filenames = [f for f in sorted(os.listdir(image_dir))
+                 if f.lower().endswith(IMAGE_EXTENSIONS) and sample_key(image_dir, f) not in exported_keys
+                 and os.path.splitext(f)[0] not in exported_keys]  # stem keys of older exports
+    with ThreadPoolExecutor(threads) as pool:
+        # Chunked so at most a few hundred images are held in memory ahead of the writer
+        for start in range(0, len(filenames), 4 * threads):
+            chunk = filenames[start:start + 4 * threads]
+            yield from pool.map(lambda f: read_sample(image_dir, label_dir, f), chunk)
+
+
+class ShardWriter:
+    """Writes samples to sequential shard-NNNNNN.tar files, grouping each sample's files under one key."""
+
+    def __init__(self, export_dir, start_index=0, samples_per_shard=samples_per_shard, max_bytes=max_shard_bytes):
+        self.export_dir = export_dir
+        self.index = start_index
+        self.samples_per_shard = samples_per_shard
+        self.max_bytes = max_bytes
+        self.finished = []
+        self.tar = None
+
+    @property
+    def shard_name(self):
+        return f"shard-{self.index:06d}.tar"
+
+    def _open(self):
+        self.path = os.path.join(self.export_dir, self.shard_name)
+        self.tar = tarfile.open(self.path + ".part", "w")
+        self.samples, self.bytes = 0, 0
+
+    def _finish(self):
+        self.tar.close()
+        os.replace(self.path + ".part", self.path)
+        self.finished.append({"name": self.shard_name, "samples": self.samples, "bytes": os.path.getsize(self.path)})
+        self.tar = None
+        self.index += 1
+
+    def add(self, key, files):
+        """files: {extension: bytes}, stored as key.extension; key must not contain dots.
+
+        Returns the name of the shard the sample went to.
+        """
+        size = sum(len(data) for data in files.values())
+        if self.tar is not None and (self.samples >= self.samples_per_shard or self.bytes + size > self.max_bytes):
+            self._finish()
+        if self.tar is None:
+            self._open()
+        for extension, data in files.items():
+            info = tarfile.TarInfo(f"{key}.{extension}")
+            info.size = len(data)
+            info.mtime = 0  # reproducible shards
+            self.tar.addfile(info, io.BytesIO(data))
+        self.samples += 1
+        self.bytes += size
+        return self.shard_name
+
+    def close(self):
+        if self.tar is not None:
+            self._finish()
+        return self.finished
+
+
+def load_coco(export_dir, shards):
+    """annotations.json restricted to the shards in the manifest.
+
+    annotations.json is renamed into place just before the manifest, so a
+    crash between the two leaves images from shards the manifest does not
+    list; they are dropped here and exported again.
+    """
+    path = os.path.join(export_dir, COCO_ANNOTATIONS)
+    if not os.path.exists(path):
+        return {"images": [], "annotations": [], "categories": []}
+    with open(path, "r") as f:
+        coco = json.load(f)
+    recorded = {shard["name"] for shard in shards}
+    coco["images"] = [image for image in coco["images"] if image["shard"] in recorded]
+    image_ids = {image["id"] for image in coco["images"]}
+    coco["annotations"] = [a for a in coco["annotations"] if a["image_id"] in image_ids]
+    return coco
+
+
+def add_coco_sample(coco, filename, shard, image_bytes, rows):
+    width, height = Image.open(io.BytesIO(image_bytes)).size  # header only, no decode
+    image_id = len(coco["images"]) + 1
+    coco["images"].append({"id": image_id, "file_name": filename, "width": width, "height": height, "shard": shard})
+    known = {c["id"] for c in coco["categories"]}
+    for cls, cx, cy, w, h in rows:
+        if cls not in known:
+            coco["categories"].append({"id": cls, "name": class_names.get(cls, f"class_{cls}")})
+            known.add(cls)
+        box_w, box_h = w * width, h * height
+        coco["annotations"].append({
+            "id": len(coco["annotations"]) + 1,
+            "image_id": image_id,
+            "category_id": cls,
+            "bbox": [round((cx - w / 2) * width, 2), round((cy - h / 2) * height, 2), round(box_w, 2), round(box_h, 2)],
+            "area": round(box_w * box_h, 2),
+            "iscrowd": 0,
+        })
+
+
+def export_dataset(image_dir=verified_image_dir, label_dir=verified_label_dir, export_dir=export_dir,
+                   export_format=export_format):
+    """Append every verified sample not yet in export_dir as new shards. Returns the number of samples added.
+
+    The manifest is written last, so an interrupted export leaves the previous
+    export intact and the next run rewrites any unrecorded shards.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    manifest = load_manifest(export_dir, export_format)
+    coco = load_coco(export_dir, manifest["shards"]) if export_format == "coco" else None
+    writer = ShardWriter(export_dir, len(manifest["shards"]), samples_per_shard, max_shard_bytes)
+
+    added, labels = 0, 0
+    for key, filename, image_bytes, label_text in iter_new_samples(image_dir, label_dir, manifest["keys"]):
+        rows = parse_yolo_label(label_text)
+        extension = os.path.splitext(filename)[1].lstrip(".").lower()
+        member = member_key(filename, manifest["members"])
+        if export_format == "coco":
+            shard = writer.add(member, {extension: image_bytes})
+            add_coco_sample(coco, f"{member}.{extension}", shard, image_bytes, rows)
+        else:
+            shard = writer.add(member, {extension: image_bytes, "txt": label_text.encode("utf-8")})
+        manifest["keys"][key] = shard
+        manifest["members"][member] = key
+        added += 1
+        labels += len(rows)
+
+    new_shards = writer.close()
+    if not added:
+        print(f"Nothing to export: all {len(manifest['keys'])} verified samples are already in {export_dir}")
+        return 0
+    manifest["shards"] += new_shards
+    if coco is not None:
+        _write_json(os.path.join(export_dir, COCO_ANNOTATIONS), coco)
+    _write_json(os.path.join(export_dir, MANIFEST), manifest)
+    print(f"Exported {added} samples ({labels} labels) to {len(new_shards)} new shard(s); "
+          f"{len(manifest['keys'])} samples in {len(manifest['shards'])} shards total")
+    return added
+
+
+def iter_shard(path):
+    """Yield (key, {extension: bytes}) from one shard, in the order written."""
+    with tarfile.open(path, "r") as tar:
+        key, files = None, {}
+        for member in tar:
+            member_key, extension = member.name.split(".", 1)
+            if key is not None and member_key != key:
+                yield key, files
+                files = {}
+            key = member_key
+            files[extension] = tar.extractfile(member).read()
+        if key is not None:
+            yield key, files
+
+
+if __name__ == "__main__":
+    # python export_dataset.py [webdataset|coco]
+    export_dataset(export_format=sys.argv[1] if len(sys.argv) > 1 else export_format)
@@ -1,23 +1,39 @@
 import os
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from PIL import Image
-import torch
-import open_clip
 from tqdm import tqdm
-from torchvision import transforms
-from torchvision.transforms.functional import pad
+
+# torch, torchvision and open_clip are imported where the model or a transform is built, so runs
+# served by the model server never import them. Without a server the transform is still built to
+# hash it for the cache key, so fully cached runs import torchvision but never load CLIP.
+from feature_store import FeatureStore, preprocess_hash
+from embedding_cache import EmbeddingCache, file_key
+from clip_backends import backend_device, model_id, wrap_model
+from model_client import ModelClient
 
 # Set path
 image_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\yolo_candidate_crops"
-output_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\yolo_candidate_features"
-os.makedirs(output_dir, exist_ok=True)
+output_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\yolo_candidate_features" # feature store directory
+model_name = 'ViT-B-32'
+pretrained = 'openai'
+backend = "torch"         # "torch" (fp32), or on CPU "torch-int8", "onnx", "onnx-int8" (see clip_backends.py)
+
+# Batching / CPU settings
+batch_size = 64          # images per forward pass
+num_workers = max(1, (os.cpu_count() or 2) - 1)  # processes decoding + preprocessing crops
+torch_threads = None     # intra-op threads for the forward pass (None = torch default)
+resume = True            # skip images that already have a saved feature
+store_dtype = "float16"  # on-disk precision of the feature matrix
+save_every = 20          # batches between index checkpoints
+use_cache = True         # reuse embeddings of byte-identical images from earlier runs (see embedding_cache.py)
+server_url = None        # e.g. "http://127.0.0.1:8765": embed cache misses with a running model_server.py
 
-# Load CLIP model
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model, _, preprocess = open_clip.create_model_and_transforms('ViT-B-32', pretrained='openai')
-model = model.to(device)
-model.eval()
+IMAGE_EXTENSIONS = (".jpg", ".png", ".jpeg")
 
 def pad_to_square(image):
+		from torchvision.transforms.functional import pad
 		w, h = image.size
 		max_dim = max(w, h)
 		padding = (
@@ -28,28 +44,196 @@ def pad_to_square(image):
 		)
 		return pad(image, padding, fill=0, padding_mode='constant')
 
-custom_preprocess = transforms.Compose([
-	transforms.Lambda(pad_to_square),
-	transforms.Resize((224, 224)),
-	transforms.ToTensor(),
-	transforms.Normalize(
-		mean = (0.48145466, 0.4578275, 0.40821073),
-        std=(0.26862954, 0.26130258, 0.27577711)
+_custom_preprocess = None
+
+def custom_preprocess():
+	"""The pad-to-square transform used for crops, built once on first use."""
+	global _custom_preprocess
+	if _custom_preprocess is None:
+		from torchvision import transforms
+		_custom_preprocess = transforms.Compose([
+			transforms.Lambda(pad_to_square),
+			transforms.Resize((224, 224)),
+			transforms.ToTensor(),
+			transforms.Normalize(
+				mean = (0.48145466, 0.4578275, 0.40821073),
+				std=(0.26862954, 0.26130258, 0.27577711)
+			)
+		])
+	return _custom_preprocess
+
+def openclip_preprocess():
+	"""open_clip's eval transform for the OpenAI weights, built without loading the model."""
+	import open_clip
+	from open_clip.constants import OPENAI_DATASET_MEAN, OPENAI_DATASET_STD
+	return open_clip.image_transform(224, is_train=False, mean=OPENAI_DATASET_MEAN, std=OPENAI_DATASET_STD)
+
+# Named so the model server can apply the same transform: name -> builder
+PREPROCESS = {"custom": custom_preprocess, "openclip": openclip_preprocess}
+
+class CropDataset:
+	"""Decodes and preprocesses crops inside DataLoader workers, off the main thread (a map-style dataset)."""
+	def __init__(self, image_dir, filenames, preprocess=None):
+		self.image_dir = image_dir
+		self.filenames = filenames
+		self.preprocess = preprocess or custom_preprocess()
+
+	def __len__(self):
+		return len(self.filenames)
+
+	def __getitem__(self, idx):
+		filename = self.filenames[idx]
+		try:
+			image = Image.open(os.path.join(self.image_dir, filename)).convert("RGB")
+		except OSError as e:
+			print(f"Failed to load {filename}: {e}")
+			return None
+		return self.preprocess(image), filename
+
+def collate_skip_failed(batch):
+	import torch
+	batch = [item for item in batch if item is not None]
+	if not batch:
+		return None
+	images, filenames = zip(*batch)
+	return torch.stack(images), list(filenames)
+
+def load_model(device, backend=backend):
+	import torch
+	import open_clip
+	if torch_threads:
+		torch.set_num_threads(torch_threads)
+	model, _, _ = open_clip.create_model_and_transforms(model_name, pretrained=pretrained)
+	return wrap_model(model, backend, device, model_name=model_name, pretrained=pretrained, threads=torch_threads)
+
+def resolve_preprocess(name="custom"):
+	"""(preprocess id, model client or None) for a named transform.
+
+	If server_url points at a model server for the same model, its id for the
+	transform of that name is used and the client is returned, so this path
+	never imports torchvision. Otherwise the transform is built here and hashed.
+	"""
+	if server_url:
+		client = ModelClient(server_url)
+		server_id = client.preprocess_id(name, model_id(model_name, backend))
+		if server_id is not None:
+			return server_id, client
+		print(f"Model server at {server_url} is not running or serves a different model; loading CLIP locally.")
+	return preprocess_hash(PREPROCESS[name]()), None
+
+def open_store(output_dir, preprocess_id=None):
+	# Keyed like the embedding cache: a store started with one backend refuses features from another
+	preprocess_id = preprocess_id or preprocess_hash(custom_preprocess())
+	return FeatureStore(output_dir, model_name=model_id(model_name, backend), preprocess_id=preprocess_id, dtype=store_dtype)
+
+def list_images(image_dir, store=None):
+	"""Image filenames in image_dir, minus those already in the feature store when resuming."""
+	filenames = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+	if store is not None:
+		filenames = [f for f in filenames if os.path.splitext(f)[0] not in store]
+	return filenames
+
+def iter_feature_batches(model, image_dir, filenames, device, batch_size=batch_size, num_workers=num_workers, preprocess=None):
+	"""Yield (filenames, float32 numpy features) per batch."""
+	import torch
+	from torch.utils.data import DataLoader
+	loader = DataLoader(
+		CropDataset(image_dir, filenames, preprocess),
+		batch_size=batch_size,
+		num_workers=num_workers,
+		collate_fn=collate_skip_failed,
+		pin_memory=device == "cuda",
+		persistent_workers=False,
+		prefetch_factor=4 if num_workers > 0 else None,
 	)
-])
-
-def extract_and_save_feature(image_path, output_path):
-	image = custom_preprocess(Image.open(image_path).convert("RGB")).unsqueeze(0).to(device)
-	with torch.no_grad():
-		feature = model.encode_image(image)
-		feature = feature.cpu().squeeze(0)
-		torch.save(feature, output_path)
-
-# Loop through all images and extract features
-for filename in tqdm(os.listdir(image_dir)):
-	if filename.endswith((".jpg", ".png", ".jpeg")):
-		image_path = os.path.join(image_dir, filename)
-		output_path = os.path.join(output_dir, filename.replace('.jpg', '.pt'))
-		extract_and_save_feature(image_path, output_path)
-
-print(f"Features saved in {output_dir}/")
\ No newline at end of file
+	with torch.inference_mode():
+		for batch in loader:
+			if batch is None:
+				continue
+			images, names = batch
+			features = model.encode_image(images.to(device, non_blocking=True))
+			yield names, features.float().cpu().numpy()
+
+def iter_cached_feature_batches(get_model, image_dir, filenames, cache, preprocess="custom",
+								batch_size=batch_size, num_workers=num_workers, resolved=None):
+	"""Like iter_feature_batches, but images already in the embedding cache are served from it.
+
+	preprocess is a name in PREPROCESS. get_model(device) is only called if at
+	least one image misses the cache and the model server, so fully cached runs
+	never load CLIP and server runs never import torch. Misses go to the model
+	server when server_url is set and it serves the same model; if it fails
+	midway, the rest are embedded locally. New embeddings are added to the cache.
+	resolved is a resolve_preprocess() result the caller already has.
+	"""
+	preprocess_id, client = resolved or resolve_preprocess(preprocess)
+	cache_model_id = model_id(model_name, backend)
+	with ThreadPoolExecutor(max(1, num_workers)) as pool:
+		keys = dict(zip(filenames, pool.map(
+			lambda f: file_key(os.path.join(image_dir, f), cache_model_id, preprocess_id), filenames)))
+
+	missing = []
+	for start in range(0, len(filenames), batch_size):
+		names = filenames[start:start + batch_size]
+		hits = cache.get_many(keys[f] for f in names)
+		missing += [f for f in names if keys[f] not in hits]
+		cached = [f for f in names if keys[f] in hits]
+		if cached:
+			yield cached, np.stack([hits[keys[f]] for f in cached])
+
+	if missing and client is not None:
+		done = 0
+		try:
+			for start in range(0, len(missing), batch_size):
+				names = missing[start:start + batch_size]
+				features, ok = client.embed([os.path.join(image_dir, f) for f in names], preprocess)
+				done = start + len(names)
+				names = [f for f, good in zip(names, ok) if good]
+				features = features[ok]
+				cache.put_many({keys[name]: feature for name, feature in zip(names, features)})
+				if names:
+					yield names, features
+		except (urllib.error.URLError, OSError, ValueError) as e:
+			print(f"Model server at {server_url} failed ({e}); embedding the remaining {len(missing) - done} images locally.")
+		missing = missing[done:]
+
+	if missing:
+		device = backend_device(backend)
+		model = get_model(device)
+		for names, features in iter_feature_batches(model, image_dir, missing, device, batch_size, num_workers,
+													PREPROCESS[preprocess]()):
+			cache.put_many({keys[name]: feature for name, feature in zip(names, features)})
+			yield names, features
+
+def extract_and_save_features(image_dir, output_dir, resume=resume):
+	if use_cache:
+		resolved = resolve_preprocess("custom")
+		store = open_store(output_dir, resolved[0])
+	else:
+		store = open_store(output_dir)
+	filenames = list_images(image_dir, store if resume else None)
+	if not filenames:
+		print("Nothing to extract: all images already have features.")
+		return
+
+	cache = EmbeddingCache() if use_cache else None
+	if use_cache:
+		batches = iter_cached_feature_batches(load_model, image_dir, filenames, cache, resolved=resolved)
+	else:
+		device = backend_device(backend)
+		batches = iter_feature_batches(load_model(device), image_dir, filenames, device)
+	try:
+		with tqdm(total=len(filenames)) as progress:
+			for i, (names, features) in enumerate(batches):
+				store.append([os.path.splitext(name)[0] for name in names], features)
+				if (i + 1) % save_every == 0:
+					store.save()
+				progress.update(len(names))
+	finally:
+		if cache is not None:
+			cache.close()
+	store.save()
+
+# Workers are spawned processes on Windows, so the entry point must be guarded
+if __name__ == "__main__":
+	extract_and_save_features(image_dir, output_dir)
+	print(f"Features saved in {output_dir}/")
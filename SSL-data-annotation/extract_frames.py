@@ -1,56 +1,132 @@
 import cv2
 import os
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-def extract_frames(video_path, output_folder, total_frames):
+SEEK_MIN_INTERVAL = 120  # above this frame gap, seeking is cheaper than grabbing every frame
+MAX_PENDING_WRITES = 32  # frames queued for JPEG encoding before the reader waits
+
+
+def frame_hash(frame):
+    """64-bit difference hash: robust to small noise, changes when the scene does."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+def hash_distance(a, b):
+    return int(np.unpackbits(a ^ b).sum())
+
+
+def _extract_segment(video_path, output_folder, start, stop, frame_interval, dedupe_threshold, writer_threads):
+    """Extract every frame_interval-th frame in [start, stop). Returns number of frames saved."""
+    video_capture = cv2.VideoCapture(video_path)
+    if not video_capture.isOpened():
+        print(f"Error: Could not open the video for segment {start}-{stop}.")
+        return 0
+
+    use_seek = frame_interval >= SEEK_MIN_INTERVAL
+    if start:
+        video_capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    slots = threading.Semaphore(MAX_PENDING_WRITES)
+
+    def write(path, frame):
+        try:
+            if not cv2.imwrite(path, frame):
+                raise OSError(f"Could not write {path}")
+        finally:
+            slots.release()
+
+    saved = 0
+    previous_hash = None
+    frame_count = start
+    writes = []
+    with ThreadPoolExecutor(writer_threads) as writer:
+        while frame_count < stop:
+            if frame_count % frame_interval == 0:
+                ret, frame = video_capture.read()
+                if not ret:
+                    break
+                current_hash = frame_hash(frame) if dedupe_threshold is not None else None
+                # Skip frames that look the same as the last one kept
+                if previous_hash is None or current_hash is None or hash_distance(current_hash, previous_hash) > dedupe_threshold:
+                    slots.acquire()
+                    writes.append(writer.submit(write, os.path.join(output_folder, f"frame_{frame_count:06d}.jpg"), frame))
+                    previous_hash = current_hash
+                    saved += 1
+                next_frame = frame_count + frame_interval
+                if use_seek:
+                    video_capture.set(cv2.CAP_PROP_POS_FRAMES, next_frame)
+                    frame_count = next_frame
+                    continue
+                frame_count += 1
+            elif not video_capture.grab():  # advance without decoding
+                break
+            else:
+                frame_count += 1
+
+    video_capture.release()
+    for future in writes:
+        future.result()  # surface write errors
+    return saved
+
+
+def extract_frames(video_path, output_folder, total_frames, workers=1, dedupe_threshold=None, writer_threads=4):
+    """Save about total_frames evenly spaced frames from the video.
+
+    workers > 1 splits the video into segments handled by separate processes.
+    dedupe_threshold (bits of a 64-bit frame hash, e.g. 5) drops frames that
+    barely differ from the previously kept frame of the same segment.
+    """
     # Create output folder if it doesn't exist
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
-    
+
     # Load the video
     video_capture = cv2.VideoCapture(video_path)
-    total_video_frames = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT))  # total frames
-    fps = video_capture.get(cv2.CAP_PROP_FPS)  # Get frames per second
-    duration = total_video_frames / fps  # duration in seconds
-
     if not video_capture.isOpened():
         print("Error: Could not open the video.")
         return
 
+    total_video_frames = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT))  # total frames
+    fps = video_capture.get(cv2.CAP_PROP_FPS)  # Get frames per second
+    duration = total_video_frames / fps if fps else 0  # duration in seconds
+    video_capture.release()
+
     print(f"Video Info: {total_video_frames} frames, {fps} fps, {duration:.2f} seconds")
-    
+
     frame_interval = max(total_video_frames // total_frames, 1)  # Interval to capture frames
     print(f"Frame Interval: Capture every {frame_interval} frames.")
+    last_frame = min(total_video_frames, frame_interval * total_frames)
 
     print(f"Processing video: {video_path}")
-    
-    frame_count = 0
-    extracted_count = 0
-
-    while frame_count < total_video_frames:
-        ret, frame = video_capture.read()
-        if not ret:
-            break  # Exit loop if no more frames are available.
-
-        # Save frame if it matches the frame interval
-        if frame_count % frame_interval == 0:
-            output_path = os.path.join(output_folder, f"frame_{extracted_count:04d}.jpg")
-            cv2.imwrite(output_path, frame)  # Save frame as an image
-            extracted_count += 1
-
-            if extracted_count >= total_frames:
-                break
 
-        frame_count += 1
+    # Segment boundaries are aligned to the interval so no kept frame is duplicated or lost
+    per_segment = -(-last_frame // (workers * frame_interval)) * frame_interval
+    segments = [(s, min(s + per_segment, last_frame)) for s in range(0, last_frame, per_segment)] if last_frame else []
+
+    if workers > 1 and len(segments) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(_extract_segment, video_path, output_folder, start, stop,
+                                   frame_interval, dedupe_threshold, writer_threads) for start, stop in segments]
+            extracted_count = sum(f.result() for f in futures)
+    else:
+        extracted_count = sum(_extract_segment(video_path, output_folder, start, stop, frame_interval,
+                                               dedupe_threshold, writer_threads) for start, stop in segments)
 
-    # Release video capture once done
-    video_capture.release()
-    
     print(f"Extraction completed. {extracted_count} frames saved in {output_folder}.")
+    return extracted_count
+
 
-# Parameters
-video_file = "WIN_20250102_13_38_13_Pro.mp4"  # Path to video file
-output_directory = "frames_output"  # Directory to save extracted images
-total_images = 1500  # Adjust to extract desired images over video length
+if __name__ == "__main__":
+    # Parameters
+    video_file = "WIN_20250102_13_38_13_Pro.mp4"  # Path to video file
+    output_directory = "frames_output"  # Directory to save extracted images
+    total_images = 1500  # Adjust to extract desired images over video length
+    workers = max(1, (os.cpu_count() or 2) // 2)  # processes decoding separate segments of the video
+    dedupe_threshold = None  # e.g. 5 to skip near-duplicate frames
 
-# Extract frames
-extract_frames(video_file, output_directory, total_images)
+    # Extract frames
+    extract_frames(video_file, output_directory, total_images, workers=workers, dedupe_threshold=dedupe_threshold)
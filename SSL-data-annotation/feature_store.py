@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import hashlib
+import re
+import numpy as np
+
+MATRIX_FILE = "features.npy"
+INDEX_FILE = "index.json"
+INITIAL_CAPACITY = 1024
+
+
+def preprocess_hash(preprocess):
+    """Short, stable fingerprint of a preprocessing pipeline (e.g. a torchvision Compose)."""
+    # Function objects inside transforms repr with their memory address, which changes every run
+    description = re.sub(r" at 0x[0-9a-fA-F]+", "", repr(preprocess))
+    return hashlib.sha1(description.encode("utf-8")).hexdigest()[:12]
+
+
+class FeatureStore:
+    """Embeddings for many crops in one memory-mapped matrix plus a JSON index.
+
+    <store_dir>/features.npy  contiguous [capacity, dim] float16/float32 matrix
+    <store_dir>/index.json    crop ids (row order), model name, preprocessing hash, dim, dtype
+
+    Loading the whole store is a single mmap. Appending writes new rows in place
+    and grows the matrix geometrically, so the index is the only file rewritten.
+    """
+
+    def __init__(self, store_dir, model_name=None, preprocess_id=None, dim=None, dtype="float16"):
+        self.store_dir = store_dir
+        self.matrix_path = os.path.join(store_dir, MATRIX_FILE)
+        self.index_path = os.path.join(store_dir, INDEX_FILE)
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                meta = json.load(f)
+            self._check(meta, "model", model_name)
+            self._check(meta, "preprocess", preprocess_id)
+            self._check(meta, "dim", dim)
+            self.model_name = meta["model"] or model_name
+            self.preprocess_id = meta["preprocess"] or preprocess_id
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+            self.ids = meta["ids"]
+            self._matrix = np.load(self.matrix_path, mmap_mode="r+")
+        else:
+            self.model_name = model_name
+            self.preprocess_id = preprocess_id
+            self.dim = dim
+            self.dtype = np.dtype(dtype)
+            self.ids = []
+            self._matrix = None
+        self.rows = {crop_id: row for row, crop_id in enumerate(self.ids)}
+
+    def _check(self, meta, key, expected):
+        # A store imported without a recorded value adopts the first caller's value
+        if expected is not None and meta[key] is not None and meta[key] != expected:
+            raise ValueError(f"Feature store {self.store_dir} has {key}={meta[key]!r}, expected {expected!r}")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, crop_id):
+        return crop_id in self.rows
+
+    def fingerprint(self):
+        """Summary of what the store holds, for derived files (indexes) to detect that they are stale."""
+        ids_hash = hashlib.sha1("\n".join(self.ids).encode("utf-8")).hexdigest()[:16]
+        return {"count": len(self.ids), "dim": self.dim, "model": self.model_name,
+                "preprocess": self.preprocess_id, "ids": ids_hash}
+
+    # --- Reading ---
+    def matrix(self):
+        """[N, dim] memory-mapped view of all stored embeddings, in self.ids order."""
+        if self._matrix is None:
+            return np.empty((0, self.dim or 0), dtype=self.dtype)
+        return self._matrix[:len(self.ids)]
+
+    def get(self, crop_ids):
+        """Embeddings for the given crop ids, as a float32 array in the same order."""
+        rows = [self.rows[crop_id] for crop_id in crop_ids]
+        return np.asarray(self.matrix()[rows], dtype=np.float32)
+
+    # --- Writing ---
+    def _reserve(self, needed):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(INITIAL_CAPACITY, capacity)
+        while new_capacity < needed:
+            new_capacity *= 2
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_path = self.matrix_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype, shape=(new_capacity, self.dim))
+        if capacity:
+            grown[:len(self.ids)] = self._matrix[:len(self.ids)]
+        grown.flush()
+        del grown
+        self._matrix = None
+        os.replace(tmp_path, self.matrix_path)
+        self._matrix = np.load(self.matrix_path, mmap_mode="r+")
+
+    def append(self, crop_ids, features):
+        """Add (or overwrite) embeddings for crop_ids. features is [len(crop_ids), dim]."""
+        features = np.asarray(features, dtype=np.float32).reshape(len(crop_ids), -1)
+        if self.dim is None:
+            self.dim = features.shape[1]
+        elif features.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dim features, got {features.shape[1]}")
+
+        new_ids = [crop_id for crop_id in dict.fromkeys(crop_ids) if crop_id not in self.rows]
+        self._reserve(len(self.ids) + len(new_ids))
+        for crop_id in new_ids:
+            self.rows[crop_id] = len(self.ids)
+            self.ids.append(crop_id)
+
+        rows = np.fromiter((self.rows[crop_id] for crop_id in crop_ids), dtype=np.intp, count=len(crop_ids))
+        self._matrix[rows] = features.astype(self.dtype)
+
+    def save(self):
+        """Flush matrix rows and atomically rewrite the index."""
+        if self._matrix is not None:
+            self._matrix.flush()
+        meta = {
+            "model": self.model_name,
+            "preprocess": self.preprocess_id,
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "count": len(self.ids),
+            "ids": self.ids,
+        }
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.index_path)
+
+
+def import_pt_dir(pt_dir, store_dir, model_name="ViT-B-32", preprocess_id=None, batch=4096):
+    """Convert a directory of per-crop .pt tensors into a FeatureStore."""
+    import torch
+
+    store = FeatureStore(store_dir, model_name=model_name, preprocess_id=preprocess_id)
+    filenames = sorted(f for f in os.listdir(pt_dir) if f.endswith(".pt"))
+    for start in range(0, len(filenames), batch):
+        chunk = filenames[start:start + batch]
+        features = np.stack([torch.load(os.path.join(pt_dir, f)).float().numpy() for f in chunk])
+        store.append([os.path.splitext(f)[0] for f in chunk], features)
+    store.save()
+    return store
+
+
+if __name__ == "__main__":
+    # Usage: python feature_store.py <dir_of_pt_files> <store_dir>
+    store = import_pt_dir(sys.argv[1], sys.argv[2])
+    print(f"Imported {len(store)} features into {sys.argv[2]}")
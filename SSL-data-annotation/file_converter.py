@@ -1,20 +1,110 @@
 import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from PIL import Image
 import pillow_heif
 
 input_folder = r"C:\Users\Digital Twingine\Desktop\chloe\label_small_data\standard20\import"
 output_folder = r"C:\Users\Digital Twingine\Desktop\chloe\label_small_data\standard20\standard"
-os.makedirs(output_folder, exist_ok=True)
 
-for filename in os.listdir(input_folder):
-    if filename.lower().endswith(".heic"):
-        heic_path = os.path.join(input_folder, filename)
-        jpg_path = os.path.join(output_folder, os.path.splitext(filename)[0] + ".jpg")
+workers = os.cpu_count() or 1
+max_in_flight = 2 * workers  # bounds decoded images held in memory at once
+resize_to = None  # e.g. 640 to shrink the longest side to the training resolution
+jpeg_quality = 95
+SETTINGS_FILE = ".conversion_settings.json"  # in output_folder: the settings its JPEGs were written with
 
-        heif_file = pillow_heif.read_heif(heic_path)
-        image = Image.frombytes(
-            heif_file.mode, heif_file.size, heif_file.data, "raw"
-        )
-        image.save(jpg_path, "JPEG")
 
-print("Conversion complete.")
+def _init_worker():
+    # Lets PIL open .heic directly instead of copying the decoded buffer through frombytes
+    pillow_heif.register_heif_opener()
+
+
+def read_settings(output_folder):
+    path = os.path.join(output_folder, SETTINGS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_settings(output_folder, settings):
+    path = os.path.join(output_folder, SETTINGS_FILE)
+    with open(path + ".part", "w") as f:
+        json.dump(settings, f)
+    os.replace(path + ".part", path)
+
+
+def is_up_to_date(heic_path, jpg_path):
+    """True if the JPEG exists, is non-empty and is newer than its source."""
+    if not os.path.exists(jpg_path):
+        return False
+    jpg_stat = os.stat(jpg_path)
+    return jpg_stat.st_size > 0 and jpg_stat.st_mtime >= os.stat(heic_path).st_mtime
+
+
+def convert_file(heic_path, jpg_path, resize_to=None, quality=jpeg_quality):
+    """Convert one .heic to .jpg. Returns the source size in bytes."""
+    with Image.open(heic_path) as image:
+        image = image.convert("RGB")
+        if resize_to:
+            image.thumbnail((resize_to, resize_to), Image.LANCZOS)
+        # Write to a temp name first so an interrupted run never leaves a truncated JPEG that looks current
+        tmp_path = jpg_path + ".part"
+        image.save(tmp_path, "JPEG", quality=quality)
+    os.replace(tmp_path, jpg_path)
+    return os.path.getsize(heic_path)
+
+
+def convert_folder(input_folder, output_folder, workers=workers, resize_to=resize_to, quality=jpeg_quality):
+    os.makedirs(output_folder, exist_ok=True)
+    # Existing JPEGs only count as up to date if they were written with the same settings
+    settings = {"resize_to": resize_to, "quality": quality}
+    previous = read_settings(output_folder)
+    same_settings = previous == settings
+    if previous is not None and not same_settings:
+        print(f"Conversion settings changed to {settings}: converting every file")
+    jobs, skipped = [], 0
+    for filename in os.listdir(input_folder):
+        if filename.lower().endswith(".heic"):
+            heic_path = os.path.join(input_folder, filename)
+            jpg_path = os.path.join(output_folder, os.path.splitext(filename)[0] + ".jpg")
+            if same_settings and is_up_to_date(heic_path, jpg_path):
+                skipped += 1
+            else:
+                jobs.append((heic_path, jpg_path))
+
+    start = time.time()
+    converted, failed, total_bytes = 0, 0, 0
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+        in_flight = {}
+        jobs = iter(jobs)
+        while True:
+            for heic_path, jpg_path in jobs:
+                in_flight[pool.submit(convert_file, heic_path, jpg_path, resize_to, quality)] = heic_path
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                heic_path = in_flight.pop(future)
+                try:
+                    total_bytes += future.result()
+                    converted += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"Failed to convert {heic_path}: {e}")
+
+    if not failed:
+        # Recorded only after a complete run, so an interrupted one is redone with the new settings
+        write_settings(output_folder, settings)
+    elapsed = max(time.time() - start, 1e-9)
+    print(f"Converted {converted} files ({skipped} up to date, {failed} failed) in {elapsed:.1f}s: "
+          f"{converted / elapsed:.1f} files/s, {total_bytes / elapsed / 1e6:.1f} MB/s")
+    return converted
+
+
+if __name__ == "__main__":
+    convert_folder(input_folder, output_folder)
+    print("Conversion complete.")
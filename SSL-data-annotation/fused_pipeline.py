@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from extract_clip_features import custom_preprocess, load_model, backend
+from clip_backends import backend_device
+from yolo_candidate_crops import Detector, iter_image_batches, IMAGE_EXTENSIONS
+from vector_index import load_or_build_index, verified_classes
+from class_prototypes import load_or_build_prototypes, load_reference_classes, passes_threshold
+
+# --- Paths ---
+input_dir = r"C:\Users\Digital Twingine\Desktop\chloe\label_small_data\standard20\unlabeled_images"
+output_label_dir = "yolo_pseudo_labels"
+scores_path = os.path.join(output_label_dir, "pseudo_label_scores.jsonl")  # score of every crop, read by datavalidation.py / evaluate.py
+reference_dir = "original_candidate_features"  # reference feature store
+reference_index_dir = "reference_index"
+reference_classes_path = "reference_classes.json"
+reference_label_dir = None
+
+# Crops are only written to disk for the manual review step, and only if they got a label
+save_review_crops = True
+review_crop_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\yolo_candidate_crops"
+review_metadata_path = "crop_metadata.jsonl"
+
+# --- Settings ---
+similarity_threshold = 0.4
+class_thresholds = {}
+sub_prototypes = 0
+detect_batch_size = 16  # images per YOLO forward pass
+embed_batch_size = 64  # crops per CLIP forward pass
+embed_max_wait = 0.05  # seconds to wait for a fuller CLIP batch before running a partial one
+queue_size = 256  # bounded queues between stages keep memory flat
+decode_threads = 4
+writer_threads = 4
+
+_DONE = object()
+
+
+def detect_stage(detector, filenames, crop_queue, decode_pool):
+    """Decode + YOLO. Emits ("crop", ...) items and one ("image", ...) item per source image."""
+    for names, images in iter_image_batches(filenames, detect_batch_size, decode_pool, image_dir=input_dir):
+        for filename, image, boxes in zip(names, images, detector([os.path.join(input_dir, f) for f in names], images)):
+            w, h = image.size
+            for i, box in enumerate(boxes):
+                x1, y1, x2, y2 = map(int, box)
+                crop_queue.put(("crop", filename, i, image.crop((x1, y1, x2, y2)), [x1, y1, x2 - x1, y2 - y1], [w, h]))
+            # Sent after the image's crops so the writer knows how many to expect
+            crop_queue.put(("image", filename, len(boxes)))
+
+
+def embed_stage(clip_model, device, crop_queue, scored_queue, preprocess_pool):
+    """Batch crops dynamically and run CLIP; passes image markers straight through."""
+    import torch
+    preprocess = custom_preprocess()
+    done = False
+    while not done:
+        batch = []
+        deadline = None
+        while len(batch) < embed_batch_size:
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                item = crop_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _DONE:
+                done = True
+                break
+            if item[0] == "image":
+                scored_queue.put(item)
+                continue
+            batch.append(item)
+            deadline = deadline or time.time() + embed_max_wait
+
+        if batch:
+            tensors = torch.stack(list(preprocess_pool.map(preprocess, [item[3] for item in batch])))
+            with torch.inference_mode():
+                features = clip_model.encode_image(tensors.to(device)).float().cpu().numpy()
+            scored_queue.put(("crops", batch, features))
+
+
+def write_stage(prototypes, scored_queue, write_pool, stats):
+    """Score crop embeddings against the class prototypes and write one label file per image."""
+    pending = {}  # source image -> {"expected": n or None, "seen": n, "lines": [...]}
+    metadata_file = open(review_metadata_path, "a") if save_review_crops else None
+    scores_file = open(scores_path + ".part", "w")  # replaces scores_path once the whole run succeeded
+    previous_writes = []  # (future, metadata record) of the last batch's review crops
+
+    def finish_writes(writes):
+        # A crop's metadata is recorded only once its file is on disk; result() surfaces write errors
+        for future, record in writes:
+            future.result()
+            metadata_file.write(json.dumps(record) + "\n")
+
+    def finish_ready():
+        for filename in [f for f, state in pending.items() if state["expected"] == state["seen"]]:
+            state = pending.pop(filename)
+            out_path = os.path.join(output_label_dir, os.path.splitext(filename)[0] + ".txt")
+            if state["lines"]:
+                with open(out_path, "w") as f:
+                    f.writelines(state["lines"])
+                stats["labeled_images"] += 1
+            elif os.path.exists(out_path):
+                os.remove(out_path)  # every crop is now rejected: drop the labels an earlier run wrote
+            stats["images"] += 1
+
+    while True:
+        item = scored_queue.get()
+        if item is _DONE:
+            break
+        if item[0] == "image":
+            # Markers can overtake their crops' batch, so completion is checked by count
+            _, filename, n_crops = item
+            pending.setdefault(filename, {"expected": None, "seen": 0, "lines": []})["expected"] = n_crops
+            finish_ready()
+            continue
+
+        _, batch, features = item
+        writes = []
+        classes, scores, margins = prototypes.classify(features)
+        accepted = passes_threshold(classes, scores, class_thresholds, similarity_threshold)
+        for (_, filename, i, crop, bbox, image_size), class_id, score, margin, keep in zip(
+                batch, classes, scores, margins, accepted):
+            state = pending.setdefault(filename, {"expected": None, "seen": 0, "lines": []})
+            state["seen"] += 1
+            stats["crops"] += 1
+            x, y, w, h = bbox
+            img_w, img_h = image_size
+            cx = (x + w / 2) / img_w
+            cy = (y + h / 2) / img_h
+            # Rejected crops are recorded too, so evaluate.py can sweep thresholds without rerunning
+            scores_file.write(json.dumps({
+                "image": filename,
+                "crop": f"{os.path.splitext(filename)[0]}_yolo_{i}",
+                "class": int(class_id),
+                "score": round(float(score), 4),
+                "margin": round(float(margin), 4),
+                "box": [round(cx, 6), round(cy, 6), round(w / img_w, 6), round(h / img_h, 6)],
+                "accepted": bool(keep),
+            }) + "\n")
+            if not keep:
+                continue
+            state["lines"].append(f"{int(class_id)} {cx:.6f} {cy:.6f} {w / img_w:.6f} {h / img_h:.6f}\n")
+            stats["labels"] += 1
+
+            if save_review_crops:
+                crop_name = f"{os.path.splitext(filename)[0]}_yolo_{i}.jpg"
+                writes.append((write_pool.submit(crop.save, os.path.join(review_crop_dir, crop_name)), {
+                    "crop_filename": crop_name,
+                    "source_image": filename,
+                    "bbox": bbox,
+                    "image_size": image_size,
+                }))
+        # Finish the previous batch's writes while this one's are running
+        finish_writes(previous_writes)
+        previous_writes = writes
+        finish_ready()
+
+    finish_writes(previous_writes)
+    scores_file.close()
+    if metadata_file:
+        metadata_file.close()
+
+
+def run_pipeline(filenames):
+    os.makedirs(output_label_dir, exist_ok=True)
+    if save_review_crops:
+        os.makedirs(review_crop_dir, exist_ok=True)
+    device = backend_device(backend)
+
+    reference_index = load_or_build_index(reference_index_dir, reference_dir)
+    classes = load_reference_classes(reference_index.ids, reference_classes_path, reference_label_dir,
+                                     known=verified_classes(reference_index_dir))
+    prototypes = load_or_build_prototypes(reference_index, classes, reference_index_dir, sub_prototypes)
+
+    detector = Detector()  # the model server's YOLO when yolo_candidate_crops.server_url is set
+    clip_model = load_model(device)
+
+    crop_queue = queue.Queue(maxsize=queue_size)
+    scored_queue = queue.Queue(maxsize=queue_size)
+    stats = {"images": 0, "crops": 0, "labels": 0, "labeled_images": 0}
+    errors = []
+
+    def guarded(target, *args, upstream=None, downstream=None):
+        def run():
+            try:
+                target(*args)
+            except Exception as e:
+                errors.append(e)
+                print(f"[Pipeline Error] {target.__name__}: {e}")
+                # keep draining so the stage feeding this one cannot block on a full queue
+                while upstream is not None and upstream.get() is not _DONE:
+                    pass
+            finally:
+                if downstream is not None:
+                    downstream.put(_DONE)
+        return threading.Thread(target=run, daemon=True)
+
+    start = time.time()
+    with ThreadPoolExecutor(decode_threads) as decode_pool, ThreadPoolExecutor(decode_threads) as preprocess_pool, \
+            ThreadPoolExecutor(writer_threads) as write_pool:
+        threads = [
+            guarded(detect_stage, detector, filenames, crop_queue, decode_pool, downstream=crop_queue),
+            guarded(embed_stage, clip_model, device, crop_queue, scored_queue, preprocess_pool,
+                    upstream=crop_queue, downstream=scored_queue),
+            guarded(write_stage, prototypes, scored_queue, write_pool, stats, upstream=scored_queue),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        if os.path.exists(scores_path + ".part"):
+            os.remove(scores_path + ".part")  # keep the previous run's scores
+        raise errors[0]
+    os.replace(scores_path + ".part", scores_path)
+    elapsed = time.time() - start
+    print(f"{stats['images']} images, {stats['crops']} crops, {stats['labels']} labels "
+          f"in {elapsed:.1f}s ({stats['images'] / max(elapsed, 1e-9):.1f} images/s)")
+    return stats
+
+
+if __name__ == "__main__":
+    filenames = sorted(f for f in os.listdir(input_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    run_pipeline(filenames)
+    print(f"Pseudo-labeling complete. YOLO .txt files saved to: {output_label_dir}")
@@ -0,0 +1,56 @@
+import io
+import os
+import json
+import urllib.error
+import urllib.request
+import numpy as np
+
+# Only the standard library and numpy: importing this costs milliseconds, the models stay in model_server.py
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+
+class ModelClient:
+    """Client for a running model_server.py. Image paths are sent, not pixels: server and client share a disk."""
+
+    def __init__(self, url=DEFAULT_URL, timeout=120):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._health = None
+
+    def _request(self, path, payload=None, timeout=None):
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+            return response.read()
+
+    def health(self):
+        """Server description (model id, preprocess ids, detector) or None if nothing is listening."""
+        try:
+            self._health = json.loads(self._request("/health", timeout=2))
+        except (urllib.error.URLError, OSError, ValueError):
+            self._health = None
+        return self._health
+
+    def available(self):
+        return self.health() is not None
+
+    def preprocess_id(self, name, model_id):
+        """Id of the server's preprocess of this name (see feature_store.preprocess_hash), or None if it serves another model."""
+        health = self._health or self.health()
+        if health is None or health["model_id"] != model_id:
+            return None
+        return health["preprocess"].get(name)
+
+    def embed(self, paths, preprocess="custom"):
+        """(float32 [n, dim] embeddings, bool [n] mask of images the server could read)."""
+        body = self._request("/embed", {"paths": [os.path.abspath(p) for p in paths], "preprocess": preprocess})
+        features = np.load(io.BytesIO(body))
+        ok = ~np.isnan(features).any(axis=1) if features.shape[1] else np.zeros(len(features), dtype=bool)
+        return features, ok
+
+    def detect(self, paths):
+        """Per image: {"boxes": [[x1, y1, x2, y2], ...], "scores": [...], "classes": [...], "image_size": [w, h]} or None."""
+        body = self._request("/detect", {"paths": [os.path.abspath(p) for p in paths]})
+        return json.loads(body)["detections"]
@@ -0,0 +1,214 @@
+import io
+import sys
+import json
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from PIL import Image
+
+from model_client import DEFAULT_HOST, DEFAULT_PORT
+from yolo_candidate_crops import detector_weights, detect_conf, detect_iou  # served detections match local ones
+
+# --- Settings ---
+host = DEFAULT_HOST  # localhost only: requests name files on this machine
+port = DEFAULT_PORT
+load_detector = True
+embed_max_batch = 64  # crops per CLIP forward pass
+detect_max_batch = 16  # images per YOLO forward pass
+max_wait = 0.01  # seconds a request waits for others to share its batch
+
+
+class DynamicBatcher:
+    """Collects items from concurrent requests into batches for one model thread.
+
+    A batch runs when it is full or max_wait after its first item arrived,
+    so a lone request pays at most max_wait of extra latency.
+    """
+
+    def __init__(self, run_batch, max_batch_size, max_wait=max_wait):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.items = queue.Queue()
+        self.stats = {"batches": 0, "items": 0}
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def __call__(self, items):
+        futures = []
+        for item in items:
+            future = Future()
+            self.items.put((item, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _loop(self):
+        while True:
+            batch = [self.items.get()]
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.items.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            try:
+                outputs = self.run_batch([item for item, _ in batch])
+                for (_, future), output in zip(batch, outputs):
+                    future.set_result(output)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+
+
+class ModelHost:
+    """Loads CLIP (and optionally YOLO) once and serves them through dynamic batchers."""
+
+    def __init__(self, load_detector=load_detector):
+        import torch
+        import open_clip
+        from feature_store import preprocess_hash
+        from clip_backends import backend_device, model_id, wrap_model
+        from extract_clip_features import PREPROCESS, model_name, pretrained, backend, torch_threads
+
+        self.torch = torch
+        self.device = backend_device(backend)
+        if torch_threads:
+            torch.set_num_threads(torch_threads)
+        start = time.time()
+        model, _, _ = open_clip.create_model_and_transforms(model_name, pretrained=pretrained)
+        self.clip = wrap_model(model, backend, self.device, model_name=model_name, pretrained=pretrained,
+                               threads=torch_threads)
+        self.model_id = model_id(model_name, backend)
+        # custom: pad-to-square used for crops; openclip: the model's own transform used by pseudo_labeling.py
+        self.preprocess = {name: build() for name, build in PREPROCESS.items()}
+        self.preprocess_ids = {name: preprocess_hash(p) for name, p in self.preprocess.items()}
+        self.embedder = DynamicBatcher(self._embed_batch, embed_max_batch)
+
+        self.detector = None
+        if load_detector:
+            from ultralytics import YOLO
+            self.detector = YOLO(detector_weights)
+            self.detect_batcher = DynamicBatcher(self._detect_batch, detect_max_batch)
+        print(f"Models loaded on {self.device} in {time.time() - start:.1f}s")
+
+    def _embed_batch(self, tensors):
+        with self.torch.inference_mode():
+            features = self.clip.encode_image(self.torch.stack(tensors).to(self.device))
+        return list(features.float().cpu().numpy())
+
+    def _detect_batch(self, images):
+        results = self.detector(images, conf=detect_conf, iou=detect_iou, verbose=False)
+        return [{
+            "boxes": result.boxes.xyxy.cpu().numpy().round(1).tolist(),
+            "scores": result.boxes.conf.cpu().numpy().round(4).tolist(),
+            "classes": result.boxes.cls.cpu().numpy().astype(int).tolist(),
+            "image_size": list(image.size),
+        } for image, result in zip(images, results)]
+
+    def embed(self, paths, preprocess_name):
+        preprocess = self.preprocess[preprocess_name]
+        # Decoding and preprocessing happen on the request thread; only the forward pass is batched
+        tensors, rows = [], []
+        for row, path in enumerate(paths):
+            try:
+                tensors.append(preprocess(Image.open(path).convert("RGB")))
+                rows.append(row)
+            except OSError as e:
+                print(f"Failed to load {path}: {e}")
+        features = self.embedder(tensors)
+        dim = features[0].shape[0] if features else 0
+        out = np.full((len(paths), dim), np.nan, dtype=np.float32)  # NaN rows mark unreadable images
+        for row, feature in zip(rows, features):
+            out[row] = feature
+        return out
+
+    def detect(self, paths):
+        images, rows = [], []
+        for row, path in enumerate(paths):
+            try:
+                images.append(Image.open(path).convert("RGB"))
+                rows.append(row)
+            except OSError as e:
+                print(f"Failed to load {path}: {e}")
+        detections = [None] * len(paths)
+        for row, detection in zip(rows, self.detect_batcher(images)):
+            detections[row] = detection
+        return detections
+
+    def health(self):
+        return {
+            "model_id": self.model_id,
+            "preprocess": self.preprocess_ids,
+            "device": self.device,
+            "detector": self.detector is not None,
+            "embed_stats": self.embedder.stats,
+        }
+
+
+def make_handler(models):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, body, content_type="application/json", status=200):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, payload, status=200):
+            self._send(json.dumps(payload).encode("utf-8"), status=status)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(models.health())
+            else:
+                self._send_json({"error": f"unknown path {self.path}"}, 404)
+
+        def do_POST(self):
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if self.path == "/embed":
+                    buffer = io.BytesIO()
+                    np.save(buffer, models.embed(request["paths"], request.get("preprocess", "custom")))
+                    self._send(buffer.getvalue(), "application/octet-stream")
+                elif self.path == "/detect":
+                    if models.detector is None:
+                        self._send_json({"error": "server was started with --no-detector"}, 404)
+                    else:
+                        self._send_json({"detections": models.detect(request["paths"])})
+                else:
+                    self._send_json({"error": f"unknown path {self.path}"}, 404)
+            except (KeyError, ValueError) as e:
+                self._send_json({"error": str(e)}, 400)
+            except Exception as e:
+                # Answer instead of dropping the connection, so the client can fall back
+                print(f"[Server Error] {self.path}: {e!r}")
+                self._send_json({"error": f"{type(e).__name__}: {e}"}, 500)
+
+        def log_message(self, format, *args):
+            pass  # one line per request would drown the batch statistics
+
+    return Handler
+
+
+def serve(host=host, port=port, load_detector=load_detector):
+    models = ModelHost(load_detector)
+    server = ThreadingHTTPServer((host, port), make_handler(models))
+    server.daemon_threads = True
+    print(f"Serving on http://{host}:{port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Embedded {models.embedder.stats['items']} images in {models.embedder.stats['batches']} batches")
+
+
+if __name__ == "__main__":
+    # python model_server.py [port] [--no-detector]
+    args = sys.argv[1:]
+    serve(port=int(args[0]) if args and args[0].isdigit() else port, load_detector="--no-detector" not in args)
@@ -1,60 +1,77 @@
 import os
-import torch
-import open_clip
-from PIL import Image
+import json
+import numpy as np
 from tqdm import tqdm
 from shutil import copyfile
-import torch.nn.functional as F
+
+from feature_store import FeatureStore
+from embedding_cache import EmbeddingCache
+from vector_index import normalize
+from extract_clip_features import list_images, iter_cached_feature_batches, load_model, batch_size, num_workers
 
 # Set paths
-labeled_features_dir = "clip_features"
+labeled_features_dir = "clip_features" # feature store directory (see feature_store.py)
 labeled_labels_dir = "standard20/labels"
 unlabeled_images_dir = "standard20/unlabeled_images"
 pseudo_labels_output_dir = "pseudo_labels"
-os.makedirs(pseudo_labels_output_dir, exist_ok=True)
-
-# Load CLIP
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model, _, preprocess = open_clip.create_model_and_transforms('ViT-B-32', pretrained='openai')
-model = model.to(device)
-model.eval()
-
-# Load all labeled features into memory
-labeled_features = {}
-for filename in os.listdir(labeled_features_dir):
-	if filename.endswith(".pt"):
-		stem = os.path.splitext(filename)[0]
-		path = os.path.join(labeled_features_dir, filename)
-		feature = torch.load(path)
-		labeled_features[stem] = F.normalize(feature, dim=0)
-
-# Helper to get image CLIP embedding
-def extract_clip_feature(image_path):
-	image = preprocess(Image.open(image_path).convert("RGB")).unsqueeze(0).to(device)
-	with torch.no_grad():
-		feature = model.encode_image(image).squeeze(0).cpu()
-		feature = F.normalize(feature,dim=0)
-	return feature
-
-# Loop through all unlabeled images
-for image_filename in tqdm(os.listdir(unlabeled_images_dir)):
-	if image_filename.lower().endswith((".jpg", ".jpeg", ".png")):
-		image_path = os.path.join(unlabeled_images_dir, image_filename)
-		unlabeled_feature = extract_clip_feature(image_path)
-
-		# Find most similar label image
-		best_match = None
-		best_score = -1
-		for labeled_name, labeled_feature in labeled_features.items():
-			score = torch.dot(unlabeled_feature, labeled_feature).item()
-			if score > best_score:
-				best_score = score
-				best_match = labeled_name
-
-		# Copy the best-matching label file as pseudo-label
-		scr_label_path = os.path.join(labeled_labels_dir, best_match + ".txt")
-		dst_label_path = os.path.join(pseudo_labels_output_dir, os.path.splitext(image_filename)[0] + ".txt")
-		if os.path.exists(scr_label_path):
-			copyfile(scr_label_path, dst_label_path)
-
-print(f"Pseudo-labels saved to {pseudo_labels_output_dir}/")
\ No newline at end of file
+scores_name = "match_scores.json" # written into the output directory
+
+top_k = 2 # best match + runner-up, so the margin between them can be reported
+
+def load_labeled_matrix(store_dir):
+	"""Stack all labeled features into one L2-normalized [M, dim] matrix, once."""
+	store = FeatureStore(store_dir)
+	if not len(store):
+		raise ValueError(f"No labeled features in {store_dir}; run extract_clip_features.py on the labeled images first")
+	return normalize(store.get(store.ids)), list(store.ids)
+
+def match_features(unlabeled_features, labeled_matrix, labeled_ids, k=top_k):
+	"""Score a batch of embeddings against every labeled embedding with one matmul.
+
+	Returns one dict per row: best match, runner-up and the margin between them.
+	"""
+	if not labeled_matrix.shape[0]:
+		raise ValueError("No labeled features to match against")
+	scores = normalize(unlabeled_features) @ labeled_matrix.T # [B, M]
+	k = min(k, labeled_matrix.shape[0])
+	top_idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+	top_scores = np.take_along_axis(scores, top_idx, axis=1)
+	order = np.argsort(-top_scores, axis=1)
+	top_idx, top_scores = np.take_along_axis(top_idx, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+	matches = []
+	for row_scores, row_idx in zip(top_scores.tolist(), top_idx.tolist()):
+		match = {"best_match": labeled_ids[row_idx[0]], "best_score": row_scores[0]}
+		if len(row_idx) > 1:
+			match["runner_up"] = labeled_ids[row_idx[1]]
+			match["runner_up_score"] = row_scores[1]
+			match["margin"] = row_scores[0] - row_scores[1]
+		matches.append(match)
+	return matches
+
+def pseudo_label_directory(image_dir, output_dir):
+	os.makedirs(output_dir, exist_ok=True)
+	labeled_matrix, labeled_ids = load_labeled_matrix(labeled_features_dir)
+
+	# CLIP weights (and torch) are only loaded if some image is neither cached nor embedded by the model server
+	filenames = list_images(image_dir)
+	all_matches = {}
+	with tqdm(total=len(filenames)) as progress, EmbeddingCache() as cache:
+		for names, features in iter_cached_feature_batches(load_model, image_dir, filenames, cache,
+														   preprocess="openclip", batch_size=batch_size, num_workers=num_workers):
+			for image_filename, match in zip(names, match_features(features, labeled_matrix, labeled_ids)):
+				all_matches[image_filename] = match
+
+				# Copy the best-matching label file as pseudo-label
+				scr_label_path = os.path.join(labeled_labels_dir, match["best_match"] + ".txt")
+				dst_label_path = os.path.join(output_dir, os.path.splitext(image_filename)[0] + ".txt")
+				if os.path.exists(scr_label_path):
+					copyfile(scr_label_path, dst_label_path)
+			progress.update(len(names))
+
+	with open(os.path.join(output_dir, scores_name), "w") as f:
+		json.dump(all_matches, f, indent=2)
+	return all_matches
+
+if __name__ == "__main__":
+	pseudo_label_directory(unlabeled_images_dir, pseudo_labels_output_dir)
+	print(f"Pseudo-labels saved to {pseudo_labels_output_dir}/")
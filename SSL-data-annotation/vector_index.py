@@ -0,0 +1,336 @@
+import os
+import sys
+import json
+import numpy as np
+
+INDEX_FILE = "index.json"
+VECTORS_FILE = "vectors.npy"
+CENTROIDS_FILE = "centroids.npy"
+ASSIGNMENTS_FILE = "assignments.npy"
+VERIFIED_FILE = "verified.json"  # {crop id: {"store", "class"}} added by add_verified_crops, re-added on rebuild
+
+QUERY_CHUNK = 4096      # queries scored per matmul
+REFERENCE_CHUNK = 65536 # reference rows scored per matmul
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _merge_topk(best_scores, best_idx, scores, idx, k):
+    """Merge new (scores, idx) candidates into the running per-row top-k."""
+    all_scores = np.concatenate([best_scores, scores], axis=1)
+    all_idx = np.concatenate([best_idx, idx], axis=1)
+    if all_scores.shape[1] > k:
+        part = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+        all_scores = np.take_along_axis(all_scores, part, axis=1)
+        all_idx = np.take_along_axis(all_idx, part, axis=1)
+    return all_scores, all_idx
+
+
+def _sorted_topk(scores, idx):
+    order = np.argsort(-scores, axis=1)
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+
+# --- Exact Backend ---
+class ExactIndex:
+    """Brute-force cosine search over pre-normalized vectors with chunked matmuls."""
+
+    kind = "exact"
+
+    def __init__(self, dim=None):
+        self.dim = dim
+        self.ids = []
+        self.vectors = np.empty((0, dim or 0), dtype=np.float32)
+        self.source = None  # FeatureStore.fingerprint() of the store the index was built from
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, ids, vectors):
+        vectors = normalize(vectors)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.vectors = self.vectors.reshape(0, self.dim)
+        self.ids.extend(ids)
+        self.vectors = np.vstack([self.vectors, vectors])
+
+    def _candidate_rows(self, queries):
+        # Every query is scored against every reference chunk
+        for start in range(0, len(self.vectors), REFERENCE_CHUNK):
+            yield np.arange(len(queries)), np.arange(start, min(start + REFERENCE_CHUNK, len(self.vectors)))
+
+    def search(self, queries, k=1):
+        """Top-k (scores, row indices) per query, best first. Rows index into self.ids."""
+        queries = normalize(queries)
+        k = min(k, len(self.ids))
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_idx = np.zeros((len(queries), 0), dtype=np.int64)
+        for query_rows, ref_rows in self._candidate_rows(queries):
+            if len(query_rows) == 0 or len(ref_rows) == 0:
+                continue
+            for q_start in range(0, len(query_rows), QUERY_CHUNK):
+                q_rows = query_rows[q_start:q_start + QUERY_CHUNK]
+                scores = queries[q_rows] @ self.vectors[ref_rows].T
+                kk = min(k, scores.shape[1])
+                part = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+                chunk_scores = np.take_along_axis(scores, part, axis=1)
+                chunk_idx = ref_rows[part]
+                if best_scores.shape[1] == 0:
+                    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+                    best_idx = np.full((len(queries), k), -1, dtype=np.int64)
+                merged_scores, merged_idx = _merge_topk(best_scores[q_rows], best_idx[q_rows], chunk_scores, chunk_idx, k)
+                best_scores[q_rows], best_idx[q_rows] = merged_scores, merged_idx
+        if best_scores.shape[1] == 0:
+            return best_scores, best_idx
+        return _sorted_topk(best_scores, best_idx)
+
+    def _meta(self):
+        return {"kind": self.kind, "dim": self.dim, "source": self.source, "ids": self.ids}
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, VECTORS_FILE), self.vectors)
+        tmp_path = os.path.join(index_dir, INDEX_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._meta(), f)
+        os.replace(tmp_path, os.path.join(index_dir, INDEX_FILE))
+
+    def _load(self, index_dir, meta):
+        self.dim = meta["dim"]
+        self.ids = meta["ids"]
+        self.source = meta.get("source")
+        self.vectors = np.load(os.path.join(index_dir, VECTORS_FILE))
+
+
+# --- Approximate Backend ---
+def spherical_kmeans(vectors, n_clusters, iterations=10, sample_size=None, seed=0):
+    """Cluster unit vectors by cosine similarity. Returns normalized [n_clusters, dim] centroids."""
+    rng = np.random.default_rng(seed)
+    sample_size = sample_size or 256 * n_clusters
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        # Sorted segment sums are much faster than np.add.at for wide vectors
+        order = np.argsort(assignment, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        occupied = counts > 0
+        sums[occupied] = np.add.reduceat(vectors[order], starts[occupied], axis=0)
+        empty = counts == 0
+        # Reseed empty clusters from random points so every list stays in use
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex(ExactIndex):
+    """Inverted-file index: vectors are bucketed by nearest centroid and each query
+    only scores the buckets of its n_probe closest centroids.
+
+    New vectors are assigned to existing centroids, so the index can grow
+    incrementally; call train() again if the data drifts far from the centroids.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, dim=None, n_lists=256, n_probe=8):
+        super().__init__(dim)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+
+    def train(self, vectors=None):
+        vectors = self.vectors if vectors is None else normalize(vectors)
+        n_lists = max(1, min(self.n_lists, len(vectors) // 39 or 1))
+        self.centroids = spherical_kmeans(vectors, n_lists)
+        self.assignments = self._assign(self.vectors)
+
+    def _assign(self, vectors):
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), REFERENCE_CHUNK):
+            assignments[start:start + REFERENCE_CHUNK] = np.argmax(
+                vectors[start:start + REFERENCE_CHUNK] @ self.centroids.T, axis=1)
+        return assignments
+
+    def add(self, ids, vectors):
+        start = len(self.vectors)
+        super().add(ids, vectors)
+        if self.centroids is None:
+            self.train()
+        else:
+            self.assignments = np.concatenate([self.assignments, self._assign(self.vectors[start:])])
+
+    def _candidate_rows(self, queries):
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+        order = np.argsort(self.assignments, kind="stable")
+        bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+        # Walk list by list so each bucket is scored with one matmul for all queries probing it
+        for list_id in range(len(self.centroids)):
+            query_rows = np.nonzero((probes == list_id).any(axis=1))[0]
+            yield query_rows, order[bounds[list_id]:bounds[list_id + 1]]
+
+    def _meta(self):
+        meta = super()._meta()
+        meta.update({"n_lists": self.n_lists, "n_probe": self.n_probe})
+        return meta
+
+    def save(self, index_dir):
+        super().save(index_dir)
+        np.save(os.path.join(index_dir, CENTROIDS_FILE), self.centroids)
+        np.save(os.path.join(index_dir, ASSIGNMENTS_FILE), self.assignments)
+
+    def _load(self, index_dir, meta):
+        super()._load(index_dir, meta)
+        self.n_lists = meta["n_lists"]
+        self.n_probe = meta["n_probe"]
+        self.centroids = np.load(os.path.join(index_dir, CENTROIDS_FILE))
+        self.assignments = np.load(os.path.join(index_dir, ASSIGNMENTS_FILE))
+
+
+BACKENDS = {ExactIndex.kind: ExactIndex, IVFIndex.kind: IVFIndex}
+
+
+def build_index(ids, vectors, kind="exact", **params):
+    index = BACKENDS[kind](**params)
+    index.add(list(ids), vectors)
+    return index
+
+
+def load_index(index_dir):
+    with open(os.path.join(index_dir, INDEX_FILE), "r") as f:
+        meta = json.load(f)
+    index = BACKENDS[meta["kind"]]()
+    index._load(index_dir, meta)
+    return index
+
+
+def load_verified(index_dir):
+    path = os.path.join(index_dir, VERIFIED_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_verified(index_dir, verified):
+    tmp_path = os.path.join(index_dir, VERIFIED_FILE + ".part")
+    with open(tmp_path, "w") as f:
+        json.dump(verified, f)
+    os.replace(tmp_path, os.path.join(index_dir, VERIFIED_FILE))
+
+
+def verified_classes(index_dir):
+    """{crop id: class id} of the verified crops added to the index, for load_reference_classes."""
+    return {crop_id: entry["class"] for crop_id, entry in load_verified(index_dir).items()}
+
+
+def _add_verified(index, verified):
+    """Add the recorded verified crops that are still in their feature stores. Returns how many were added."""
+    from feature_store import FeatureStore
+
+    known = set(index.ids)
+    by_store = {}
+    for crop_id, entry in verified.items():
+        if crop_id not in known:
+            by_store.setdefault(entry["store"], []).append(crop_id)
+    added = 0
+    for store_dir, crop_ids in by_store.items():
+        store = FeatureStore(store_dir)
+        crop_ids = [crop_id for crop_id in crop_ids if crop_id in store]
+        if crop_ids:
+            index.add(crop_ids, store.get(crop_ids))
+            added += len(crop_ids)
+    return added
+
+
+def load_or_build_index(index_dir, feature_store_dir, kind="exact"):
+    """Load the saved index, or build it from a feature store and save it.
+
+    A saved index is rebuilt when the store has changed since (ids, count, dim,
+    model or preprocessing), e.g. after features were extracted again. Crops
+    added with add_verified_crops are added back after a rebuild.
+    """
+    from feature_store import FeatureStore
+
+    store = FeatureStore(feature_store_dir)
+    fingerprint = store.fingerprint()
+    if os.path.exists(os.path.join(index_dir, INDEX_FILE)):
+        index = load_index(index_dir)
+        if index.source == fingerprint:
+            return index
+        print(f"Index in {index_dir} does not match {feature_store_dir}; rebuilding it")
+    index = build_index(store.ids, store.get(store.ids), kind=kind)
+    index.source = fingerprint
+    _add_verified(index, load_verified(index_dir))
+    index.save(index_dir)
+    return index
+
+
+def crop_classes(crop_ids, label_dir=None, scores_path=None):
+    """{crop id: class id} from <label_dir>/<crop id>.txt (first box), else the crop's latest row in a scores file."""
+    from class_prototypes import load_reference_classes
+
+    scored = {}
+    if scores_path and os.path.exists(scores_path):
+        with open(scores_path, "r") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    scored[row["crop"]] = row["class"]
+    classes = load_reference_classes(crop_ids, scored, label_dir, default_class=-1)
+    return {crop_id: int(c) for crop_id, c in zip(crop_ids, classes) if c >= 0}
+
+
+def add_verified_crops(index_dir, feature_store_dir, verified_image_dir, label_dir=None, scores_path=None):
+    """Add crops accepted in datavalidation.py to a saved index. Returns how many were added.
+
+    Each crop's class comes from crop_classes; crops with no known class are
+    skipped. The crops and classes are recorded in VERIFIED_FILE, so a rebuild
+    keeps them and load_reference_classes can label them (see verified_classes).
+    """
+    from feature_store import FeatureStore
+
+    index = load_index(index_dir)
+    store = FeatureStore(feature_store_dir)
+    verified = load_verified(index_dir)
+    known = set(index.ids) | set(verified)
+    new_ids = [os.path.splitext(f)[0] for f in sorted(os.listdir(verified_image_dir))]
+    new_ids = [crop_id for crop_id in new_ids if crop_id in store and crop_id not in known]
+    classes = crop_classes(new_ids, label_dir, scores_path)
+    if len(classes) < len(new_ids):
+        print(f"Skipping {len(new_ids) - len(classes)} verified crops with no label or score to take a class from")
+    new_ids = [crop_id for crop_id in new_ids if crop_id in classes]
+    if new_ids:
+        store_dir = os.path.abspath(feature_store_dir)
+        verified.update({crop_id: {"store": store_dir, "class": classes[crop_id]} for crop_id in new_ids})
+        save_verified(index_dir, verified)
+        _add_verified(index, verified)
+        index.save(index_dir)
+        # class prototypes cached next to the index are now stale; cosine_similarity.py rebuilds them
+        from class_prototypes import PROTOTYPES_FILE
+        stale = os.path.join(index_dir, PROTOTYPES_FILE)
+        if os.path.exists(stale):
+            os.remove(stale)
+    return len(new_ids)
+
+
+if __name__ == "__main__":
+    # Usage: python vector_index.py update <index_dir> <feature_store_dir> <verified_image_dir> [label_dir] [scores_path]
+    if 5 <= len(sys.argv) <= 7 and sys.argv[1] == "update":
+        added = add_verified_crops(*sys.argv[2:])
+        print(f"Added {added} verified crops to {sys.argv[2]}")
+    else:
+        print("Usage: python vector_index.py update <index_dir> <feature_store_dir> <verified_image_dir> "
+              "[label_dir] [scores_path]")
@@ -1,47 +1,154 @@
 import os
 import json
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
 from PIL import Image
-from ultralytics import YOLO
+
+from model_client import ModelClient
 
 # --- Paths ---
 input_dir = r"C:\Users\Digital Twingine\Desktop\chloe\label_small_data\standard20\unlabeled_images"
 output_dir = r"C:\Users\Digital Twingine\Desktop\chloe\method_verification\yolo_candidate_crops"
-os.makedirs(output_dir, exist_ok=True)
+metadata_path = "crop_metadata.jsonl"  # one JSON object per crop, appended as images finish
+done_path = "crop_metadata.done"  # source images fully processed, for resume
+
+# --- Settings ---
+batch_size = 16  # images per YOLO forward pass
+decode_threads = 4  # PIL decode runs ahead of inference
+writer_threads = 4  # JPEG encoding + writes
+resume = True  # skip source images listed in done_path
+detector_weights = "yolov8n.pt"  # You can also use yolov8s.pt or yolov8m.pt
+detect_conf, detect_iou = 0.3, 0.5
+server_url = None  # e.g. "http://127.0.0.1:8765": detect with a running model_server.py instead of loading YOLO here
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def load_image(image_path):
+    return Image.open(image_path).convert("RGB")
+
+
+def iter_image_batches(filenames, batch_size, decode_pool, image_dir=input_dir):
+    """Yield (filenames, PIL images) batches, decoding the next batch while the current one runs."""
+    batches = [filenames[i:i + batch_size] for i in range(0, len(filenames), batch_size)]
+    if not batches:
+        return
+    pending = decode_pool.map(load_image, [os.path.join(image_dir, f) for f in batches[0]])
+    for i, names in enumerate(batches):
+        images = list(pending)
+        if i + 1 < len(batches):
+            pending = decode_pool.map(load_image, [os.path.join(image_dir, f) for f in batches[i + 1]])
+        yield names, images
+
+
+class Detector:
+    """YOLO boxes per image, from the model server when server_url is set, else from a local model.
+
+    The local model is loaded on first use only, so runs served by the model
+    server never import torch. If the server fails midway, the remaining
+    batches are detected locally.
+    """
+
+    def __init__(self, server_url=server_url, weights=detector_weights):
+        self.weights = weights
+        self.model = None
+        self.client = None
+        if server_url:
+            client = ModelClient(server_url)
+            health = client.health()
+            if health is not None and health.get("detector"):
+                self.client = client
+            else:
+                print(f"Model server at {server_url} is not running or has no detector; loading YOLO locally.")
+
+    def local_model(self):
+        if self.model is None:
+            from ultralytics import YOLO  # imported here so fused_pipeline.py can import this file without torch
+            self.model = YOLO(self.weights)
+        return self.model
+
+    def __call__(self, paths, images):
+        """[n, 4] xyxy boxes per image. The server reads paths; the local model runs on the decoded images."""
+        if self.client is not None:
+            try:
+                return [np.asarray(d["boxes"] if d else [], dtype=np.float32).reshape(-1, 4)
+                        for d in self.client.detect(paths)]
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                print(f"Model server at {self.client.url} failed ({e}); detecting the remaining images locally.")
+                self.client = None
+        results = self.local_model()(images, conf=detect_conf, iou=detect_iou, verbose=False)
+        return [result.boxes.xyxy.cpu().numpy() for result in results]
+
+
+def processed_images():
+    if not os.path.exists(done_path):
+        return set()
+    with open(done_path, "r") as f:
+        return {line.strip() for line in f if line.strip()}
 
-crop_metadata = []
 
-# --- Load pretrained YOLOv8 model (COCO-trained) ---
-model = YOLO("yolov8n.pt")  # You can also use yolov8s.pt or yolov8m.pt
+def finish_batch(futures, records, names, metadata_file, done_file):
+    """Wait for a batch's crop writes, then record its metadata and mark its images done."""
+    wait(futures)
+    for future in futures:
+        future.result()  # surface write errors
+    for record in records:
+        metadata_file.write(json.dumps(record) + "\n")
+    metadata_file.flush()
+    for name in names:
+        done_file.write(name + "\n")
+    done_file.flush()
 
-# --- Loop through all images ---
-for filename in os.listdir(input_dir):
-    if not filename.lower().endswith((".jpg", ".jpeg", ".png")):
-        continue
 
-    image_path = os.path.join(input_dir, filename)
-    image = Image.open(image_path).convert("RGB")
-    w, h = image.size
+def crop_candidates(detector, filenames):
+    os.makedirs(output_dir, exist_ok=True)
+    total_crops = 0
+    with ThreadPoolExecutor(decode_threads) as decode_pool, ThreadPoolExecutor(writer_threads) as write_pool, \
+            open(metadata_path, "a") as metadata_file, open(done_path, "a") as done_file:
+        previous = None
+        for names, images in iter_image_batches(filenames, batch_size, decode_pool):
+            # The decoded images are shared between YOLO and cropping
+            boxes = detector([os.path.join(input_dir, f) for f in names], images)
 
-    results = model(image_path, conf=0.3, iou=0.5)
+            futures, records = [], []
+            for filename, image, image_boxes in zip(names, images, boxes):
+                w, h = image.size
+                for i, box in enumerate(image_boxes):
+                    x1, y1, x2, y2 = map(int, box)
+                    bw, bh = x2 - x1, y2 - y1
+                    crop = image.crop((x1, y1, x2, y2))
+                    crop_name = f"{os.path.splitext(filename)[0]}_yolo_{i}.jpg"
+                    futures.append(write_pool.submit(crop.save, os.path.join(output_dir, crop_name)))
+                    records.append({
+                        "crop_filename": crop_name,
+                        "source_image": filename,
+                        "bbox": [int(x1), int(y1), int(bw), int(bh)],
+                        "image_size": [int(w), int(h)]
+                    })
 
-    for i, box in enumerate(results[0].boxes.xyxy.cpu().numpy()):
-        x1, y1, x2, y2 = map(int, box)
-        bw, bh = x2 - x1, y2 - y1
-        crop = image.crop((x1, y1, x2, y2))
-        crop_name = f"{os.path.splitext(filename)[0]}_yolo_{i}.jpg"
-        crop_path = os.path.join(output_dir, crop_name)
-        crop.save(crop_path)
+            # Finish the previous batch while this one's crops are being written
+            if previous:
+                finish_batch(*previous, metadata_file, done_file)
+            previous = (futures, records, names)
+            total_crops += len(records)
+            print(f"Processed {len(names)} images, {len(records)} crops")
+        if previous:
+            finish_batch(*previous, metadata_file, done_file)
+    return total_crops
 
-        crop_metadata.append({
-            "crop_filename": crop_name,
-            "source_image": filename,
-            "bbox": [int(x1), int(y1), int(bw), int(bh)],
-            "image_size": [int(w), int(h)]
-        })
 
-# --- Save metadata for pseudo-labeling ---
-with open("crop_metadata.json", "w") as f:
-    json.dump(crop_metadata, f, indent=2)
+if __name__ == "__main__":
+    filenames = sorted(f for f in os.listdir(input_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if resume:
+        done = processed_images()
+        filenames = [f for f in filenames if f not in done]
+    else:
+        for path in (metadata_path, done_path):
+            if os.path.exists(path):
+                os.remove(path)
 
-print(f"YOLO crops saved to '{output_dir}'")
-print(f"Metadata saved to 'crop_metadata.json'")
+    # --- Pretrained YOLOv8 model (COCO-trained), on the model server or loaded here ---
+    total = crop_candidates(Detector(), filenames)
+    print(f"YOLO crops saved to '{output_dir}' ({total} new crops)")
+    print(f"Metadata saved to '{metadata_path}'")